@@ -1,72 +1,218 @@
 # ai_jac_client.py
 import os
 import json
-import subprocess
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import classification_cache
+from instrumentation import count_cache
+from jac_worker import POOL_SIZE as JAC_WORKERS, JacWorkerError, jac_call, jac_call_async
+from route_optimizer import optimize_tsp_route
+from text_classifier import get_classifier as get_text_classifier
+from utils import run_db
 
 # -------------------------
 # CLASSIFY IMAGE
 # -------------------------
 def classify_image(image_path, jac_root=None):
     """
-    Classify an image using Jac CLI.
+    Classify an image using the Jac worker pool.
     Returns dict like {"waste_type": "plastic", "confidence": 0.9} or error dict.
     """
     params = {"image_url": image_path}
+    try:
+        return jac_call('WasteNode.classify_image', params, root=jac_root)
+    except JacWorkerError as e:
+        return {"error": str(e)}
 
-    # Build command
-    cmd = ['jac', 'run', 'WasteNode.classify_image', json.dumps(params)]
-    if jac_root:
-        cmd.extend(['--root', jac_root])
 
-    try:
-        out = subprocess.check_output(cmd, text=True, stderr=subprocess.STDOUT)
-        for line in out.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                return json.loads(line)
-            except Exception:
-                continue
-        return {"raw": out}
-    except subprocess.CalledProcessError as e:
-        return {"error": f"jac CLI failed: {getattr(e, 'output', str(e))}"}
+def waste_type_of(result):
+    """The waste type in a classification result (top level or under "result"), or None."""
+    if not isinstance(result, dict):
+        return None
+    if result.get("waste_type"):
+        return result["waste_type"]
+    if isinstance(result.get("result"), dict):
+        return result["result"].get("waste_type")
+    return None
+
+
+# -------------------------
+# BATCH CLASSIFY IMAGES
+# -------------------------
+# threads feeding chunks to the shared Jac worker pool; the work is pipe I/O, so
+# threads are enough, and more of them than Jac workers would only queue
+BATCH_WORKERS = int(os.environ.get("WASTELINK_CLASSIFY_WORKERS", str(JAC_WORKERS)))
+BATCH_CHUNK = 8
+
+_batch_executor = None
+_batch_lock = threading.Lock()
+
+
+def _get_batch_executor():
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="classify")
+    return _batch_executor
+
+
+def _classify_chunk(paths, jac_root=None):
+    out = []
+    for path in paths:
+        try:
+            out.append(classify_image(path, jac_root))
+        except Exception as e:
+            out.append({"error": str(e)})
+    return out
+
+
+def classify_images_batch(paths, jac_root=None, use_cache=True):
+    """
+    Classify many images at once. Results come back in input order, one per
+    path; a failing image yields {"error": ...} without failing the batch.
+    Repeats (same bytes or same perceptual hash) are served from the cache,
+    and the rest run in chunks on a shared thread pool, each thread calling
+    the shared Jac worker pool.
+    """
+    paths = list(paths)
+    results = [None] * len(paths)
+    keys = [None] * len(paths)
+    for i, path in enumerate(paths):
+        try:
+            keys[i] = classification_cache.image_keys(path)
+        except OSError as e:
+            results[i] = {"error": str(e)}
+
+    cached = classification_cache.lookup([k for k in keys if k]) if use_cache else {}
+    todo = {}  # content hash -> (key, [indexes]); identical images run once
+    for i, key in enumerate(keys):
+        if key is None:
+            continue
+        if key in cached:
+            results[i] = cached[key]
+        else:
+            todo.setdefault(key[0], (key, []))[1].append(i)
+    count_cache("classification", hits=sum(1 for k in keys if k in cached), misses=sum(1 for k in keys if k and k not in cached))
+
+    if todo:
+        work = [(key, idxs, paths[idxs[0]]) for key, idxs in todo.values()]
+        chunks = [work[j:j + BATCH_CHUNK] for j in range(0, len(work), BATCH_CHUNK)]
+        if len(chunks) == 1 or BATCH_WORKERS <= 1:
+            outputs = [_classify_chunk([w[2] for w in chunk], jac_root) for chunk in chunks]
+        else:
+            outputs = list(_get_batch_executor().map(
+                _classify_chunk, [[w[2] for w in chunk] for chunk in chunks], [jac_root] * len(chunks)))
+
+        fresh = []
+        for chunk, out in zip(chunks, outputs):
+            for (key, idxs, _), result in zip(chunk, out):
+                for i in idxs:
+                    results[i] = result
+                if waste_type_of(result):
+                    fresh.append((key, result))
+        if use_cache:
+            classification_cache.store(fresh)
+    return results
+
+
+def classify_image_cached(image_path, jac_root=None):
+    return classify_images_batch([image_path], jac_root)[0]
 
 
 # -------------------------
 # CLASSIFY TEXT
 # -------------------------
+# below this the in-process classifier defers to Jac
+TEXT_CONFIDENCE_THRESHOLD = 0.6
+
+
+def _classify_text_jac(text, local, jac_root=None):
+    try:
+        return jac_call('WasteNode.classify_text', {"text": text}, root=jac_root)
+    except JacWorkerError:
+        return local
+
+
 def classify_waste_text(text, jac_root=None):
     """
-    Classify waste from text using Jac CLI, fallback to heuristics if Jac fails.
-    Returns {"result": "plastic"}.
+    Classify waste from text with the in-process keyword classifier, deferring
+    to Jac only for low-confidence inputs. If Jac fails the keyword result stands.
+    Returns {"result": "plastic", "confidence": 0.9, ...}.
     """
-    params = {"text": text}
-    cmd = ['jac', 'run', 'WasteNode.classify_text', json.dumps(params)]
-    if jac_root:
-        cmd.extend(['--root', jac_root])
+    local = get_text_classifier().classify(text)
+    if local["confidence"] >= TEXT_CONFIDENCE_THRESHOLD:
+        return local
+    return _classify_text_jac(text, local, jac_root)
+
+
+def classify_waste_text_batch(texts, jac_root=None):
+    """
+    classify_waste_text for many texts; results in input order. The whole
+    batch is classified in-process first, then the distinct low-confidence
+    texts go to Jac together, fanned out over the shared worker pool.
+    """
+    classifier = get_text_classifier()
+    results = [classifier.classify(t) for t in texts]
+    deferred = {}  # text -> [indexes]; repeats go to Jac once
+    for i, (text, local) in enumerate(zip(texts, results)):
+        if local["confidence"] < TEXT_CONFIDENCE_THRESHOLD:
+            deferred.setdefault(text, []).append(i)
+    if not deferred:
+        return results
+
+    pending = [(text, results[idxs[0]]) for text, idxs in deferred.items()]
+    if len(pending) == 1 or BATCH_WORKERS <= 1:
+        outputs = [_classify_text_jac(text, local, jac_root) for text, local in pending]
+    else:
+        outputs = _get_batch_executor().map(
+            _classify_text_jac, [p[0] for p in pending], [p[1] for p in pending], [jac_root] * len(pending))
+    for idxs, result in zip(deferred.values(), outputs):
+        for i in idxs:
+            results[i] = result
+    return results
+
 
+# -------------------------
+# ASYNC VARIANTS
+# -------------------------
+async def classify_image_async(image_path, jac_root=None):
     try:
-        out = subprocess.check_output(cmd, text=True, stderr=subprocess.STDOUT)
-        for line in out.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                return json.loads(line)
-            except Exception:
-                continue
-        return {"raw": out}
-    except subprocess.CalledProcessError:
-        # Heuristic fallback
-        t = text.lower()
-        if "plastic" in t: return {"result": "plastic"}
-        if "organic" in t or "food" in t or "banana" in t: return {"result": "organic"}
-        if "glass" in t: return {"result": "glass"}
-        if "paper" in t: return {"result": "paper"}
-        if "metal" in t: return {"result": "metal"}
-        return {"result": "mixed"}
+        return await jac_call_async('WasteNode.classify_image', {"image_url": image_path}, root=jac_root)
+    except JacWorkerError as e:
+        return {"error": str(e)}
+
+
+def _cache_probe(image_path):
+    key = classification_cache.image_keys(image_path)
+    return key, classification_cache.lookup([key]).get(key)
+
+
+async def classify_image_cached_async(image_path, jac_root=None):
+    """classify_image_cached without blocking the loop: cache I/O on the DB executor, Jac over asyncio pipes."""
+    try:
+        key, cached = await run_db(_cache_probe, image_path)
+    except OSError as e:
+        return {"error": str(e)}
+    count_cache("classification", hits=cached is not None, misses=cached is None)
+    if cached is not None:
+        return cached
+    result = await classify_image_async(image_path, jac_root)
+    if waste_type_of(result):
+        await run_db(classification_cache.store, [(key, result)])
+    return result
+
+
+async def classify_waste_text_async(text, jac_root=None):
+    local = get_text_classifier().classify(text)
+    if local["confidence"] >= TEXT_CONFIDENCE_THRESHOLD:
+        return local
+    try:
+        return await jac_call_async('WasteNode.classify_text', {"text": text}, root=jac_root)
+    except JacWorkerError:
+        return local
 
 
 # -------------------------
@@ -74,28 +220,18 @@ def classify_waste_text(text, jac_root=None):
 # -------------------------
 def optimize_route(locations, jac_root=None):
     """
-    Optimize a route using Jac CLI.
-    Returns a list of locations sorted by Jac node logic, or fallback to simple sorting.
+    Optimize a route using the Jac worker pool.
+    Returns a list of locations sorted by Jac node logic, or the in-process optimizer's order.
     """
     if not locations:
         return []
 
     params = {"locations": locations}
-    cmd = ['jac', 'run', 'WasteNode.optimize_route', json.dumps(params)]
-    if jac_root:
-        cmd.extend(['--root', jac_root])
-
     try:
-        out = subprocess.check_output(cmd, text=True, stderr=subprocess.STDOUT)
-        for line in out.splitlines():
-            try:
-                return json.loads(line)
-            except Exception:
-                continue
-        return {"raw": out}
-    except subprocess.CalledProcessError:
-        # Fallback: simple lat/lon sorting
+        return jac_call('WasteNode.optimize_route', params, root=jac_root)
+    except JacWorkerError:
+        # Fallback: in-process nearest neighbour + 2-opt/Or-opt
         try:
-            return sorted(locations, key=lambda x: f"{x.get('latitude','')},{x.get('longitude','')}")
+            return optimize_tsp_route(None, locations)["stops"]
         except Exception:
             return locations
@@ -1,35 +1,72 @@
 # api.py
 import os
 import json
-import subprocess
-from utils import connect, init_db
-from maps_client import get_distance_matrix, get_directions
-from ai_model import classify_image, classify_waste_text, optimize_route
+import threading
+import uuid
+from datetime import datetime
+from utils import get_conn, write
+from maps_client import distance_matrix, get_directions
+from ai_model import classify_image_cached, classify_images_batch, classify_waste_text, classify_waste_text_batch, optimize_route, waste_type_of
+from jac_worker import JacWorkerError, jac_call
+from instrumentation import external, instrument_endpoints, prometheus_text
+from metrics import read_counters, read_daily
+from pricing import DEFAULT_PRICE_PER_KG, PRICING, deactivate_price, set_price
+from assignment import assign as assign_pickups
+from route_optimizer import DEFAULT_STOP_WEIGHT_KG, optimize_tsp_route
+from positions import POSITIONS
+from snapshot import SNAPSHOT
+import audit
+import notifications
+import export
+import jobs
+import payouts
 
-# init DB
-init_db()
+# how many straight-line nearest candidates api_get_tasks shortlists per task returned
+TASK_CANDIDATE_FACTOR = 3
+# how many straight-line nearest collectors api_assign_collector sends to Google
+ASSIGN_CANDIDATES = 10
 
-# try jac-client
-try:
-    from jac_client import JacClient
-    JAC_CLIENT_PRESENT = True
-    JC = JacClient()  # optional root_dir can be passed if needed
-except Exception:
-    JacClient = None
-    JAC_CLIENT_PRESENT = False
-    JC = None
+# The schema is created / migrated when the first connection to a database
+# is opened (utils.ensure_initialized), not at import; call it at startup to
+# fail fast.
 
+# jac-client is optional and slow to import, so it is loaded on first use
+_jac_lock = threading.Lock()
+_jac_loaded = False
+JC = None
 
+
+def _jac_client():
+    """The JacClient, or None if jac-client is not installed."""
+    global JC, _jac_loaded
+    if not _jac_loaded:
+        with _jac_lock:
+            if not _jac_loaded:
+                try:
+                    from jac_client import JacClient
+                    JC = JacClient()  # optional root_dir can be passed if needed
+                except Exception:
+                    JC = None
+                _jac_loaded = True
+    return JC
+
+
+def jac_client_present():
+    return _jac_client() is not None
+
+
+@external("jac", lambda node, action, *args, **kwargs: f"{node}.{action}")
 def _run_jac_client(node, action, params=None):
-    if not JAC_CLIENT_PRESENT:
+    jc = _jac_client()
+    if jc is None:
         return {"error": "jac-client not available"}
     try:
         # prefer run_node if available
-        if hasattr(JC, "run_node"):
-            return JC.run_node(node, action, params or {})
+        if hasattr(jc, "run_node"):
+            return jc.run_node(node, action, params or {})
         # else try generic run
-        if hasattr(JC, "run"):
-            return JC.run(f"{node}.{action}", params or {})
+        if hasattr(jc, "run"):
+            return jc.run(f"{node}.{action}", params or {})
         return {"error": "jac-client has no known run method"}
     except Exception as e:
         return {"error": str(e)}
@@ -37,35 +74,29 @@ def _run_jac_client(node, action, params=None):
 
 def run_jac(node_name, action, params=None):
     """
-    Use jac-client if present, otherwise fallback to CLI.
+    Use jac-client if present, otherwise fallback to the Jac worker pool.
     """
-    if JAC_CLIENT_PRESENT:
+    if jac_client_present():
         res = _run_jac_client(node_name, action, params)
         # if jac-client returned something meaningful, return it
         if isinstance(res, dict):
             return res
-        # else try CLI fallback
-    params_json = json.dumps(params) if params else "{}"
-    cmd = f'jac run {node_name}.{action} "{params_json}"'
+        # else try worker fallback
     try:
-        result = subprocess.check_output(cmd, shell=True, text=True, stderr=subprocess.STDOUT)
-        for line in result.splitlines():
-            try:
-                return json.loads(line)
-            except Exception:
-                continue
-        return {"raw": result}
-    except subprocess.CalledProcessError as e:
-        return {"error": str(e), "output": getattr(e, "output", "")}
+        return jac_call(f"{node_name}.{action}", params or {})
+    except JacWorkerError as e:
+        return {"error": str(e)}
 
 
 # -------------------------
 # AUTH
 # -------------------------
+AUTH_SQL = "SELECT id, email, role, full_name FROM users WHERE email=? AND password_hash=?"
+
+
 def api_auth(email, password_hash):
-    conn = connect(); cur = conn.cursor()
-    cur.execute("SELECT id, email, role, full_name FROM users WHERE email=? AND password_hash=?", (email, password_hash))
-    row = cur.fetchone(); conn.close()
+    with get_conn() as conn:
+        row = conn.execute(AUTH_SQL, (email, password_hash)).fetchone()
     return dict(row) if row else {"error": "Invalid credentials"}
 
 
@@ -73,118 +104,230 @@ def api_auth(email, password_hash):
 # CREATE PICKUP REQUEST
 # -------------------------
 def api_create_request(data):
-    conn = connect(); cur = conn.cursor()
-    cur.execute("""
+    request_id = write(_insert_request, data)
+    _request_created(request_id, data)
+    return {"status": "saved", "request_id": request_id}
+
+
+def _request_created(request_id, data):
+    SNAPSHOT.mark_stale()
+    audit.record("request.created", "pickup_request", request_id, data.get("resident_id"),
+                 {"latitude": data["latitude"], "longitude": data["longitude"]})
+
+
+def _insert_request(conn, data):
+    return conn.execute("""
         INSERT INTO pickup_requests (resident_id, latitude, longitude, address, location_notes)
         VALUES (?, ?, ?, ?, ?)
-    """, (data["resident_id"], data["latitude"], data["longitude"], data["address"], data.get("location_notes")))
-    conn.commit()
-    cur.execute("SELECT id FROM pickup_requests ORDER BY rowid DESC LIMIT 1")
-    rid = cur.fetchone()[0]; conn.close()
-    return {"status": "saved", "request_id": rid}
+        RETURNING id
+    """, (data["resident_id"], data["latitude"], data["longitude"], data["address"], data.get("location_notes"))).fetchone()[0]
 
 
 # -------------------------
 # GET TASKS
 # -------------------------
 def api_get_tasks(collector_id=None, max_items=10):
-    conn = connect(); cur = conn.cursor()
-    cur.execute("SELECT id, latitude, longitude, address FROM pickup_requests WHERE status='pending'")
-    rows = cur.fetchall(); conn.close()
-    tasks = [dict(r) for r in rows]
-    if not tasks:
-        return {"tasks": []}
-
-    if collector_id:
-        conn = connect(); cur = conn.cursor()
-        cur.execute("SELECT collector_latitude AS lat, collector_longitude AS lng FROM users WHERE id=?", (collector_id,))
-        col = cur.fetchone(); conn.close()
-        if col and col["lat"] is not None and col["lng"] is not None and os.environ.get("GOOGLE_MAPS_API_KEY"):
-            origin = f"{col['lat']},{col['lng']}"
-            destinations = [f"{t['latitude']},{t['longitude']}" for t in tasks]
-            try:
-                dm = get_distance_matrix([origin], destinations)
-                elements = dm["rows"][0]["elements"]
-                distances = []
-                for i, el in enumerate(elements):
-                    meters = el["distance"]["value"] if el.get("status") == "OK" else 10**9
-                    distances.append((meters, tasks[i]))
-                distances.sort(key=lambda x: x[0])
-                ordered = [t for _, t in distances][:max_items]
-                return {"tasks": ordered}
-            except Exception:
-                pass
-
-    tasks_sorted = sorted(tasks, key=lambda t: (t["latitude"], t["longitude"]))[:max_items]
-    return {"tasks": tasks_sorted}
+    origin, tasks = _task_candidates(collector_id, max_items)
+    if origin is None or not tasks:
+        return {"tasks": tasks}
+    try:
+        dm = distance_matrix([origin], [f"{t['latitude']},{t['longitude']}" for t in tasks])
+        return {"tasks": _order_by_road(tasks, dm, max_items)}
+    except Exception:
+        return {"tasks": tasks[:max_items]}
+
+
+def _task_candidates(collector_id, max_items):
+    """(collector "lat,lng" or None, tasks). Without a position the tasks are final."""
+    pos = POSITIONS.position(collector_id) if collector_id else None
+    if pos is None:
+        # no reference point: serve the oldest pending requests first
+        return None, SNAPSHOT.oldest_pending(max_items)
+    # over-fetch so road distance can reorder the straight-line shortlist
+    tasks = SNAPSHOT.nearest_pending(pos[0], pos[1], max_items * TASK_CANDIDATE_FACTOR)
+    for t in tasks:
+        t.pop("distance_m", None)
+    return f"{pos[0]},{pos[1]}", tasks
+
+
+def _order_by_road(tasks, dm, max_items):
+    elements = dm["rows"][0]["elements"]
+    distances = []
+    for i, el in enumerate(elements):
+        meters = el["distance"]["value"] if el.get("status") == "OK" else 10**9
+        distances.append((meters, i, tasks[i]))
+    distances.sort(key=lambda x: x[:2])
+    return [t for _, _, t in distances][:max_items]
 
 
 # -------------------------
 # ASSIGN COLLECTOR
 # -------------------------
 def api_assign_collector(request_id):
-    conn = connect(); cur = conn.cursor()
-    cur.execute("SELECT latitude, longitude FROM pickup_requests WHERE id=?", (request_id,))
-    req = cur.fetchone()
-    if not req:
-        conn.close(); return {"error": "request not found"}
-
-    cur.execute("SELECT id, collector_latitude AS lat, collector_longitude AS lng FROM users WHERE role='collector' AND is_available=1 AND collector_latitude IS NOT NULL")
-    collectors = cur.fetchall()
-    if not collectors:
-        conn.close(); return {"error": "no collectors available"}
-
-    origin = f"{req['latitude']},{req['longitude']}"
-    destinations = [f"{c['lat']},{c['lng']}" for c in collectors]
+    found = _assign_candidates(request_id)
+    if "error" in found:
+        return found
     try:
-        dm = get_distance_matrix([origin], destinations)
-        elems = dm["rows"][0]["elements"]
-        best_i = None
-        best_dist = 10**12
-        for i, el in enumerate(elems):
-            d = el["distance"]["value"] if el.get("status") == "OK" else 10**12
-            if d < best_dist:
-                best_dist = d; best_i = i
-        chosen = collectors[best_i]
-        chosen_id = chosen["id"]
-        cur.execute("UPDATE pickup_requests SET assigned_collector_id=?, status='assigned', assigned_at=CURRENT_TIMESTAMP WHERE id=?", (chosen_id, request_id))
-        conn.commit(); conn.close()
+        dm = distance_matrix([found["origin"]], found["destinations"], top_k=ASSIGN_CANDIDATES)
+        chosen_id, best_dist = _nearest_by_road(found["collectors"], dm)
+        _save_assignment(request_id, chosen_id, best_dist)
         return {"assigned_collector_id": chosen_id, "distance_m": best_dist}
     except Exception as e:
-        conn.close(); return {"error": str(e)}
+        return {"error": str(e)}
+
+
+REQUEST_LOCATION_SQL = "SELECT latitude, longitude FROM pickup_requests WHERE id=?"
+
+
+def _assign_candidates(request_id):
+    req = SNAPSHOT.location(request_id)
+    if req is None:
+        # completed or cancelled, or newer than the snapshot
+        with get_conn() as conn:
+            req = conn.execute(REQUEST_LOCATION_SQL, (request_id,)).fetchone()
+        if not req:
+            return {"error": "request not found"}
+    ids, coords = POSITIONS.available()
+    if not ids:
+        return {"error": "no collectors available"}
+    return {
+        "origin": f"{req[0]},{req[1]}",
+        "collectors": [{"id": cid} for cid in ids],
+        "destinations": [f"{lat},{lng}" for lat, lng in coords.tolist()],
+    }
+
+
+def _nearest_by_road(collectors, dm):
+    elems = dm["rows"][0]["elements"]
+    best_i = None
+    best_dist = 10**12
+    for i, el in enumerate(elems):
+        d = el["distance"]["value"] if el.get("status") == "OK" else 10**12
+        if d < best_dist:
+            best_dist = d; best_i = i
+    return collectors[best_i]["id"], best_dist
+
+
+def _save_assignment(request_id, collector_id, distance_m=None):
+    write(_assign, request_id, collector_id)
+    _after_assign(request_id, collector_id, distance_m)
+
+
+def _after_assign(request_id, collector_id, distance_m=None):
+    SNAPSHOT.mark_stale()
+    audit.record("request.assigned", "pickup_request", request_id, meta={"collector_id": collector_id, "distance_m": distance_m})
+    _notify_assigned(request_id, collector_id)
+
+
+def _assign(conn, request_id, collector_id):
+    conn.execute("UPDATE pickup_requests SET assigned_collector_id=?, status='assigned', assigned_at=CURRENT_TIMESTAMP WHERE id=?", (collector_id, request_id))
+
+
+def _notify_assigned(request_id, collector_id):
+    notifications.send(collector_id, "New pickup assigned", "A new pickup has been assigned to you", "task_assigned", request_id)
+
+
+# -------------------------
+# BATCH ASSIGNMENT
+# -------------------------
+PENDING_BATCH_SQL = "SELECT id, latitude, longitude FROM pickup_requests WHERE status='pending' ORDER BY requested_at LIMIT ?"
+BATCH_COLLECTORS_SQL = """
+  SELECT id, collector_latitude AS lat, collector_longitude AS lng, capacity_kg, rating FROM users
+  WHERE role='collector' AND is_available=1 AND collector_latitude IS NOT NULL
+"""
+OPEN_JOBS_SQL = "SELECT assigned_collector_id, COUNT(*) FROM pickup_requests WHERE status IN ('assigned','arrived') GROUP BY assigned_collector_id"
+ASSIGN_PENDING_SQL = "UPDATE pickup_requests SET assigned_collector_id=?, status='assigned', assigned_at=CURRENT_TIMESTAMP WHERE id=? AND status='pending'"
+
+
+def api_assign_pending_batch(max_requests=1000):
+    """
+    Assign all pending requests (oldest first, up to max_requests) in one go:
+    one read of requests and collectors, one cost matrix, one min-cost
+    assignment, one write. The matching runs without the write lock; a
+    request taken by someone else meanwhile is left alone and reported as
+    unassigned.
+    """
+    with get_conn() as conn:
+        reqs = conn.execute(PENDING_BATCH_SQL, (max_requests,)).fetchall()
+        if not reqs:
+            return {"assigned": [], "unassigned": []}
+        collectors = [dict(r) for r in conn.execute(BATCH_COLLECTORS_SQL)]
+        if not collectors:
+            return {"error": "no collectors available"}
+        open_jobs = dict(conn.execute(OPEN_JOBS_SQL).fetchall())
+    for c in collectors:
+        c["current_load_kg"] = open_jobs.get(c["id"], 0) * DEFAULT_STOP_WEIGHT_KG
+
+    matches = assign_pickups([(r["latitude"], r["longitude"]) for r in reqs], collectors)
+    applied = write(_assign_pending, [(collectors[ci]["id"], reqs[i]["id"]) for i, ci, _ in matches])
+    matches = [m for m, ok in zip(matches, applied) if ok]
+    SNAPSHOT.mark_stale()
+    assigned = [
+        {"request_id": reqs[i]["id"], "assigned_collector_id": collectors[ci]["id"], "distance_m": int(round(km * 1000))}
+        for i, ci, km in matches
+    ]
+    audit.record_many(("request.assigned", "pickup_request", a["request_id"], None,
+                       {"collector_id": a["assigned_collector_id"], "distance_m": a["distance_m"], "batch": True})
+                      for a in assigned)
+    for a in assigned:
+        _notify_assigned(a["request_id"], a["assigned_collector_id"])
+    matched = {i for i, _, _ in matches}
+    return {"assigned": assigned, "unassigned": [r["id"] for i, r in enumerate(reqs) if i not in matched]}
+
+
+def _assign_pending(conn, pairs):
+    """pairs: (collector_id, request_id). Returns, per pair, whether the request was still pending."""
+    return [conn.execute(ASSIGN_PENDING_SQL, pair).rowcount > 0 for pair in pairs]
 
 
 # -------------------------
 # LOG WEIGHT / CREATE COLLECTION
 # -------------------------
+COMPLETE_REQUEST_SQL = "UPDATE pickup_requests SET status='completed', completed_at=CURRENT_TIMESTAMP WHERE id=?"
+
+
 def api_log_weight(data):
-    conn = connect(); cur = conn.cursor()
-    ai_data = None
-    if data.get("waste_photo_url"):
-        try:
-            ai_data = classify_image(data["waste_photo_url"])
-        except Exception as e:
-            ai_data = {"error": str(e)}
-
-    earnings_amount = None
-    wt = None
-    if isinstance(ai_data, dict):
-        if ai_data.get("waste_type"):
-            wt = ai_data.get("waste_type")
-        elif ai_data.get("result") and isinstance(ai_data["result"], dict):
-            wt = ai_data["result"].get("waste_type")
-
-    if wt:
-        cur.execute("SELECT price_per_kg FROM waste_pricing WHERE waste_type=? AND is_active=1", (wt,))
-        p = cur.fetchone()
-        if p:
-            earnings_amount = p[0] * float(data["total_weight_kg"])
-    if earnings_amount is None:
-        earnings_amount = 5.0 * float(data["total_weight_kg"])
+    """
+    Record the collection straight away at the default rate. A photo is
+    classified by a background job, which then re-prices the collection
+    and its earning (see _classify_collection).
+    """
+    return _record_collection(data, None, classify=bool(data.get("waste_photo_url")))
+
+
+def _record_collection(data, ai_data, classify=False):
+    result = write(_insert_collection, data, ai_data, classify)
+    _after_collection(data, result)
+    return result
+
+
+def _after_collection(data, result):
+    if "classification_job" in result:
+        CLASSIFY_JOBS.wake()
+    _audit_collections([(data["collector_id"], data["request_id"], result["collection_id"],
+                         float(data["total_weight_kg"]), result["earnings_amount"])])
+
 
+def _audit_collections(logged):
+    """logged: (collector_id, request_id, collection_id, weight_kg, earnings_amount) per collection."""
+    entries = []
+    for collector_id, request_id, cid, weight, amount in logged:
+        entries.append(("collection.logged", "collection", cid, collector_id,
+                        {"request_id": request_id, "weight_kg": weight, "earnings_amount": amount}))
+        entries.append(("request.completed", "pickup_request", request_id, collector_id, {"collection_id": cid}))
+    audit.record_many(entries)
+
+
+def _insert_collection(conn, data, ai_data, classify):
+    weight = float(data["total_weight_kg"])
+    job_id = None
+    rate = PRICING.price_per_kg(waste_type_of(ai_data), conn)
+    earnings_amount = rate * weight
+    cur = conn.cursor()
     cur.execute("""
       INSERT INTO collections (request_id, collector_id, waste_photo_url, ai_classification_data, total_weight_kg, categories, earnings_amount, payment_status)
       VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
+      RETURNING id
     """, (
         data["request_id"],
         data["collector_id"],
@@ -194,18 +337,135 @@ def api_log_weight(data):
         None,
         earnings_amount
     ))
-    conn.commit()
-    cur.execute("SELECT id FROM collections ORDER BY rowid DESC LIMIT 1")
     cid = cur.fetchone()[0]
 
     cur.execute("""
       INSERT INTO earnings (collector_id, collection_id, amount, rate_per_kg, weight_kg, status)
       VALUES (?, ?, ?, ?, ?, 'pending')
-    """, (data["collector_id"], cid, earnings_amount, earnings_amount / float(data["total_weight_kg"]), data["total_weight_kg"]))
+    """, (data["collector_id"], cid, earnings_amount, rate, data["total_weight_kg"]))
+
+    cur.execute(COMPLETE_REQUEST_SQL, (data["request_id"],))
+    if classify:
+        job_id = CLASSIFY_JOBS.enqueue({"collection_id": cid, "photo": data["waste_photo_url"]}, conn=conn)
+
+    result = {"status": "logged", "collection_id": cid, "earnings_amount": earnings_amount, "ai_data": ai_data}
+    if job_id is not None:
+        result["classification_job"] = job_id
+    return result
+
+
+class ClassificationFailed(RuntimeError):
+    pass
+
+
+def _classify_collection(payload):
+    """
+    Job handler: classify a logged collection's photo, store the result and
+    re-price it from waste_pricing. An earning already claimed by a payout
+    keeps its amount. Safe to run twice.
+    """
+    ai_data = classify_image_cached(payload["photo"])
+    if not isinstance(ai_data, dict) or ai_data.get("error"):
+        raise ClassificationFailed(ai_data.get("error") if isinstance(ai_data, dict) else repr(ai_data))
+    waste_type = waste_type_of(ai_data)
+    rate, repriced = write(_reprice_collection, payload["collection_id"], ai_data, waste_type)
+    audit.record("collection.classified", "collection", payload["collection_id"],
+                 meta={"waste_type": waste_type, "rate_per_kg": rate, "repriced": bool(repriced)})
+
+
+REPRICE_EARNING_SQL = "UPDATE earnings SET rate_per_kg = ?, amount = weight_kg * ? WHERE collection_id = ? AND status = 'pending'"
+
+
+def _reprice_collection(conn, collection_id, ai_data, waste_type):
+    categories = ai_data.get("categories") or ([waste_type] if waste_type else None)
+    rate = PRICING.price_per_kg(waste_type, conn)
+    repriced = conn.execute(REPRICE_EARNING_SQL, (rate, rate, collection_id)).rowcount
+    ai_json, categories_json = json.dumps(ai_data), json.dumps(categories) if categories else None
+    if repriced:
+        conn.execute("""
+          UPDATE collections SET ai_classification_data = ?, categories = ?, earnings_amount = total_weight_kg * ?
+          WHERE id = ?
+        """, (ai_json, categories_json, rate, collection_id))
+    else:
+        conn.execute("UPDATE collections SET ai_classification_data = ?, categories = ? WHERE id = ?",
+                     (ai_json, categories_json, collection_id))
+    return rate, repriced
+
+
+CLASSIFY_JOBS = jobs.register("classify_collection", _classify_collection)
+
+
+def api_log_weights_bulk(items):
+    """
+    Record a collector's whole shift at once. Each item has the same fields
+    as api_log_weight. Every collection, earning and status change is
+    written with executemany in a single transaction, at the item's
+    "waste_type" price or else the default rate; each photo without a
+    waste_type gets a classification job in that same transaction, as in
+    api_log_weight. Ids are generated here so no per-row read-back is needed.
+    """
+    items = list(items)
+    if not items:
+        return {"status": "logged", "collections": []}
+    return _record_collections(items)
+
+
+def _bulk_photos(items):
+    """Indexes of bulk items whose photo still needs classifying."""
+    return [i for i, it in enumerate(items) if it.get("waste_photo_url") and not it.get("waste_type")]
+
+
+def _record_collections(items):
+    collections, out, queued = write(_insert_collections, items)
+    if queued:
+        CLASSIFY_JOBS.wake()
+    _audit_collections((c[2], c[1], c[0], c[5], c[6]) for c in collections)
+    return {"status": "logged", "collections": out,
+            "total_weight_kg": sum(c[5] for c in collections),
+            "total_earnings": sum(c[6] for c in collections),
+            "classification_jobs": queued}
+
+
+def _insert_collections(conn, items):
+    collections, earnings, completed, out = [], [], [], []
+    prices = PRICING.prices(conn)
+    for it in items:
+        weight = float(it["total_weight_kg"])
+        rate = prices.get(it.get("waste_type"), DEFAULT_PRICE_PER_KG)
+        cid = uuid.uuid4().hex
+        collections.append((cid, it["request_id"], it["collector_id"], it.get("waste_photo_url"),
+                            None, weight, rate * weight))
+        earnings.append((uuid.uuid4().hex, it["collector_id"], cid, rate * weight, rate, weight))
+        completed.append((it["request_id"],))
+        out.append({"collection_id": cid, "request_id": it["request_id"], "earnings_amount": rate * weight})
+
+    conn.executemany("""
+      INSERT INTO collections (id, request_id, collector_id, waste_photo_url, ai_classification_data, total_weight_kg, earnings_amount, payment_status)
+      VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
+    """, collections)
+    conn.executemany("""
+      INSERT INTO earnings (id, collector_id, collection_id, amount, rate_per_kg, weight_kg, status)
+      VALUES (?, ?, ?, ?, ?, ?, 'pending')
+    """, earnings)
+    conn.executemany(COMPLETE_REQUEST_SQL, completed)
+    queued = CLASSIFY_JOBS.enqueue_many(
+        [{"collection_id": collections[i][0], "photo": items[i]["waste_photo_url"]} for i in _bulk_photos(items)], conn)
+    return collections, out, queued
+
+
+# -------------------------
+# PRICING
+# -------------------------
+def api_set_waste_price(waste_type, price_per_kg):
+    set_price(waste_type, float(price_per_kg))
+    audit.record("price.set", "waste_price", waste_type, meta={"price_per_kg": float(price_per_kg)})
+    return {"status": "saved", "waste_type": waste_type, "price_per_kg": float(price_per_kg)}
 
-    cur.execute("UPDATE pickup_requests SET status='completed', completed_at=CURRENT_TIMESTAMP WHERE id=?", (data["request_id"],))
-    conn.commit(); conn.close()
-    return {"status": "logged", "collection_id": cid, "earnings_amount": earnings_amount, "ai_data": ai_data}
+
+def api_deactivate_waste_price(waste_type):
+    deactivate_price(waste_type)
+    audit.record("price.deactivated", "waste_price", waste_type)
+    return {"status": "deactivated", "waste_type": waste_type}
 
 
 # -------------------------
@@ -214,25 +474,245 @@ def api_log_weight(data):
 def api_classify_waste_text(text):
     return classify_waste_text(text)
 
+def api_classify_waste_text_batch(texts):
+    return {"results": classify_waste_text_batch(texts)}
+
 def api_classify_image(image_url):
-    return classify_image(image_url)
+    return classify_image_cached(image_url)
+
+def api_classify_images_batch(image_urls):
+    return {"results": classify_images_batch(image_urls)}
 
 def api_optimize_route_for_collector(collector_id, max_items=10):
     tasks_resp = api_get_tasks(collector_id=collector_id, max_items=max_items)
     tasks = tasks_resp.get("tasks", [])
     if not tasks:
         return {"route": []}
-    return optimize_route(tasks)
-    
+    start, capacity = _collector_start(collector_id)
+    return _optimize_tasks(start, tasks, capacity)
+
+
+COLLECTOR_CAPACITY_SQL = "SELECT capacity_kg FROM users WHERE id=?"
+
+
+def _collector_start(collector_id):
+    """(start position or None, capacity_kg or None) for a collector."""
+    with get_conn() as conn:
+        col = conn.execute(COLLECTOR_CAPACITY_SQL, (collector_id,)).fetchone()
+        start = POSITIONS.position(collector_id, conn) if col else None
+    return start, col["capacity_kg"] if col else None
+
+
+def _optimize_tasks(start, tasks, capacity):
+    optimized = optimize_tsp_route(start, tasks, capacity=capacity)
+    optimized["route"] = optimized.pop("stops")
+    return optimized
+
+
+# -------------------------
+# COLLECTOR LOCATION
+# -------------------------
+def api_update_location(collector_id, latitude, longitude, timestamp=None):
+    """Accept a GPS ping. It is visible to task and assignment lookups at once and written within a second."""
+    try:
+        POSITIONS.ping(collector_id, latitude, longitude, timestamp)
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}
+    return {"status": "accepted"}
+
+
+def api_update_locations_bulk(pings):
+    """pings: list of {"collector_id", "latitude", "longitude", "timestamp"?}."""
+    try:
+        n = POSITIONS.ping_many((p["collector_id"], p["latitude"], p["longitude"], p.get("timestamp")) for p in pings)
+    except (KeyError, TypeError, ValueError) as e:
+        return {"error": str(e)}
+    return {"status": "accepted", "count": n}
+
+
+def api_get_location_track(collector_id, limit=50):
+    """Recent points reported by a collector, newest first (kept in memory only)."""
+    return {"collector_id": collector_id, "points": POSITIONS.track(collector_id, limit)}
+
+
+# -------------------------
+# NOTIFICATIONS
+# -------------------------
+def api_send_notification(user_id, title, message, type, related_request_id=None, related_collection_id=None):
+    """Queue one notification; it is written with the next batch (within a fraction of a second)."""
+    try:
+        nid = notifications.send(user_id, title, message, type, related_request_id, related_collection_id)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"status": "queued", "notification_id": nid}
+
+
+def api_broadcast_notification(title, message, type, user_ids=None, role=None, related_request_id=None, available_only=False):
+    """Send to an explicit list of users, or to everyone with `role` (e.g. all collectors for a new_request)."""
+    try:
+        if user_ids is not None:
+            sent = notifications.broadcast(user_ids, title, message, type, related_request_id)
+        elif role:
+            sent = notifications.broadcast_to_role(role, title, message, type, related_request_id, available_only)
+        else:
+            return {"error": "user_ids or role is required"}
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"status": "sent", "count": sent}
+
+
+def api_get_notifications(user_id, limit=20, cursor=None, unread_only=False):
+    with get_conn() as conn:
+        try:
+            page = notifications.feed(conn, user_id, limit, cursor, unread_only)
+        except ValueError as e:
+            return {"error": str(e)}
+        page["unread"] = notifications.unread_count(conn, user_id)
+    return page
+
+
+def api_get_unread_count(user_id):
+    with get_conn() as conn:
+        return {"user_id": user_id, "unread": notifications.unread_count(conn, user_id)}
+
+
+def api_mark_notifications_read(user_id, notification_ids=None):
+    changed = write(notifications.mark_read, user_id, notification_ids)
+    with get_conn() as conn:
+        return {"marked_read": changed, "unread": notifications.unread_count(conn, user_id)}
+
+
+# -------------------------
+# PAYOUTS
+# -------------------------
+def api_run_payout(cutoff=None, min_amount=0.0, batch_id=None):
+    """
+    Pay out every pending earning created up to `cutoff` (default: now) for
+    collectors owed at least min_amount. Safe to repeat: the same cutoff
+    returns the same batch, and interrupted batches are finished first.
+    """
+    cutoff = cutoff or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    result = payouts.run_payout(cutoff, min_amount, batch_id)
+    for resumed in result["resumed"]:
+        audit.record("payout.settled", "payout_batch", resumed, meta={"resumed": True})
+    _audit_batch("payout.paid", result["batch"])
+    return result
+
+
+def _audit_batch(action, batch):
+    audit.record(action, "payout_batch", batch["id"],
+                 meta={k: batch[k] for k in ("cutoff", "min_amount", "collectors", "earnings", "amount")})
+
+
+def api_open_payout_batch(cutoff, min_amount=0.0, batch_id=None):
+    """First half of a payout, for when the money moves outside the app before settling."""
+    with get_conn() as conn:
+        batch = payouts.open_batch(conn, cutoff, min_amount, batch_id)
+    _audit_batch("payout.opened", batch)
+    return batch
+
+
+def api_settle_payout_batch(batch_id):
+    with get_conn() as conn:
+        try:
+            batch = payouts.settle_batch(conn, batch_id)
+        except ValueError as e:
+            return {"error": str(e)}
+    _audit_batch("payout.settled", batch)
+    return batch
+
+
+def api_get_payout_batch(batch_id):
+    with get_conn() as conn:
+        return payouts.get_batch(conn, batch_id) or {"error": "payout batch not found"}
+
+
+# -------------------------
+# EXPORTS
+# -------------------------
+def api_export(table, out, fmt="csv", collector_id=None, start_date=None, end_date=None, cursor=None, max_rows=None):
+    """
+    Stream collections / earnings / transactions / audit_logs to `out` (path or
+    file object) as CSV or NDJSON. Pass next_cursor back to continue.
+    """
+    try:
+        return export.export(table, out, fmt, max_rows=max_rows, collector_id=collector_id,
+                             start_date=start_date, end_date=end_date, cursor=cursor)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+# -------------------------
+# BACKGROUND JOBS
+# -------------------------
+def api_get_job_stats():
+    with get_conn() as conn:
+        return {"queues": jobs.stats(conn)}
+
+
+def api_get_failed_jobs(queue="classify_collection", limit=50):
+    with get_conn() as conn:
+        return {"jobs": jobs.failed(conn, queue, int(limit))}
+
+
+def api_retry_failed_jobs(queue="classify_collection"):
+    n = write(jobs.retry_failed, queue)
+    audit.record("jobs.requeued", "job_queue", queue, meta={"jobs": n})
+    if queue in jobs.QUEUES:
+        jobs.QUEUES[queue].wake()
+    return {"status": "requeued", "jobs": n}
+
+
+# -------------------------
+# AUDIT LOG
+# -------------------------
+def api_get_audit_log(entity, entity_id=None, start=None, end=None, limit=50, cursor=None):
+    """
+    Audit entries for an entity type ("pickup_request", "collection",
+    "payout_batch", "waste_price", "job_queue"), optionally one id, newest
+    first, with start <= created_at < end. Buffered entries are written first.
+    """
+    audit.flush()
+    with get_conn() as conn:
+        try:
+            return audit.query(conn, entity, entity_id, start, end, limit, cursor)
+        except ValueError as e:
+            return {"error": str(e)}
+
 
 # -------------------------
 # ADMIN STATS
 # -------------------------
 def api_get_stats():
-    conn = connect(); cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) AS total_users FROM users")
-    users = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) AS total_requests FROM pickup_requests")
-    requests = cur.fetchone()[0]
-    conn.close()
-    return {"total_users": users, "total_requests": requests}
+    with get_conn() as conn:
+        return read_counters(conn)
+
+
+def api_get_stats_range(start_date, end_date):
+    """
+    Per-day metrics between two ISO dates (inclusive) plus range totals,
+    read from the incrementally maintained daily_metrics table.
+    """
+    with get_conn() as conn:
+        days = read_daily(conn, start_date, end_date)
+    totals = {
+        key: sum(d[key] or 0 for d in days)
+        for key in ("total_requests", "completed_requests", "total_collections", "total_weight_kg", "total_earnings")
+    }
+    minutes = sum(d["total_collection_minutes"] or 0 for d in days)
+    totals["completion_rate"] = min(1.0, totals["completed_requests"] / totals["total_requests"]) if totals["total_requests"] else 0.0
+    totals["avg_collection_time_minutes"] = minutes / totals["completed_requests"] if totals["completed_requests"] else 0.0
+    for d in days:
+        d.pop("total_collection_minutes", None)
+    return {"start_date": start_date, "end_date": end_date, "days": days, "totals": totals}
+
+
+# -------------------------
+# METRICS
+# -------------------------
+def api_get_metrics():
+    """Prometheus text snapshot of the instrumentation (empty unless WASTELINK_METRICS=1)."""
+    return prometheus_text()
+
+
+instrument_endpoints(globals())
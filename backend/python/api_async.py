@@ -0,0 +1,246 @@
+# api_async.py
+"""
+asyncio counterparts of the api.py endpoints.
+
+Each api_*_async mirrors its synchronous namesake and reuses its SQL and
+logic through the helpers in api.py. Blocking SQLite reads run on the
+bounded DB executor (utils.run_db) and writes are awaited on the
+group-commit writer (utils.write_async). Google calls go through the
+non-blocking maps client and Jac calls through asyncio subprocess pipes,
+so one process can keep hundreds of collector polls in flight.
+
+Every endpoint accepts `timeout=` (seconds) and can be cancelled. At most
+MAX_CONCURRENT_CALLS run at once per event loop; the rest wait their turn.
+Call shutdown() before the loop closes.
+"""
+import asyncio
+import functools
+import os
+import weakref
+
+import api
+from ai_model import classify_image_cached_async, classify_waste_text_async
+from instrumentation import instrument_endpoints
+from jac_worker import JacWorkerError, close_async_pool, jac_call_async
+from maps_client import close_async_client, distance_matrix_async
+from utils import run_db, write_async
+
+MAX_CONCURRENT_CALLS = int(os.environ.get("WASTELINK_ASYNC_CALLS", "512"))
+DEFAULT_TIMEOUT_S = float(os.environ.get("WASTELINK_ASYNC_TIMEOUT", "30"))
+
+_limits = weakref.WeakKeyDictionary()
+
+
+def _limit():
+    loop = asyncio.get_running_loop()
+    sem = _limits.get(loop)
+    if sem is None:
+        sem = _limits[loop] = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+    return sem
+
+
+def endpoint(fn):
+    """Apply the concurrency limit and a per-call timeout."""
+    @functools.wraps(fn)
+    async def wrapper(*args, timeout=None, **kwargs):
+        timeout = timeout or DEFAULT_TIMEOUT_S
+        async with _limit():
+            try:
+                return await asyncio.wait_for(fn(*args, **kwargs), timeout)
+            except asyncio.TimeoutError:
+                return {"error": f"{fn.__name__} timed out after {timeout}s"}
+    return wrapper
+
+
+async def _run_cpu(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def shutdown():
+    """Release the running loop's HTTP client and Jac workers."""
+    await close_async_client()
+    await close_async_pool()
+
+
+# -------------------------
+# JAC
+# -------------------------
+@endpoint
+async def run_jac_async(node_name, action, params=None):
+    if api.jac_client_present():
+        res = await _run_cpu(api._run_jac_client, node_name, action, params)
+        if isinstance(res, dict):
+            return res
+    try:
+        return await jac_call_async(f"{node_name}.{action}", params or {})
+    except JacWorkerError as e:
+        return {"error": str(e)}
+
+
+# -------------------------
+# AUTH / REQUESTS
+# -------------------------
+@endpoint
+async def api_auth_async(email, password_hash):
+    return await run_db(api.api_auth, email, password_hash)
+
+
+@endpoint
+async def api_create_request_async(data):
+    request_id = await write_async(api._insert_request, data)
+    api._request_created(request_id, data)
+    return {"status": "saved", "request_id": request_id}
+
+
+# -------------------------
+# GET TASKS
+# -------------------------
+@endpoint
+async def api_get_tasks_async(collector_id=None, max_items=10):
+    return await _get_tasks(collector_id, max_items)
+
+
+async def _get_tasks(collector_id, max_items):
+    origin, tasks = await run_db(api._task_candidates, collector_id, max_items)
+    if origin is None or not tasks:
+        return {"tasks": tasks}
+    try:
+        dm = await distance_matrix_async([origin], [f"{t['latitude']},{t['longitude']}" for t in tasks])
+        return {"tasks": api._order_by_road(tasks, dm, max_items)}
+    except Exception:
+        return {"tasks": tasks[:max_items]}
+
+
+# -------------------------
+# ASSIGNMENT
+# -------------------------
+@endpoint
+async def api_assign_collector_async(request_id):
+    found = await run_db(api._assign_candidates, request_id)
+    if "error" in found:
+        return found
+    try:
+        dm = await distance_matrix_async([found["origin"]], found["destinations"], top_k=api.ASSIGN_CANDIDATES)
+        chosen_id, best_dist = api._nearest_by_road(found["collectors"], dm)
+        await write_async(api._assign, request_id, chosen_id)
+        api._after_assign(request_id, chosen_id, best_dist)
+        return {"assigned_collector_id": chosen_id, "distance_m": best_dist}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@endpoint
+async def api_assign_pending_batch_async(max_requests=1000):
+    return await run_db(api.api_assign_pending_batch, max_requests)
+
+
+# -------------------------
+# LOG WEIGHT
+# -------------------------
+@endpoint
+async def api_log_weight_async(data):
+    result = await write_async(api._insert_collection, data, None, bool(data.get("waste_photo_url")))
+    api._after_collection(data, result)
+    return result
+
+
+@endpoint
+async def api_log_weights_bulk_async(items):
+    return await run_db(api.api_log_weights_bulk, items)
+
+
+# -------------------------
+# CLASSIFY / OPTIMIZE
+# -------------------------
+@endpoint
+async def api_classify_waste_text_async(text):
+    return await classify_waste_text_async(text)
+
+
+@endpoint
+async def api_classify_waste_text_batch_async(texts):
+    return {"results": list(await asyncio.gather(*(classify_waste_text_async(t) for t in texts)))}
+
+
+@endpoint
+async def api_classify_image_async(image_url):
+    return await classify_image_cached_async(image_url)
+
+
+@endpoint
+async def api_classify_images_batch_async(image_urls):
+    return {"results": list(await asyncio.gather(*(classify_image_cached_async(u) for u in image_urls)))}
+
+
+@endpoint
+async def api_optimize_route_for_collector_async(collector_id, max_items=10):
+    tasks_resp = await _get_tasks(collector_id, max_items)
+    tasks = tasks_resp.get("tasks", [])
+    if not tasks:
+        return {"route": []}
+    start, capacity = await run_db(api._collector_start, collector_id)
+    return await _run_cpu(api._optimize_tasks, start, tasks, capacity)
+
+
+# -------------------------
+# COLLECTOR LOCATION
+# -------------------------
+# pings only touch memory, so these run on the loop without a DB hop
+@endpoint
+async def api_update_location_async(collector_id, latitude, longitude, timestamp=None):
+    return api.api_update_location(collector_id, latitude, longitude, timestamp)
+
+
+@endpoint
+async def api_update_locations_bulk_async(pings):
+    return api.api_update_locations_bulk(pings)
+
+
+# -------------------------
+# NOTIFICATIONS
+# -------------------------
+@endpoint
+async def api_get_notifications_async(user_id, limit=20, cursor=None, unread_only=False):
+    return await run_db(api.api_get_notifications, user_id, limit, cursor, unread_only)
+
+
+@endpoint
+async def api_get_unread_count_async(user_id):
+    return await run_db(api.api_get_unread_count, user_id)
+
+
+@endpoint
+async def api_mark_notifications_read_async(user_id, notification_ids=None):
+    return await run_db(api.api_mark_notifications_read, user_id, notification_ids)
+
+
+# -------------------------
+# EXPORTS
+# -------------------------
+@endpoint
+async def api_export_async(table, out, fmt="csv", collector_id=None, start_date=None, end_date=None, cursor=None, max_rows=None):
+    return await run_db(api.api_export, table, out, fmt, collector_id, start_date, end_date, cursor, max_rows)
+
+
+# -------------------------
+# AUDIT LOG
+# -------------------------
+@endpoint
+async def api_get_audit_log_async(entity, entity_id=None, start=None, end=None, limit=50, cursor=None):
+    return await run_db(api.api_get_audit_log, entity, entity_id, start, end, limit, cursor)
+
+
+# -------------------------
+# ADMIN STATS
+# -------------------------
+@endpoint
+async def api_get_stats_async():
+    return await run_db(api.api_get_stats)
+
+
+@endpoint
+async def api_get_stats_range_async(start_date, end_date):
+    return await run_db(api.api_get_stats_range, start_date, end_date)
+
+
+instrument_endpoints(globals())
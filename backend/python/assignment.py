@@ -0,0 +1,148 @@
+# assignment.py
+"""
+Global assignment of pending pickups to available collectors.
+
+Rather than matching requests one at a time, all pending pickups and all
+available collectors are loaded once, scored in a single cost matrix and
+solved as a min-cost assignment. Each collector is expanded into one
+column per pickup it can still carry, so a collector can take several
+pickups up to capacity, and each extra slot costs a little more as the
+truck fills up.
+
+The cost is the minimisation form of flows.jac PickupMatcher's
+`calculate_match_score(distance, rating, current_load, capacity)`:
+road distance plus a load term plus a rating penalty, with the same 5 km
+cut-off.
+"""
+import numpy as np
+
+from distance_engine import ROAD_FACTOR, haversine_matrix
+from route_optimizer import DEFAULT_STOP_WEIGHT_KG
+
+MAX_MATCH_KM = 5.0
+CANDIDATES_PER_PICKUP = 8
+MAX_PICKUPS_PER_COLLECTOR = 20
+DEFAULT_CAPACITY_KG = MAX_PICKUPS_PER_COLLECTOR * DEFAULT_STOP_WEIGHT_KG
+
+# cost weights, in km-equivalents
+LOAD_WEIGHT = 2.0      # a full truck costs as much as 2 km of extra driving
+RATING_WEIGHT = 1.0    # a 0-star collector costs 1 km more than a 5-star one
+
+UNASSIGNED_COST = 1e6
+FORBIDDEN_COST = 1e9
+
+
+# -------------------------
+# COST MODEL
+# -------------------------
+def match_cost(distance_km, rating, load_after_kg, capacity_kg):
+    """Lower is better. Works elementwise on NumPy arrays."""
+    rating = np.clip(np.nan_to_num(rating, nan=0.0), 0.0, 5.0)
+    return distance_km + LOAD_WEIGHT * (load_after_kg / capacity_kg) + RATING_WEIGHT * (5.0 - rating) / 5.0
+
+
+def build_cost_matrix(pickups, collectors, pickup_kg=DEFAULT_STOP_WEIGHT_KG):
+    """
+    pickups: list of (lat, lng). collectors: list of dicts with lat, lng,
+    capacity_kg, rating and current_load_kg.
+    Returns (cost, slot_owner, distance_km): cost is pickups x slots, and
+    slot_owner maps each column to its collector index.
+    """
+    p = np.asarray(pickups, dtype=np.float64).reshape(-1, 2)
+    c = np.array([(col["lat"], col["lng"]) for col in collectors], dtype=np.float64).reshape(-1, 2)
+    dist_km = haversine_matrix(p, c) * ROAD_FACTOR / 1000.0
+
+    # only the nearest few collectors inside the cut-off are candidates
+    allowed = dist_km <= MAX_MATCH_KM
+    if c.shape[0] > CANDIDATES_PER_PICKUP:
+        kth = np.partition(dist_km, CANDIDATES_PER_PICKUP - 1, axis=1)[:, CANDIDATES_PER_PICKUP - 1:CANDIDATES_PER_PICKUP]
+        allowed &= dist_km <= kth
+
+    owners, loads = [], []
+    for ci, col in enumerate(collectors):
+        capacity = col.get("capacity_kg") or DEFAULT_CAPACITY_KG
+        free_kg = capacity - (col.get("current_load_kg") or 0.0)
+        slots = min(int(free_kg // pickup_kg), MAX_PICKUPS_PER_COLLECTOR, int(allowed[:, ci].sum()))
+        for s in range(max(slots, 0)):
+            owners.append(ci)
+            loads.append((col.get("current_load_kg") or 0.0) + (s + 1) * pickup_kg)
+    slot_owner = np.array(owners, dtype=np.int64)
+    if not owners:
+        return np.zeros((p.shape[0], 0)), slot_owner, dist_km
+
+    capacity = np.array([collectors[ci].get("capacity_kg") or DEFAULT_CAPACITY_KG for ci in owners])
+    rating = np.array([collectors[ci].get("rating") or 0.0 for ci in owners], dtype=np.float64)
+    cost = match_cost(dist_km[:, slot_owner], rating[None, :], np.array(loads)[None, :], capacity[None, :])
+    cost[~allowed[:, slot_owner]] = FORBIDDEN_COST
+    return cost, slot_owner, dist_km
+
+
+# -------------------------
+# SOLVER
+# -------------------------
+def solve_assignment(cost):
+    """
+    Hungarian algorithm (shortest augmenting path, O(n^2 m)) with the inner
+    column scan vectorized. cost is n x m with n <= m; returns the column
+    chosen for each row.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    n, m = cost.shape
+    if n > m:
+        raise ValueError("solve_assignment needs rows <= columns")
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)    # p[j]: row (1-based) holding column j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assigned = np.full(n, -1, dtype=np.int64)
+    cols = np.nonzero(p[1:])[0]
+    assigned[p[cols + 1] - 1] = cols
+    return assigned
+
+
+def assign(pickups, collectors, pickup_kg=DEFAULT_STOP_WEIGHT_KG):
+    """
+    Returns a list of (pickup index, collector index, distance_km) for every
+    pickup that could be matched; the rest stay unassigned.
+    """
+    if not pickups or not collectors:
+        return []
+    cost, slot_owner, dist_km = build_cost_matrix(pickups, collectors, pickup_kg)
+    n, slots = cost.shape
+    if slots == 0:
+        return []
+    # one "stay unassigned" column per pickup keeps the problem feasible
+    full = np.hstack([cost, np.full((n, n), UNASSIGNED_COST)])
+    chosen = solve_assignment(full)
+    out = []
+    for i, j in enumerate(chosen.tolist()):
+        if j < slots and cost[i, j] < FORBIDDEN_COST:
+            ci = int(slot_owner[j])
+            out.append((i, ci, float(dist_km[i, ci])))
+    return out
@@ -0,0 +1,263 @@
+# audit.py
+"""
+Audit trail of state-changing API calls.
+
+- record() appends one entry to an in-memory buffer and returns; the
+  caller never waits on SQLite. A flusher thread inserts the buffer into
+  `audit_logs` through the group-commit writer (utils.write), in batches
+  of up to BATCH_SIZE, every FLUSH_INTERVAL_S (or as soon as a batch fills). close(), registered with
+  atexit, writes whatever is left; entries recorded after it are written
+  straight away.
+- Backpressure: at most MAX_BUFFERED entries wait in memory. record() on a
+  full buffer wakes the flusher and blocks until there is room, for up to
+  BLOCK_TIMEOUT_S; if SQLite still has not caught up the entry is dropped
+  and counted (`dropped`, wastelink_audit_dropped_total) rather than
+  stalling the API call indefinitely. Drops are logged to wastelink.audit
+  at most once per FLUSH_INTERVAL_S, with the count since the last line.
+- query() pages one entity's entries newest-first, optionally within a
+  time range, with a keyset cursor over idx_audit_logs_entity /
+  idx_audit_logs_entity_created.
+
+created_at is UTC with milliseconds. Ids start with the microsecond clock
+and a per-process counter, so entries written in the same millisecond
+still page back in the order they were recorded.
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import instrumentation
+from instrumentation import REGISTRY
+from utils import AUDIT_LOGS, write
+
+FLUSH_INTERVAL_S = float(os.environ.get("WASTELINK_AUDIT_FLUSH_MS", "250")) / 1000.0
+BATCH_SIZE = int(os.environ.get("WASTELINK_AUDIT_BATCH", "500"))
+MAX_BUFFERED = int(os.environ.get("WASTELINK_AUDIT_MAX_BUFFERED", "50000"))
+BLOCK_TIMEOUT_S = float(os.environ.get("WASTELINK_AUDIT_BLOCK_MS", "2000")) / 1000.0
+MAX_PAGE = 200
+
+_COLUMNS = "id, actor_id, action, entity, entity_id, meta, created_at"
+
+log = logging.getLogger("wastelink.audit")
+
+
+# -------------------------
+# ENTRIES
+# -------------------------
+_seq = itertools.count()
+
+
+def _timestamp(t):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t)) + f".{int(t * 1000) % 1000:03d}"
+
+
+def _row(action, entity, entity_id, actor_id=None, meta=None, t=None):
+    t = time.time() if t is None else t
+    entry_id = f"{int(t * 1e6):014x}{next(_seq) & 0xffff:04x}{uuid.uuid4().hex[:14]}"
+    return (entry_id, actor_id, action, entity, None if entity_id is None else str(entity_id),
+            json.dumps(meta, default=str) if meta else None, _timestamp(t))
+
+
+def _insert(conn, rows):
+    conn.executemany(f"INSERT INTO {AUDIT_LOGS} ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+# -------------------------
+# BUFFERED WRITER
+# -------------------------
+class AuditWriter:
+    """Buffers audit entries and inserts them in batches from a background thread."""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL_S, batch_size=BATCH_SIZE,
+                 max_buffered=MAX_BUFFERED, block_timeout=BLOCK_TIMEOUT_S):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._unlogged_drops = 0
+        self._drop_logged_at = float("-inf")
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def record(self, action, entity, entity_id, actor_id=None, meta=None):
+        """Queue one entry: `action` on entity/entity_id by actor_id, with an optional JSON-able meta dict."""
+        self._append([_row(action, entity, entity_id, actor_id, meta)])
+
+    def record_many(self, entries):
+        """entries: iterable of (action, entity, entity_id, actor_id, meta) sharing one timestamp."""
+        t = time.time()
+        self._append([_row(*e, t=t) for e in entries])
+
+    def _append(self, rows):
+        if not rows:
+            return
+        if self._closed:
+            write(_insert, rows)
+            return
+        self._start()
+        with self._room:
+            if len(self._buffer) + len(rows) > self.max_buffered:
+                self._wait_for_room(len(rows))
+            # a batch bigger than the whole buffer is let in once the buffer has drained
+            room = len(rows) if not self._buffer else max(0, self.max_buffered - len(self._buffer))
+            if room < len(rows):
+                self._drop(len(rows) - room)
+                rows = rows[:room]
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _wait_for_room(self, n):
+        # called holding self._lock
+        self._wake.set()
+        started = time.monotonic()
+        deadline = started + self.block_timeout
+        while self._buffer and len(self._buffer) + n > self.max_buffered:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._room.wait(remaining)
+        if instrumentation.ENABLED:
+            REGISTRY.observe("wastelink_audit_wait_seconds", {}, time.monotonic() - started)
+
+    def _drop(self, n):
+        # called holding self._lock
+        self.dropped += n
+        self._unlogged_drops += n
+        if instrumentation.ENABLED:
+            REGISTRY.inc("wastelink_audit_dropped_total", {}, n)
+        self._log_drops()
+
+    def _log_drops(self):
+        # called holding self._lock; the flusher reports what a burst left unlogged
+        now = time.monotonic()
+        if self._unlogged_drops and now - self._drop_logged_at >= self.flush_interval:
+            log.warning("Audit buffer full: dropped %d entries", self._unlogged_drops)
+            self._unlogged_drops = 0
+            self._drop_logged_at = now
+
+    def flush(self):
+        """Insert everything buffered so far. Returns the number of entries written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+                if not batch:
+                    return written
+                try:
+                    write(_insert, batch)
+                except Exception:
+                    with self._lock:
+                        self._buffer[:0] = batch
+                    raise
+                written += len(batch)
+                with self._room:
+                    self._room.notify_all()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _start(self):
+        if self._thread is None:
+            with self._flush_lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="audit-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("Audit flush failed:", e)
+            with self._lock:
+                self._log_drops()
+
+    def close(self):
+        """Stop the flusher and write whatever is still buffered; later entries are written directly."""
+        self._closed = True
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+
+WRITER = AuditWriter()
+atexit.register(WRITER.close)
+
+
+def record(action, entity, entity_id, actor_id=None, meta=None):
+    WRITER.record(action, entity, entity_id, actor_id, meta)
+
+
+def record_many(entries):
+    WRITER.record_many(entries)
+
+
+def flush():
+    return WRITER.flush()
+
+
+# -------------------------
+# READS
+# -------------------------
+def _decode_cursor(cursor):
+    created_at, _, entry_id = cursor.rpartition("|")
+    if not created_at or not entry_id:
+        raise ValueError("invalid cursor")
+    return [created_at, entry_id]
+
+
+def query_sql(entity, entity_id=None, start=None, end=None, limit=50, cursor=None):
+    """SQL and params behind query(): up to `limit` entries, newest first."""
+    sql = f"SELECT {_COLUMNS} FROM {AUDIT_LOGS} WHERE entity = ?"
+    params = [entity]
+    if entity_id is not None:
+        sql += " AND entity_id = ?"
+        params.append(str(entity_id))
+    if start:
+        sql += " AND created_at >= ?"
+        params.append(start)
+    if end:
+        sql += " AND created_at < ?"
+        params.append(end)
+    if cursor:
+        sql += " AND (created_at, id) < (?, ?)"
+        params += _decode_cursor(cursor)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    return sql, params + [limit]
+
+
+def query(conn, entity, entity_id=None, start=None, end=None, limit=50, cursor=None):
+    """
+    Newest-first page of the entries for `entity` (and `entity_id` if given)
+    with start <= created_at < end; start/end are 'YYYY-MM-DD[ HH:MM:SS]'
+    in UTC. Pass the returned next_cursor back to get the following page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE))
+    rows = [dict(r) for r in conn.execute(*query_sql(entity, entity_id, start, end, limit + 1, cursor))]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    for r in rows:
+        r["meta"] = json.loads(r["meta"]) if r["meta"] else None
+    return {"entries": rows, "next_cursor": f"{rows[-1]['created_at']}|{rows[-1]['id']}" if more else None}
@@ -0,0 +1,1311 @@
+# bench.py
+"""
+Micro-benchmarks for the backend hot paths.
+
+    python bench.py                 # run everything
+    python bench.py connect         # run one benchmark
+    python bench.py --list
+
+Every benchmark runs against a throwaway database so the checked-in
+wastelink.db is never touched.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import utils
+
+BENCHMARKS = {}
+
+# the checked-in database; temp_db() repoints utils.DB_NAME
+SHIPPED_DB = utils.DB_NAME
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+# -------------------------
+# HELPERS
+# -------------------------
+def temp_db():
+    """Point utils at a fresh database in a temp dir and create the schema."""
+    path = os.path.join(tempfile.mkdtemp(prefix="wastelink-bench-"), "bench.db")
+    utils.close_pools()
+    utils.DB_NAME = path
+    utils.init_db()
+    return path
+
+
+def rate(fn, seconds=1.0):
+    """Call fn repeatedly for about `seconds` and return calls/sec."""
+    n = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        n += 1
+    return n / (time.perf_counter() - start)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+# -------------------------
+# CONNECTION POOL
+# -------------------------
+@benchmark("connect")
+def bench_connect(seconds=1.0):
+    path = temp_db()
+    with utils.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO pickup_requests (resident_id, latitude, longitude, address) VALUES (?, ?, ?, ?)",
+            [("r%d" % i, -1.28 + i * 1e-4, 36.82 + i * 1e-4, "addr") for i in range(500)],
+        )
+
+    query = "SELECT id, latitude, longitude, address FROM pickup_requests WHERE status='pending' LIMIT 10"
+
+    def open_per_call():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        conn.execute(query).fetchall()
+        conn.close()
+
+    def pooled():
+        with utils.get_conn() as conn:
+            conn.execute(query).fetchall()
+
+    baseline = rate(open_per_call, seconds)
+    pooled_rate = rate(pooled, seconds)
+    return {
+        "open_per_call_calls_per_s": round(baseline),
+        "pooled_calls_per_s": round(pooled_rate),
+        "speedup": round(pooled_rate / baseline, 2),
+    }
+
+
+# -------------------------
+# SPATIAL INDEX
+# -------------------------
+def seed_pending(n, center=(-1.2864, 36.8172), spread_deg=0.15, seed=7):
+    import random
+    rnd = random.Random(seed)
+    lat0, lng0 = center
+    with utils.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO pickup_requests (resident_id, latitude, longitude, address) VALUES (?, ?, ?, ?)",
+            [("r%d" % i, lat0 + rnd.uniform(-spread_deg, spread_deg), lng0 + rnd.uniform(-spread_deg, spread_deg), "addr")
+             for i in range(n)],
+        )
+
+
+def scan_nearest(lat, lng, k):
+    """The k pending requests nearest (lat, lng) by reading every pending row."""
+    import numpy as np
+    from snapshot import _haversine_m
+
+    with utils.get_conn() as conn:
+        rows = conn.execute("SELECT id, latitude, longitude, address FROM pickup_requests WHERE status='pending'").fetchall()
+    dist = _haversine_m(lat, lng, np.array([r["latitude"] for r in rows]), np.array([r["longitude"] for r in rows]))
+    return [dict(rows[i], distance_m=float(dist[i])) for i in np.lexsort((np.arange(len(rows)), dist))[:k].tolist()]
+
+
+@benchmark("nearest")
+def bench_nearest(n=50000, k=30, seconds=1.0):
+    from snapshot import PickupSnapshot
+
+    temp_db()
+    seed_pending(n)
+    lat, lng = -1.2864, 36.8172
+    snap = PickupSnapshot()
+
+    assert [r["id"] for r in scan_nearest(lat, lng, k)] == [r["id"] for r in snap.nearest_pending(lat, lng, k)]
+    scan_rate = rate(lambda: scan_nearest(lat, lng, k), seconds)
+    index_rate = rate(lambda: snap.nearest_pending(lat, lng, k), seconds)
+    return {
+        "pending": n,
+        "k": k,
+        "full_scan_calls_per_s": round(scan_rate, 1),
+        "snapshot_calls_per_s": round(index_rate, 1),
+        "speedup": round(index_rate / scan_rate, 1),
+    }
+
+
+# -------------------------
+# LOCAL DISTANCE ENGINE
+# -------------------------
+@benchmark("distance_engine")
+def bench_distance_engine():
+    import numpy as np
+    from distance_engine import haversine_matrix, local_distance_matrix, nearest_k
+
+    rnd = np.random.default_rng(11)
+
+    def points(n):
+        return np.column_stack([rnd.uniform(-1.45, -1.15, n), rnd.uniform(36.65, 37.0, n)])
+
+    one, ten_k = points(1), points(10000)
+    five_hundred = points(500)
+    out = {}
+    for label, o, d in (("1x10000", one, ten_k), ("500x500", five_hundred, five_hundred)):
+        best = min(timed(haversine_matrix, o, d)[0] for _ in range(5))
+        out[f"haversine_{label}_ms"] = round(best * 1000, 3)
+    out["nearest_k_25_of_10000_ms"] = round(min(timed(nearest_k, tuple(one[0]), ten_k, 25)[0] for _ in range(5)) * 1000, 3)
+
+    strings = [f"{lat},{lng}" for lat, lng in ten_k.tolist()]
+    out["google_shaped_1x10000_ms"] = round(timed(local_distance_matrix, [strings[0]], strings)[0] * 1000, 1)
+    return out
+
+
+# -------------------------
+# MAPS CLIENT (LOCAL STUB SERVER)
+# -------------------------
+def start_maps_stub(latency_s=0.02):
+    """
+    Serve Distance Matrix / Directions lookalikes on localhost, answering
+    from the local distance engine after `latency_s` of simulated network time.
+    Returns (server, base_url, hit_counter).
+    """
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    from distance_engine import local_distance_matrix
+
+    hits = {"count": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body go out in separate writes; without this, Nagle plus
+        # delayed ACK adds ~40 ms to every keep-alive response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            with lock:
+                hits["count"] += 1
+            time.sleep(latency_s)
+            if url.path.endswith("/distancematrix/json"):
+                body = local_distance_matrix(q["origins"].split("|"), q["destinations"].split("|"))
+                body.pop("source", None)
+            else:
+                leg = local_distance_matrix([q["origin"]], [q["destination"]])["rows"][0]["elements"][0]
+                body = {"status": "OK", "routes": [{"legs": [leg]}]}
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 256    # the default backlog of 5 drops bursts of new connections
+
+        def handle_error(self, request, client_address):
+            # clients hanging up mid-response (cancelled calls) are expected
+            if not isinstance(sys.exc_info()[1], ConnectionError):
+                super().handle_error(request, client_address)
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", hits
+
+
+def _serve_stub(latency_s, conn):
+    import threading
+    _, base, _ = start_maps_stub(latency_s)
+    conn.send(base)
+    threading.Event().wait()
+
+
+def start_maps_stub_process(latency_s=0.02):
+    """
+    start_maps_stub in a child process, so the server's threads do not compete
+    for the GIL with the client being measured. Returns (process, base_url).
+    """
+    import multiprocessing
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_serve_stub, args=(latency_s, child), daemon=True)
+    proc.start()
+    return proc, parent.recv()
+
+
+@benchmark("maps_tiles")
+def bench_maps_tiles(n_origins=20, n_destinations=200):
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    import maps_client
+
+    temp_db()
+    server, base, hits = start_maps_stub()
+    maps_client.GOOGLE_API_KEY = "stub"
+    maps_client.DIST_URL = f"{base}/distancematrix/json"
+    rnd = random.Random(3)
+    pts = lambda n: [f"{-1.28 + rnd.uniform(-0.1, 0.1):.5f},{36.82 + rnd.uniform(-0.1, 0.1):.5f}" for _ in range(n)]
+    origins, destinations = pts(n_origins), pts(n_destinations)
+
+    def sequential():
+        # one tile at a time, as a single-threaded client would
+        for o, d in maps_client._tiles(len(origins), len(destinations)):
+            maps_client._fetch_tile(origins[o], destinations[d])
+
+    seq_s, _ = timed(sequential)
+    hits["count"] = 0
+    par_s, dm = timed(maps_client.get_distance_matrix, origins, destinations, use_cache=False)
+    tiles = hits["count"]
+    assert len(dm["rows"]) == n_origins and all(len(r["elements"]) == n_destinations for r in dm["rows"])
+
+    # identical concurrent requests collapse into one call
+    hits["count"] = 0
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(lambda _: maps_client._fetch_tile(origins[:4], destinations[:25]), range(16)))
+    dedup_calls = hits["count"]
+    server.shutdown()
+    return {
+        "matrix": f"{n_origins}x{n_destinations}",
+        "tiles": tiles,
+        "sequential_s": round(seq_s, 3),
+        "concurrent_s": round(par_s, 3),
+        "speedup": round(seq_s / par_s, 1),
+        "dedup_16_identical_calls": dedup_calls,
+    }
+
+
+@benchmark("async_polls")
+def bench_async_polls(collectors=300, pending=3000, latency_s=0.1, sync_workers=8):
+    """
+    Every collector polls api_get_tasks at once against a Google stub with
+    `latency_s` per call: a sync worker pool of `sync_workers` threads vs one
+    event loop running api_get_tasks_async.
+    """
+    import asyncio
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    temp_db()
+    import api
+    import api_async
+    import maps_client
+    from route_cache import ROUTE_CACHE
+
+    stub, base = start_maps_stub_process(latency_s)
+    maps_client.GOOGLE_API_KEY = "stub"
+    maps_client.DIST_URL = f"{base}/distancematrix/json"
+    seed_pending(pending)
+    rnd = random.Random(11)
+    with utils.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, role, full_name, collector_latitude, collector_longitude) VALUES (?, ?, ?, 'collector', ?, ?, ?)",
+            [(f"c{i}", f"c{i}@example.com", "h", f"C {i}", -1.2864 + rnd.uniform(-0.15, 0.15), 36.8172 + rnd.uniform(-0.15, 0.15))
+             for i in range(collectors)],
+        )
+    ids = [f"c{i}" for i in range(collectors)]
+
+    def sync_round():
+        with ThreadPoolExecutor(sync_workers) as pool:
+            return list(pool.map(api.api_get_tasks, ids))
+
+    async def async_round():
+        try:
+            return await asyncio.gather(*(api_async.api_get_tasks_async(c) for c in ids))
+        finally:
+            await api_async.shutdown()
+
+    ROUTE_CACHE.memory.clear()
+    with utils.get_conn() as conn:
+        conn.execute("DELETE FROM routes")
+    sync_s, sync_res = timed(sync_round)
+    ROUTE_CACHE.memory.clear()
+    with utils.get_conn() as conn:
+        conn.execute("DELETE FROM routes")
+    async_s, async_res = timed(asyncio.run, async_round())
+    stub.terminate()
+    assert [len(r["tasks"]) for r in sync_res] == [len(r["tasks"]) for r in async_res]
+    return {
+        "polls": collectors,
+        "httpx": maps_client.HTTPX_PRESENT,
+        "sync_s": round(sync_s, 3),
+        "async_s": round(async_s, 3),
+        "speedup": round(sync_s / async_s, 1),
+    }
+
+
+# -------------------------
+# ROUTE OPTIMIZER
+# -------------------------
+@benchmark("route_optimizer")
+def bench_route_optimizer(sizes=(10, 50, 200), capacity_kg=150.0):
+    import random
+    from route_optimizer import _nearest_neighbour, _path_cost, optimize_tsp_route
+    from distance_engine import road_matrix, to_array
+
+    rnd = random.Random(5)
+    start = (-1.2864, 36.8172)
+    out = {}
+    for n in sizes:
+        points = [{"id": f"p{i}", "latitude": start[0] + rnd.uniform(-0.08, 0.08),
+                   "longitude": start[1] + rnd.uniform(-0.08, 0.08), "weight_kg": rnd.uniform(5, 30)}
+                  for i in range(n)]
+        d = road_matrix(to_array([start] + points), to_array([start] + points))[0].tolist()
+        nn_km = _path_cost(_nearest_neighbour(range(1, n + 1), d), d, closed=False) / 1000
+
+        secs, res = timed(optimize_tsp_route, start, points)
+        cap_secs, cap_res = timed(optimize_tsp_route, start, points, capacity_kg)
+        out[f"{n}_stops"] = {
+            "input_order_km": round(res["distance"] / (1 - res["efficiency_percent"] / 100), 2),
+            "nearest_neighbour_km": round(nn_km, 2),
+            "optimized_km": res["distance"],
+            "ms": round(secs * 1000, 1),
+            "capacitated_km": cap_res["distance"],
+            "capacitated_trips": len(cap_res["trips"]),
+            "capacitated_ms": round(cap_secs * 1000, 1),
+        }
+    return out
+
+
+# -------------------------
+# JAC WORKER POOL
+# -------------------------
+@benchmark("jac_worker")
+def bench_jac_worker(calls=50):
+    """
+    Per-call latency of a fresh process per call vs the persistent pool. Both
+    sides load the Jac program in JAC_DIR (JacProgram); the spawned process
+    pays interpreter start-up and that load on every call, a pool worker
+    paid it once. The echo target keeps the walker itself out of the numbers.
+    With the `jac` CLI on PATH the real `jac run` is timed too.
+    """
+    import statistics
+    import subprocess
+    from jac_worker import ECHO_TARGET, INFO_TARGET, WORKER_CMD, JacWorkerPool, spawn_call
+
+    params = json.dumps({"image_url": "x.jpg"})
+
+    def spawn():
+        subprocess.check_output(WORKER_CMD + ["--once", ECHO_TARGET, params], text=True)
+
+    pool = JacWorkerPool(size=2)
+    assert pool.ping()
+    program = pool.call(INFO_TARGET)
+    spawn_ms = [timed(spawn)[0] * 1000 for _ in range(max(calls // 5, 5))]
+    pool_ms = [timed(pool.call, ECHO_TARGET, {"image_url": "x.jpg"})[0] * 1000 for _ in range(calls)]
+    for w in pool._workers:         # both workers crash between calls
+        w.proc.kill()
+        w.proc.wait()
+    recovered = pool.ping()
+    health = pool.health()
+    pool.close()
+    result = {
+        "jaclang": program["jaclang"],
+        "jac_modules": program["modules"],
+        "program_load_ms": program["load_ms"],
+        "spawn_per_call_median_ms": round(statistics.median(spawn_ms), 2),
+        "pool_median_ms": round(statistics.median(pool_ms), 3),
+        "speedup": round(statistics.median(spawn_ms) / statistics.median(pool_ms), 1),
+        "recovered_after_kill": recovered,
+        "restarts": health["restarts"],
+    }
+    if shutil.which("jac"):
+        cli_ms = []
+        for _ in range(max(calls // 10, 3)):
+            try:
+                cli_ms.append(timed(spawn_call, "WasteNode.classify_image", {"image_url": "x.jpg"})[0] * 1000)
+            except Exception:
+                cli_ms.append(float("nan"))
+        result["jac_cli_median_ms"] = round(statistics.median(cli_ms), 2)
+    return result
+
+
+# -------------------------
+# TEXT CLASSIFIER
+# -------------------------
+@benchmark("text_classifier")
+def bench_text_classifier(n=20000):
+    import random
+    from text_classifier import DEFAULT_VOCABULARY, WasteTextClassifier
+
+    rnd = random.Random(9)
+    words = [w for ws in DEFAULT_VOCABULARY.values() for w in ws] + ["the", "some", "old", "bag", "of", "and", "a", "lot"]
+    texts = [" ".join(rnd.choice(words) for _ in range(rnd.randint(3, 12))) + f" #{i}" for i in range(n)]
+
+    build_s, clf = timed(WasteTextClassifier)
+    cold_s, _ = timed(clf.classify_batch, texts)
+    repeats = texts[:1000] * (n // 1000)
+    warm_s, _ = timed(clf.classify_batch, repeats)
+    return {
+        "texts": n,
+        "build_ms": round(build_s * 1000, 2),
+        "unique_texts_per_s": round(n / cold_s),
+        "repeated_texts_per_s": round(len(repeats) / warm_s),
+    }
+
+
+# -------------------------
+# LOG WEIGHT
+# -------------------------
+@benchmark("log_weight")
+def bench_log_weight(n=500):
+    """A shift of n collections: one api_log_weight call each vs one api_log_weights_bulk call."""
+    temp_db()
+    import api
+
+    api.api_set_waste_price("plastic", 12.0)
+
+    def shift():
+        seed_pending(n)
+        with utils.get_conn() as conn:
+            rids = [r[0] for r in conn.execute("SELECT id FROM pickup_requests WHERE status='pending'")]
+        return [{"request_id": r, "collector_id": "c1", "total_weight_kg": 4.0, "waste_type": "plastic"} for r in rids]
+
+    items = shift()
+    single_s, _ = timed(lambda: [api.api_log_weight(it) for it in items])
+    items = shift()
+    bulk_s, _ = timed(api.api_log_weights_bulk, items)
+    return {
+        "collections": n,
+        "single_per_s": round(n / single_s),
+        "bulk_per_s": round(n / bulk_s),
+        "speedup": round(single_s / bulk_s, 1),
+    }
+
+
+@benchmark("classify_jobs")
+def bench_classify_jobs(n=40, classify_s=0.2, workers=4):
+    """api_log_weight with a photo: classifying before the insert vs queueing it as a background job."""
+    import random
+    import ai_model
+    import jac_worker
+
+    path = temp_db()
+    import api
+
+    api.api_set_waste_price("plastic", 12.0)
+
+    def slow_classifier(target, params, root=None):
+        time.sleep(classify_s)
+        return {"waste_type": "plastic", "confidence": 0.9}
+
+    def shift(tag):
+        seed_pending(n)
+        with utils.get_conn() as conn:
+            rids = [r[0] for r in conn.execute("SELECT id FROM pickup_requests WHERE status='pending'")]
+        items = []
+        for i, rid in enumerate(rids):
+            photo = os.path.join(os.path.dirname(path), f"{tag}{i}.jpg")
+            with open(photo, "wb") as f:
+                f.write(random.Random(f"{tag}{i}").randbytes(4096))
+            items.append({"request_id": rid, "collector_id": "c1", "total_weight_kg": 4.0, "waste_photo_url": photo})
+        return items
+
+    def inline(item):
+        # what api_log_weight did before: classify, then write
+        return api._record_collection(item, ai_model.classify_image_cached(item["waste_photo_url"]))
+
+    jac_worker.use_backend(slow_classifier)
+    queue, saved_workers = api.CLASSIFY_JOBS, api.CLASSIFY_JOBS.workers
+    queue.close()
+    queue.workers = workers
+    try:
+        inline_s = [timed(inline, it)[0] for it in shift("inline")]
+        items = shift("queued")
+        start = time.perf_counter()
+        queued_s = [timed(api.api_log_weight, it)[0] for it in items]
+        while True:
+            with utils.get_conn() as conn:
+                left = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            if not left:
+                break
+            time.sleep(0.01)
+        drained_s = time.perf_counter() - start
+        with utils.get_conn() as conn:
+            classified = conn.execute("""
+                SELECT COUNT(*) FROM earnings e JOIN collections c ON c.id = e.collection_id
+                WHERE c.waste_photo_url LIKE '%queued%' AND e.rate_per_kg = 12.0
+            """).fetchone()[0]
+    finally:
+        queue.close()
+        queue.workers = saved_workers
+        jac_worker.use_backend(None)
+    return {
+        "collections": n,
+        "classify_ms": classify_s * 1000,
+        "inline": latency_stats(inline_s),
+        "queued": latency_stats(queued_s),
+        "workers": workers,
+        "all_classified_s": round(drained_s, 2),
+        "repriced": classified,
+    }
+
+
+# -------------------------
+# GROUP COMMIT
+# -------------------------
+@benchmark("group_commit")
+def bench_group_commit(producers=(1, 8, 64), inserts=6400):
+    """
+    api_create_request inserts/sec: one transaction per insert vs the
+    group-commit writer, with the default synchronous=NORMAL and with
+    synchronous=FULL (an fsync per commit).
+    """
+    out = {}
+    saved = utils.PRAGMAS
+    try:
+        for sync in ("NORMAL", "FULL"):
+            utils.PRAGMAS = tuple((k, sync if k == "synchronous" else v) for k, v in saved)
+            out[f"synchronous_{sync.lower()}"] = _group_commit_run(producers, inserts)
+    finally:
+        utils.close_pools()
+        utils.PRAGMAS = saved
+    return out
+
+
+def _group_commit_run(producers, inserts):
+    import threading
+
+    temp_db()
+    import api
+
+    row = {"resident_id": "r1", "latitude": -1.28, "longitude": 36.82, "address": "bench"}
+
+    def per_insert():
+        with utils.get_conn() as conn:
+            api._insert_request(conn, row)
+
+    def grouped():
+        utils.write(api._insert_request, row)
+
+    def run(fn, n_threads):
+        errors = []
+        each = inserts // n_threads
+
+        def producer():
+            for _ in range(each):
+                try:
+                    fn()
+                except sqlite3.OperationalError as e:
+                    errors.append(str(e))
+
+        threads = [threading.Thread(target=producer) for _ in range(n_threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        return {"per_s": round((each * n_threads - len(errors)) / elapsed), "errors": len(errors)}
+
+    out = {}
+    for n in producers:
+        writer = utils.get_writer()
+        commits, ops = writer.commits, writer.ops
+        direct, group = run(per_insert, n), run(grouped, n)
+        group["ops_per_commit"] = round((writer.ops - ops) / max(1, writer.commits - commits), 1)
+        out[f"producers_{n}"] = {"per_insert": direct, "group_commit": group,
+                                 "speedup": round(group["per_s"] / max(1, direct["per_s"]), 1)}
+    return out
+
+
+# -------------------------
+# AUDIT LOG
+# -------------------------
+@benchmark("audit")
+def bench_audit(entries=8000, producers=(1, 8)):
+    """
+    Auditing a write: an INSERT + commit per entry vs audit.record() into
+    the batching writer, with synchronous=NORMAL and FULL. Caller latency
+    per entry, and entries/s until every entry is committed.
+    """
+    import threading
+
+    import audit
+
+    def run(fn, n_threads, done=lambda: None):
+        each = entries // n_threads
+        samples = [[] for _ in range(n_threads)]
+
+        def producer(out):
+            for i in range(each):
+                out.append(timed(fn, i)[0])
+
+        threads = [threading.Thread(target=producer, args=(samples[k],)) for k in range(n_threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        done()
+        elapsed = time.perf_counter() - start
+        stats = latency_stats([x for xs in samples for x in xs])
+        return {"p50_ms": stats["p50_ms"], "p99_ms": stats["p99_ms"], "committed_per_s": round(each * n_threads / elapsed)}
+
+    out = {}
+    saved = utils.PRAGMAS
+    try:
+        for sync in ("NORMAL", "FULL"):
+            utils.PRAGMAS = tuple((k, sync if k == "synchronous" else v) for k, v in saved)
+            temp_db()
+            row = audit._row("request.assigned", "pickup_request", "r", None, {"collector_id": "c"})
+
+            def direct(i):
+                with utils.get_conn() as conn:
+                    conn.execute("INSERT INTO audit_logs (id, actor_id, action, entity, entity_id, meta, created_at) "
+                                 "VALUES (lower(hex(randomblob(16))), ?, ?, ?, ?, ?, ?)", row[1:])
+
+            for n in producers:
+                writer = audit.AuditWriter()
+                buffered = run(lambda i: writer.record("request.assigned", "pickup_request", i, None, {"collector_id": "c"}),
+                               n, writer.close)
+                out[f"synchronous_{sync.lower()}_producers_{n}"] = {
+                    "insert_per_entry": run(direct, n), "buffered": buffered, "dropped": writer.dropped,
+                }
+    finally:
+        utils.close_pools()
+        utils.PRAGMAS = saved
+    return out
+
+
+# -------------------------
+# INSTRUMENTATION
+# -------------------------
+@benchmark("instrumentation")
+def bench_instrumentation(seconds=1.0):
+    """
+    Cost of the metrics hooks on two cheap endpoints (bare function on a plain
+    connection vs hooks off vs hooks on), and of an instrumented connection
+    on its own for a point query.
+    """
+    temp_db()
+    import api
+    import instrumentation
+
+    with utils.get_conn() as conn:
+        conn.execute("INSERT INTO users (id, email, password_hash, role, full_name) VALUES ('c1', 'c@x', 'h', 'collector', 'C')")
+    out = {}
+    for fn, args in ((api.api_auth, ("c@x", "h")), (api.api_get_stats, ())):
+        instrumentation.disable()
+        bare = rate(lambda: fn.__wrapped__(*args), seconds)
+        off = rate(lambda: fn(*args), seconds)
+        instrumentation.enable()
+        on = rate(lambda: fn(*args), seconds)
+        instrumentation.disable()
+        out[fn.__name__] = {
+            "bare_per_s": round(bare),
+            "disabled_per_s": round(off),
+            "enabled_per_s": round(on),
+            "disabled_overhead_us": round((1 / off - 1 / bare) * 1e6, 1),
+            "enabled_overhead_us": round((1 / on - 1 / bare) * 1e6, 1),
+        }
+
+    # the same point query on a raw sqlite3 connection and on an instrumented one
+    point = {}
+    for label, factory in (("plain", sqlite3.Connection), ("instrumented", instrumentation.InstrumentedConnection)):
+        conn = sqlite3.connect(utils.DB_NAME, factory=factory)
+        instrumentation.enable()
+        point[f"{label}_per_s"] = round(rate(lambda: conn.execute(api.AUTH_SQL, ("c@x", "h")).fetchone(), seconds))
+        instrumentation.disable()
+        conn.close()
+    point["instrumented_overhead_us"] = round((1 / point["instrumented_per_s"] - 1 / point["plain_per_s"]) * 1e6, 2)
+    out["point_query"] = point
+    instrumentation.REGISTRY.reset()
+    return out
+
+
+# -------------------------
+# GPS INGEST
+# -------------------------
+@benchmark("gps_ingest")
+def bench_gps_ingest(collectors=2000, pings_each=10, seconds=1.0):
+    """Collector pings written one commit each vs coalesced in memory and flushed as one batch."""
+    import random
+    from positions import PositionStore
+
+    temp_db()
+    rnd = random.Random(5)
+    ids = [f"c{i}" for i in range(collectors)]
+    with utils.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, role, full_name, collector_latitude, collector_longitude) VALUES (?, ?, 'h', 'collector', 'C', ?, ?)",
+            [(cid, f"{cid}@x", -1.28, 36.82) for cid in ids])
+    pings = [(cid, -1.28 + rnd.uniform(-0.1, 0.1), 36.82 + rnd.uniform(-0.1, 0.1)) for _ in range(pings_each) for cid in ids]
+
+    def write_one(cid, lat, lng):
+        with utils.get_conn() as conn:
+            conn.execute("""
+                INSERT INTO locations (user_type, user_id, latitude, longitude) VALUES ('collector', ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET latitude = excluded.latitude, longitude = excluded.longitude,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (cid, lat, lng))
+            conn.execute("UPDATE users SET collector_latitude=?, collector_longitude=? WHERE id=?", (lat, lng, cid))
+
+    sample = pings[:2000]
+    per_commit_s, _ = timed(lambda: [write_one(*p) for p in sample])
+
+    store = PositionStore(flush_interval=3600)
+    ingest_s, _ = timed(store.ping_many, pings)
+    flush_s, written = timed(store.flush)
+    store.close()
+
+    def sql_available():
+        with utils.get_conn() as conn:
+            return conn.execute("SELECT id, collector_latitude, collector_longitude FROM users WHERE role='collector' AND is_available=1").fetchall()
+
+    return {
+        "pings": len(pings),
+        "per_commit_pings_per_s": round(len(sample) / per_commit_s),
+        "ingest_pings_per_s": round(len(pings) / ingest_s),
+        "flush_ms": round(flush_s * 1000, 1),
+        "rows_flushed": written,
+        "available_sql_per_s": round(rate(sql_available, seconds)),
+        "available_index_per_s": round(rate(store.available, seconds)),
+    }
+
+
+# -------------------------
+# NOTIFICATIONS
+# -------------------------
+@benchmark("notify_fanout")
+def bench_notify_fanout(users=10000, seconds=1.0):
+    """
+    One notification to `users` collectors: a commit per row, the buffered
+    writer, one executemany and one INSERT ... SELECT. Then page 50 deep into
+    a 10k-item feed with OFFSET vs the keyset cursor.
+    """
+    import notifications
+
+    temp_db()
+    ids = [f"c{i}" for i in range(users)]
+    with utils.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, role, full_name) VALUES (?, ?, 'h', 'collector', 'C')",
+            [(cid, f"{cid}@x") for cid in ids])
+
+    def one_by_one():
+        for cid in ids:
+            with utils.get_conn() as conn:
+                conn.execute(
+                    "INSERT INTO notifications (user_id, title, message, type) VALUES (?, 'New request', 'm', 'new_request')", (cid,))
+
+    def buffered():
+        writer = notifications.NotificationWriter(flush_interval=3600, batch_size=users)
+        for cid in ids:
+            writer.send(cid, "New request", "m", "new_request")
+        writer.close()
+
+    out = {"users": users}
+    out["commit_per_row_ms"] = round(timed(one_by_one)[0] * 1000, 1)
+    out["buffered_writer_ms"] = round(timed(buffered)[0] * 1000, 1)
+    out["executemany_ms"] = round(timed(notifications.broadcast, ids, "New request", "m", "new_request")[0] * 1000, 1)
+    out["insert_select_ms"] = round(timed(notifications.broadcast_to_role, "collector", "New request", "m", "new_request")[0] * 1000, 1)
+
+    # one busy user with a deep feed
+    notifications.broadcast(["c0"] * 10000, "alert", "m", "system_alert")
+    page, depth = 20, 50
+
+    def offset_page():
+        with utils.get_conn() as conn:
+            return conn.execute(
+                "SELECT * FROM notifications WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                ("c0", page, page * depth)).fetchall()
+
+    with utils.get_conn() as conn:
+        cursor = None
+        for _ in range(depth):
+            cursor = notifications.feed(conn, "c0", page, cursor)["next_cursor"]
+
+    def keyset_page():
+        with utils.get_conn() as conn:
+            return notifications.feed(conn, "c0", page, cursor)
+
+    out["feed_offset_pages_per_s"] = round(rate(offset_page, seconds))
+    out["feed_keyset_pages_per_s"] = round(rate(keyset_page, seconds))
+    with utils.get_conn() as conn:
+        out["unread_c0"] = notifications.unread_count(conn, "c0")
+    return out
+
+
+# -------------------------
+# EXPORT
+# -------------------------
+def _peak(fn, *args, **kwargs):
+    """(seconds, peak traced MB, result) of one call; tracemalloc slows the call down."""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        elapsed, result = timed(fn, *args, **kwargs)
+        return elapsed, tracemalloc.get_traced_memory()[1] / 2**20, result
+    finally:
+        tracemalloc.stop()
+
+
+@benchmark("export")
+def bench_export(rows=2000000, baseline_rows=200000, collectors=2000):
+    """
+    CSV export of `earnings`: fetchall + dicts (the existing bulk-read idiom)
+    on baseline_rows vs the streaming keyset export on the same slice, on the
+    whole table, and for one collector's month.
+    """
+    import csv
+    import random
+    import export
+    import seed_data
+
+    temp_db()
+    rnd = random.Random(9)
+    ids = [f"c{i}" for i in range(collectors)]
+    start = time.time() - 365 * 86400
+    for batch in seed_data._chunks(range(rows), 100000):
+        with utils.get_conn() as conn:
+            conn.executemany(
+                "INSERT INTO earnings (id, collector_id, collection_id, amount, rate_per_kg, weight_kg, status, created_at) VALUES (?, ?, ?, ?, 12.0, ?, 'pending', ?)",
+                [(f"{i:032x}", rnd.choice(ids), f"k{i}", round(rnd.uniform(10, 400), 2), round(rnd.uniform(1, 30), 2),
+                  seed_data._ts(start + rnd.uniform(0, 365 * 86400))) for i in batch])
+    out_dir = tempfile.mkdtemp(prefix="wastelink-export-")
+
+    def naive(limit):
+        with utils.get_conn() as conn:
+            data = [dict(r) for r in conn.execute("SELECT * FROM earnings LIMIT ?", (limit,)).fetchall()]
+        with open(os.path.join(out_dir, "naive.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(data[0]))
+            writer.writeheader()
+            writer.writerows(data)
+        return len(data)
+
+    def streamed(**kw):
+        return export.export("earnings", os.path.join(out_dir, "stream.csv"), **kw)
+
+    out = {"rows": rows}
+    s, mb, _ = _peak(naive, baseline_rows)
+    out["fetchall_slice"] = {"rows": baseline_rows, "s": round(s, 2), "peak_mb": round(mb, 1)}
+    s, mb, _ = _peak(streamed, max_rows=baseline_rows)
+    out["stream_slice"] = {"rows": baseline_rows, "s": round(s, 2), "peak_mb": round(mb, 1)}
+    s, res = timed(streamed)
+    out["stream_full"] = {"rows": res["rows"], "s": round(s, 2), "rows_per_s": round(res["rows"] / s)}
+    _, mb, _ = _peak(streamed)
+    out["stream_full"]["peak_mb"] = round(mb, 1)
+    month = time.strftime("%Y-%m", time.gmtime(start + 180 * 86400))
+    s, res = timed(streamed, collector_id="c1", start_date=f"{month}-01", end_date=f"{month}-28")
+    out["one_collector_month"] = {"rows": res["rows"], "ms": round(s * 1000, 1)}
+    return out
+
+
+# -------------------------
+# PAYOUTS
+# -------------------------
+@benchmark("payouts")
+def bench_payouts(rows=1000000, collectors=2000):
+    """
+    Pay out `rows` pending earnings: a Python loop of per-row UPDATEs vs the
+    set-based batch, with a group-commit writer inserting alongside the batch
+    to show how long the payout holds it off.
+    """
+    import random
+    import shutil
+    import threading
+    import payouts
+    import seed_data
+
+    path = temp_db()
+    rnd = random.Random(13)
+    ids = [f"c{i}" for i in range(collectors)]
+    with utils.get_conn() as conn:
+        conn.executemany("INSERT INTO users (id, email, password_hash, role, full_name) VALUES (?, ?, 'h', 'collector', 'C')",
+                         [(cid, f"{cid}@x") for cid in ids])
+    start = time.time() - 30 * 86400
+    for batch in seed_data._chunks(range(rows), 100000):
+        with utils.get_conn() as conn:
+            conn.executemany(
+                "INSERT INTO collections (id, request_id, collector_id, total_weight_kg, earnings_amount) VALUES (?, 'r', ?, 1.0, ?)",
+                [(f"k{i}", ids[i % collectors], 1.0) for i in batch])
+            conn.executemany(
+                "INSERT INTO earnings (id, collector_id, collection_id, amount, rate_per_kg, weight_kg, created_at) VALUES (?, ?, ?, ?, 12.0, 1.0, ?)",
+                [(f"{i:032x}", ids[i % collectors], f"k{i}", round(rnd.uniform(10, 400), 2),
+                  seed_data._ts(start + rnd.uniform(0, 29 * 86400))) for i in batch])
+    utils.close_pools()
+    loop_path = path + ".loop"
+    shutil.copy(path, loop_path)
+    cutoff = seed_data._ts(time.time())
+
+    def row_by_row():
+        with utils.get_conn(loop_path) as conn:
+            pending = conn.execute("SELECT id, collector_id, collection_id, amount FROM earnings WHERE status='pending' AND created_at <= ?",
+                                   (cutoff,)).fetchall()
+            owed = {}
+            for eid, cid, col, amount in pending:
+                conn.execute("UPDATE earnings SET status='paid', payment_date=CURRENT_TIMESTAMP WHERE id=?", (eid,))
+                conn.execute("UPDATE collections SET payment_status='paid' WHERE id=?", (col,))
+                conn.execute("UPDATE users SET total_earnings = total_earnings + ?, paid_earnings = paid_earnings + 1 WHERE id=?",
+                             (amount, cid))
+                owed[cid] = owed.get(cid, 0.0) + amount
+            conn.executemany("INSERT INTO transactions (user_id, amount, type, reference, status) VALUES (?, ?, 'payout', 'loop', 'completed')",
+                             list(owed.items()))
+        return len(pending)
+
+    def note(conn, i):
+        conn.execute("INSERT INTO notifications (user_id, title, message, type) VALUES (?, 'n', 'm', 'system_alert')", (ids[i % collectors],))
+
+    stop = threading.Event()
+    waits = []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            s, _ = timed(utils.write, note, i)
+            waits.append(s)
+            i += 1
+            time.sleep(0.005)
+
+    loop_s, loop_rows = timed(row_by_row)
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        batch_s, result = timed(payouts.run_payout, cutoff)
+    finally:
+        stop.set()
+        t.join()
+    rerun_s, _ = timed(payouts.run_payout, cutoff)
+    with utils.get_conn() as conn:
+        check = conn.execute("SELECT ROUND(SUM(total_earnings), 2), SUM(paid_earnings) FROM users").fetchone()
+    return {
+        "earnings": rows,
+        "row_by_row_s": round(loop_s, 2),
+        "set_based_s": round(batch_s, 2),
+        "speedup": round(loop_s / batch_s, 1),
+        "rerun_ms": round(rerun_s * 1000, 2),
+        "chunk": payouts.PAYOUT_CHUNK,
+        "writer_max_wait_ms": round(max(waits) * 1000, 1),
+        "paid": result["batch"]["earnings"],
+        "loop_paid": loop_rows,
+        "totals_match": abs(check[0] - result["batch"]["amount"]) < 1 and check[1] == result["batch"]["earnings"],
+    }
+
+
+# -------------------------
+# STARTUP
+# -------------------------
+IMPORT_BUDGET_MS = float(os.environ.get("WASTELINK_IMPORT_BUDGET_MS", "400"))
+# must not be loaded by `import api`; they load on first use
+LAZY_MODULES = ("requests", "httpx", "jac_client")
+
+_IMPORT_PROBE = """
+import sys, time
+t = time.perf_counter()
+import api
+print(time.perf_counter() - t, *[m for m in %r if m in sys.modules])
+""" % (LAZY_MODULES,)
+
+
+def _cold_import():
+    """Import api in a fresh interpreter with -X importtime. Returns (ms, eager lazy modules, slowest modules)."""
+    import subprocess
+
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", _IMPORT_PROBE], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    seconds, *loaded = out.stdout.split()
+    # children are listed before their parent: keep the direct children of `api`
+    children, slowest = [], []
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "api":
+                slowest = sorted(children, reverse=True)
+            children = []
+        elif depth == 1:
+            children.append((int(parts[1]) // 1000, name.strip()))
+    return float(seconds) * 1000, loaded, slowest[:5]
+
+
+@benchmark("startup")
+def bench_startup(runs=5):
+    """Cold `import api` in fresh interpreters, and schema init on a new, an up-to-date and the checked-in database."""
+    samples, eager, slowest = [], set(), []
+    for _ in range(runs):
+        ms, loaded, slowest = _cold_import()
+        samples.append(ms)
+        eager.update(loaded)
+    samples.sort()
+
+    fresh = os.path.join(tempfile.mkdtemp(prefix="wastelink-bench-"), "fresh.db")
+    create_s, _ = timed(utils.ensure_initialized, fresh)
+    utils._initialized.discard(fresh)          # as if in a new process
+    current_s, ran = timed(utils.ensure_initialized, fresh)
+    full_s, _ = timed(utils._initialize, fresh, True)   # what every import used to run
+    # first use against a copy of the checked-in (prototype) database: migrates it, must not raise
+    shipped = os.path.join(tempfile.mkdtemp(prefix="wastelink-bench-"), "shipped.db")
+    shutil.copyfile(SHIPPED_DB, shipped)
+    shipped_s, _ = timed(utils.ensure_initialized, shipped)
+    return {
+        "import_ms_median": round(samples[len(samples) // 2], 1),
+        "import_ms_max": round(samples[-1], 1),
+        "budget_ms": IMPORT_BUDGET_MS,
+        "within_budget": samples[len(samples) // 2] <= IMPORT_BUDGET_MS,
+        "eagerly_loaded": sorted(eager),
+        "slowest_imports_ms": slowest,
+        "init_new_db_ms": round(create_s * 1000, 2),
+        "init_current_db_ms": round(current_s * 1000, 3),
+        "init_current_db_ran_ddl": ran,
+        "full_ddl_ms": round(full_s * 1000, 2),
+        "init_shipped_db_ms": round(shipped_s * 1000, 2),
+    }
+
+
+# -------------------------
+# DISPATCH SNAPSHOT
+# -------------------------
+@benchmark("snapshot")
+def bench_snapshot(n=100000, k=30, calls=2000, changes=1000, seed=11):
+    """
+    Memory for n pending requests held as dicts vs the array snapshot, and
+    per-call latency of the dispatch reads (nearest, oldest-first, request
+    location) through SQLite + dicts vs the snapshot. `always_refresh`
+    checks the change log on every call (MAX_STALE_S = 0).
+    """
+    import random
+    import tracemalloc
+
+    from snapshot import PickupSnapshot
+
+    temp_db()
+    seed_pending(n)
+    rnd = random.Random(seed)
+    with utils.get_conn() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM pickup_requests")]
+        all_rows = "SELECT id, latitude, longitude, address FROM pickup_requests WHERE status='pending'"
+        tracemalloc.start()
+        as_dicts = [dict(r) for r in conn.execute(all_rows)]
+        dict_mb = tracemalloc.get_traced_memory()[0] / 2**20
+        tracemalloc.stop()
+        del as_dicts
+        tracemalloc.start()
+        snap = PickupSnapshot()
+        snap.rebuild(conn)
+        snap_mb = tracemalloc.get_traced_memory()[0] / 2**20
+        tracemalloc.stop()
+    fresh = PickupSnapshot(max_stale_s=0.0)
+    fresh.oldest_pending(1)
+    points = [(-1.2864 + rnd.uniform(-0.15, 0.15), 36.8172 + rnd.uniform(-0.15, 0.15)) for _ in range(calls)]
+    picks = [rnd.choice(ids) for _ in range(calls)]
+
+    def sql_nearest(lat, lng):
+        return scan_nearest(lat, lng, k)
+
+    def sql_oldest(_):
+        with utils.get_conn() as conn:
+            return [dict(r) for r in conn.execute(
+                "SELECT id, latitude, longitude, address FROM pickup_requests WHERE status='pending' ORDER BY requested_at LIMIT ?", (k,))]
+
+    def sql_location(request_id):
+        with utils.get_conn() as conn:
+            return conn.execute("SELECT latitude, longitude FROM pickup_requests WHERE id=?", (request_id,)).fetchone()
+
+    def lat_of(fn, args):
+        return latency_stats([timed(fn, *a)[0] for a in args])
+
+    assert [t["id"] for t in sql_nearest(*points[0])] == [t["id"] for t in snap.nearest_pending(*points[0], k)]
+    assert [t["id"] for t in sql_oldest(None)] == [t["id"] for t in snap.oldest_pending(k)]
+    out = {"pending": n, "k": k, "memory_mb": {
+        "dict_per_row": round(dict_mb, 1),
+        "snapshot": round(snap_mb, 1),
+        "ratio": round(dict_mb / snap_mb, 1),
+    }}
+    out["nearest"] = {
+        # reads every pending row, so a sample of the calls is enough
+        "sql_scan": lat_of(sql_nearest, points[:50]),
+        "snapshot": lat_of(lambda lat, lng: snap.nearest_pending(lat, lng, k), points),
+        "always_refresh": lat_of(lambda lat, lng: fresh.nearest_pending(lat, lng, k), points),
+    }
+    out["oldest"] = {
+        "sql": lat_of(sql_oldest, [(None,)] * calls),
+        "snapshot": lat_of(lambda _: snap.oldest_pending(k), [(None,)] * calls),
+    }
+    out["location"] = {
+        "sql": lat_of(sql_location, [(i,) for i in picks]),
+        "snapshot": lat_of(snap.location, [(i,) for i in picks]),
+    }
+
+    # incremental refresh after `changes` assignments, vs rebuilding
+    with utils.get_conn() as conn:
+        conn.executemany("UPDATE pickup_requests SET status='assigned', assigned_collector_id='c' WHERE id=?",
+                         [(i,) for i in rnd.sample(ids, changes)])
+        refresh_s, applied = timed(snap.refresh, conn)
+        rebuild_s, _ = timed(snap.rebuild, conn)
+    out["refresh"] = {"changes": applied, "refresh_ms": round(refresh_s * 1000, 2), "rebuild_ms": round(rebuild_s * 1000, 2)}
+    return out
+
+
+# -------------------------
+# API HARNESS
+# -------------------------
+API_SCALE = {"residents": 20000, "collectors": 500, "requests": 100000}
+
+
+def latency_stats(samples_s):
+    """Percentiles (ms) and single-caller throughput of a list of call durations in seconds."""
+    xs = sorted(samples_s)
+    if not xs:
+        return {"calls": 0}
+    pct = lambda p: round(xs[min(len(xs) - 1, int(p * len(xs)))] * 1000, 3)
+    return {
+        "calls": len(xs),
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p99_ms": pct(0.99),
+        "max_ms": round(xs[-1] * 1000, 3),
+        "throughput_per_s": round(len(xs) / sum(xs), 1),
+    }
+
+
+def jac_standin(target, params, root=None):
+    """Deterministic stand-in for the Jac walkers the API calls."""
+    import hashlib
+    import seed_data
+
+    if target.endswith("classify_image"):
+        h = int(hashlib.sha1(str(params.get("image_url")).encode()).hexdigest(), 16)
+        types = sorted(seed_data.WASTE_PRICES)
+        return {"waste_type": types[h % len(types)], "confidence": 0.9}
+    if target.endswith("classify_text"):
+        return {"result": "mixed", "confidence": 0.5}
+    if target.endswith("optimize_route"):
+        return params.get("locations", [])
+    return params
+
+
+@benchmark("api")
+def bench_api(calls=300, db=None, seed=3, **scale):
+    """
+    Latency percentiles and throughput of the main api_* endpoints against a
+    seeded city, with the local distance engine standing in for Google and
+    jac_standin for Jac. db= (or WASTELINK_BENCH_DB) runs against a copy of
+    a database built by seed_data.py instead of seeding one.
+    """
+    import random
+    import shutil
+
+    import jac_worker
+    import maps_client
+    import seed_data
+
+    db = db or os.environ.get("WASTELINK_BENCH_DB")
+    if db:
+        path = os.path.join(tempfile.mkdtemp(prefix="wastelink-bench-"), "bench.db")
+        shutil.copy(db, path)
+        utils.close_pools()
+        utils.DB_NAME = path
+        utils.init_db()
+    else:
+        path = temp_db()
+        with utils.get_conn() as conn:
+            seed_data.seed(conn, **{**API_SCALE, **scale})
+    import api
+
+    with utils.get_conn() as conn:
+        collectors = [tuple(r) for r in conn.execute("SELECT id, email, password_hash FROM users WHERE role='collector'")]
+        residents = [r[0] for r in conn.execute("SELECT id FROM users WHERE role='resident' LIMIT 5000")]
+        counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("users", "pickup_requests", "collections")}
+
+    photos = []
+    for i in range(20):
+        p = os.path.join(os.path.dirname(path), f"photo{i}.jpg")
+        with open(p, "wb") as f:
+            f.write(random.Random(i).randbytes(4096))
+        photos.append(p)
+
+    rnd = random.Random(seed)
+    lat0, lng0 = seed_data.CITY_CENTER
+    created = []
+
+    def point():
+        return lat0 + rnd.uniform(-0.1, 0.1), lng0 + rnd.uniform(-0.1, 0.1)
+
+    def create_args():
+        lat, lng = point()
+        return ({"resident_id": rnd.choice(residents), "latitude": lat, "longitude": lng, "address": "bench"},)
+
+    endpoints = [
+        ("api_auth", api.api_auth, lambda: rnd.choice(collectors)[1:]),
+        ("api_create_request", api.api_create_request, create_args),
+        ("api_get_tasks", api.api_get_tasks, lambda: (rnd.choice(collectors)[0],)),
+        ("api_assign_collector", api.api_assign_collector, lambda: (created[rnd.randrange(len(created))],)),
+        ("api_log_weight", api.api_log_weight, lambda: ({
+            "request_id": created.pop(), "collector_id": rnd.choice(collectors)[0],
+            "total_weight_kg": round(rnd.uniform(1, 40), 1), "waste_photo_url": rnd.choice(photos)},)),
+        ("api_optimize_route_for_collector", api.api_optimize_route_for_collector, lambda: (rnd.choice(collectors)[0],)),
+        ("api_get_stats", api.api_get_stats, lambda: ()),
+    ]
+
+    saved_key = maps_client.GOOGLE_API_KEY
+    maps_client.GOOGLE_API_KEY = None
+    jac_worker.use_backend(jac_standin)
+    out = {"dataset": counts}
+    try:
+        for name, fn, make_args in endpoints:
+            samples = []
+            for _ in range(calls):
+                args = make_args()
+                start = time.perf_counter()
+                result = fn(*args)
+                samples.append(time.perf_counter() - start)
+                if name == "api_create_request":
+                    created.append(result["request_id"])
+            out[name] = latency_stats(samples)
+    finally:
+        jac_worker.use_backend(None)
+        maps_client.GOOGLE_API_KEY = saved_key
+    return out
+
+
+# -------------------------
+# ENTRY POINT
+# -------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WasteLink backend benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--list", action="store_true", help="list available benchmarks")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(sorted(BENCHMARKS)))
+        return
+
+    results = {}
+    for name in args.names or sorted(BENCHMARKS):
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+        results[name] = BENCHMARKS[name]()
+        print(name, json.dumps(results[name]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": sys.version.split()[0],
+                "sqlite": sqlite3.sqlite_version,
+                "results": results,
+            }, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
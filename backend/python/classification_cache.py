@@ -0,0 +1,96 @@
+# classification_cache.py
+"""
+Persistent cache of image classification results keyed by content hash.
+
+Entries store the same JSON that goes into collections.ai_classification_data.
+Local files are keyed by the SHA-256 of their bytes, remote URLs by the URL.
+When Pillow is installed a 64-bit difference hash (dHash) is stored too, so
+re-encoded or resized copies of the same photo also hit.
+"""
+import hashlib
+import json
+import os
+
+from utils import get_conn, write
+
+CLASSIFICATION_CACHE = "classification_cache"
+
+try:
+    from PIL import Image
+    PIL_PRESENT = True
+except Exception:
+    Image = None
+    PIL_PRESENT = False
+
+
+# -------------------------
+# HASHING
+# -------------------------
+def _is_local(path):
+    return "://" not in str(path) and os.path.isfile(path)
+
+
+def content_hash(path):
+    if not _is_local(path):
+        return "url:" + hashlib.sha256(str(path).encode()).hexdigest()
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return "sha256:" + h.hexdigest()
+
+
+def perceptual_hash(path):
+    """64-bit dHash as 16 hex chars, or None without Pillow / for remote images."""
+    if not PIL_PRESENT or not _is_local(path):
+        return None
+    try:
+        with Image.open(path) as img:
+            px = list(img.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def image_keys(path):
+    return content_hash(path), perceptual_hash(path)
+
+
+# -------------------------
+# LOOKUP / STORE
+# -------------------------
+def lookup(keys):
+    """Map each (content_hash, phash) in `keys` to a cached result, where one exists."""
+    if not keys:
+        return {}
+    hashes = sorted({c for c, _ in keys})
+    phashes = sorted({p for _, p in keys if p})
+    with get_conn() as conn:
+        by_hash = dict(conn.execute(*lookup_query("content_hash", hashes)).fetchall())
+        by_phash = dict(conn.execute(*lookup_query("phash", phashes)).fetchall()) if phashes else {}
+    out = {}
+    for c, p in keys:
+        raw = by_hash.get(c) or (by_phash.get(p) if p else None)
+        if raw is not None:
+            out[(c, p)] = json.loads(raw)
+    return out
+
+
+def lookup_query(column, values):
+    """SQL and params for the cached results whose `column` (content_hash or phash) is one of `values`."""
+    return f"SELECT {column}, result FROM {CLASSIFICATION_CACHE} WHERE {column} IN ({','.join('?' * len(values))})", values
+
+
+def store(entries):
+    """entries: iterable of ((content_hash, phash), result)."""
+    rows = [(c, p, json.dumps(result)) for (c, p), result in entries]
+    if not rows:
+        return
+    write(lambda conn: conn.executemany(
+        f"INSERT OR REPLACE INTO {CLASSIFICATION_CACHE} (content_hash, phash, result) VALUES (?, ?, ?)",
+        rows,
+    ))
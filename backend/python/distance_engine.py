@@ -0,0 +1,106 @@
+# distance_engine.py
+"""
+Local many-to-many distance matrix.
+
+Great-circle distances are computed with NumPy broadcasting, scaled by a
+road factor to approximate street distance, and turned into ETAs with an
+average urban speed. Results use the same shape as the Google Distance
+Matrix response, so callers can swap one for the other.
+"""
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+# straight-line -> street distance, and average speed for ETAs
+ROAD_FACTOR = 1.3
+AVG_SPEED_KMH = 25.0
+
+
+# -------------------------
+# COORDINATES
+# -------------------------
+def parse_latlng(point):
+    """Accept "lat,lng" strings, (lat, lng) pairs or {"lat", "lng"} dicts."""
+    if isinstance(point, str):
+        lat, lng = point.split(",", 1)
+        return float(lat), float(lng)
+    if isinstance(point, dict):
+        return float(point.get("lat", point.get("latitude"))), float(point.get("lng", point.get("longitude")))
+    lat, lng = point
+    return float(lat), float(lng)
+
+
+def to_array(points):
+    """(n, 2) float array of lat/lng degrees."""
+    return np.array([parse_latlng(p) for p in points], dtype=np.float64).reshape(-1, 2)
+
+
+# -------------------------
+# DISTANCES
+# -------------------------
+def haversine_matrix(origins, destinations):
+    """(n, m) great-circle distances in meters between two (n, 2)/(m, 2) arrays."""
+    o = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    d = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+    lat1 = o[:, 0:1]
+    lat2 = d[:, 0][None, :]
+    dlat = lat2 - lat1
+    dlng = d[:, 1][None, :] - o[:, 1:2]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def road_matrix(origins, destinations, road_factor=ROAD_FACTOR, speed_kmh=AVG_SPEED_KMH):
+    """Estimated street distance (m) and travel time (s) matrices."""
+    meters = haversine_matrix(origins, destinations) * road_factor
+    seconds = meters / (speed_kmh / 3.6)
+    return meters, seconds
+
+
+def nearest_k(origin, destinations, k):
+    """Indices of the k destinations closest to a single origin, nearest first."""
+    dist = haversine_matrix(to_array([origin]), destinations)[0]
+    if k >= dist.size:
+        return np.argsort(dist, kind="stable")
+    idx = np.argpartition(dist, k)[:k]
+    return idx[np.argsort(dist[idx], kind="stable")]
+
+
+# -------------------------
+# GOOGLE-SHAPED RESPONSE
+# -------------------------
+def _distance_text(meters):
+    return f"{meters / 1000:.1f} km" if meters >= 1000 else f"{int(meters)} m"
+
+
+def _duration_text(seconds):
+    minutes = max(1, int(round(seconds / 60)))
+    if minutes < 60:
+        return f"{minutes} min" if minutes == 1 else f"{minutes} mins"
+    return f"{minutes // 60} h {minutes % 60} mins"
+
+
+def element(meters, seconds):
+    meters = int(round(meters))
+    seconds = int(round(seconds))
+    return {
+        "status": "OK",
+        "distance": {"text": _distance_text(meters), "value": meters},
+        "duration": {"text": _duration_text(seconds), "value": seconds},
+    }
+
+
+def local_distance_matrix(origin_list, destination_list, road_factor=ROAD_FACTOR, speed_kmh=AVG_SPEED_KMH):
+    """Offline stand-in for maps_client.get_distance_matrix."""
+    meters, seconds = road_matrix(to_array(origin_list), to_array(destination_list), road_factor, speed_kmh)
+    rows = [
+        {"elements": [element(m, s) for m, s in zip(meters[i].tolist(), seconds[i].tolist())]}
+        for i in range(meters.shape[0])
+    ]
+    return {
+        "status": "OK",
+        "origin_addresses": list(origin_list),
+        "destination_addresses": list(destination_list),
+        "rows": rows,
+        "source": "local",
+    }
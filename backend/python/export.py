@@ -0,0 +1,195 @@
+# export.py
+"""
+Streaming CSV / NDJSON exports of the money and audit tables.
+
+Rows are read in pages of PAGE_SIZE with keyset pagination, never
+OFFSET and never a whole-table fetchall(), and written out as each page
+arrives, so memory stays flat however large the table is. Every page is
+its own short read, so a long export never pins the WAL.
+
+- No filters: walk the table in rowid order (sequential reads).
+- Collector and/or date filters: walk (timestamp, rowid) through the
+  (owner, timestamp) or (timestamp) index from migration 8.
+
+Each export returns a cursor; passing it back resumes right after the last
+row written. Cursors are only valid with the same filters, and rowids can
+change after a VACUUM. Rows without a timestamp are only included in
+unfiltered exports.
+
+    python export.py earnings --format ndjson --collector <id> --from 2025-01-01 --to 2025-01-31 --out jan.ndjson
+"""
+import argparse
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import date, timedelta
+
+from utils import AUDIT_LOGS, COLLECTIONS, EARNINGS, TRANSACTIONS, get_conn
+
+PAGE_SIZE = 5000
+
+ExportSpec = namedtuple("ExportSpec", "table time_col owner_col")
+
+EXPORTS = {
+    "collections": ExportSpec(COLLECTIONS, "collected_at", "collector_id"),
+    "earnings": ExportSpec(EARNINGS, "created_at", "collector_id"),
+    "transactions": ExportSpec(TRANSACTIONS, "created_at", "user_id"),
+    "audit_logs": ExportSpec(AUDIT_LOGS, "created_at", "actor_id"),
+}
+
+FORMATS = ("csv", "ndjson")
+
+
+# -------------------------
+# PAGING
+# -------------------------
+def _spec(name):
+    if name not in EXPORTS:
+        raise ValueError(f"unknown export: {name} (choose from {', '.join(EXPORTS)})")
+    return EXPORTS[name]
+
+
+def _day_after(iso_day):
+    return (date.fromisoformat(iso_day) + timedelta(days=1)).isoformat()
+
+
+def page_query(spec, owner, start_date, end_date, cursor, page_size):
+    """SQL and params for the page after `cursor`; the first selected column is the rowid."""
+    keyed_by_time = bool(owner or start_date or end_date)
+    where, params = [], []
+    if owner:
+        where.append(f"{spec.owner_col} = ?")
+        params.append(owner)
+    if keyed_by_time:
+        if cursor:
+            last_time, _, last_rowid = cursor.rpartition("|")
+            where.append(f"({spec.time_col}, rowid) > (?, ?)")
+            params += [last_time, int(last_rowid)]
+        else:
+            where.append(f"{spec.time_col} >= ?")
+            params.append(start_date or "")
+        if end_date:
+            where.append(f"{spec.time_col} < ?")
+            params.append(_day_after(end_date))
+        order = f"{spec.time_col}, rowid"
+    else:
+        where.append("rowid > ?")
+        params.append(int(cursor) if cursor else 0)
+        order = "rowid"
+    sql = f"SELECT rowid, * FROM {spec.table} WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?"
+    return sql, params + [page_size], keyed_by_time
+
+
+def pages(name, collector_id=None, start_date=None, end_date=None, cursor=None, page_size=PAGE_SIZE):
+    """
+    Yield (columns, rows, cursor) one page at a time; rows are tuples without
+    the rowid and cursor resumes after the page's last row. The table name and
+    dates are checked here, before the first page is read.
+    """
+    spec = _spec(name)
+    for day in (start_date, end_date):
+        if day:
+            date.fromisoformat(day)
+    return _pages(spec, collector_id, start_date, end_date, cursor, page_size)
+
+
+def _pages(spec, collector_id, start_date, end_date, cursor, page_size):
+    time_index = None
+    while True:
+        sql, params, keyed_by_time = page_query(spec, collector_id, start_date, end_date, cursor, page_size)
+        with get_conn() as conn:
+            cur = conn.execute(sql, params)
+            columns = [d[0] for d in cur.description[1:]]
+            rows = cur.fetchall()
+        if not rows:
+            return
+        if time_index is None:
+            time_index = columns.index(spec.time_col)
+        last = rows[-1]
+        cursor = f"{last[time_index + 1]}|{last[0]}" if keyed_by_time else str(last[0])
+        yield columns, [tuple(r)[1:] for r in rows], cursor
+        if len(rows) < page_size:
+            return
+
+
+# -------------------------
+# FORMATS
+# -------------------------
+def _csv_chunks(page_iter, header=True):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for columns, rows, _ in page_iter:
+        if header:
+            writer.writerow(columns)
+            header = False
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _ndjson_chunks(page_iter, header=True):
+    for columns, rows, _ in page_iter:
+        yield "".join(json.dumps(dict(zip(columns, r)), default=str) + "\n" for r in rows)
+
+
+def _renderer(fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    return _csv_chunks if fmt == "csv" else _ndjson_chunks
+
+
+def chunks(name, fmt="csv", **filters):
+    """Yield the export as text chunks (one per page), e.g. for a streaming HTTP response."""
+    return _renderer(fmt)(pages(name, **filters), header=not filters.get("cursor"))
+
+
+def export(name, out, fmt="csv", max_rows=None, **filters):
+    """
+    Write an export to `out` (a path or a text file object). Stops after about
+    max_rows rows (whole pages) if given. Returns {"rows", "next_cursor"};
+    next_cursor is None once the export is complete. Resuming with a cursor
+    appends to a path and skips the CSV header.
+    """
+    render = _renderer(fmt)
+    page_iter = pages(name, **filters)
+    resuming = bool(filters.get("cursor"))
+    if isinstance(out, str):
+        fh = open(out, "a" if resuming else "w", newline="", encoding="utf-8")
+    else:
+        fh = out
+    state = {"rows": 0, "cursor": filters.get("cursor"), "done": True}
+
+    def counted():
+        for columns, rows, cursor in page_iter:
+            state["rows"] += len(rows)
+            state["cursor"] = cursor
+            yield columns, rows, cursor
+            if max_rows and state["rows"] >= max_rows:
+                state["done"] = False
+                return
+
+    try:
+        for chunk in render(counted(), header=not resuming):
+            fh.write(chunk)
+    finally:
+        if fh is not out:
+            fh.close()
+    return {"rows": state["rows"], "next_cursor": None if state["done"] else state["cursor"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a WasteLink table as CSV or NDJSON")
+    parser.add_argument("table", choices=sorted(EXPORTS))
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--collector", help="collector_id / user_id / actor_id to filter on")
+    parser.add_argument("--from", dest="start_date", help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end_date", help="last day (inclusive), YYYY-MM-DD")
+    parser.add_argument("--cursor", help="resume after this cursor")
+    parser.add_argument("--max-rows", type=int)
+    args = parser.parse_args()
+    result = export(args.table, args.out, args.format, max_rows=args.max_rows, collector_id=args.collector,
+                    start_date=args.start_date, end_date=args.end_date, cursor=args.cursor)
+    print(json.dumps(result))
@@ -0,0 +1,445 @@
+# instrumentation.py
+"""
+Per-endpoint timings, SQL counts and external-call histograms.
+
+Off by default; set WASTELINK_METRICS=1 or call enable(). While disabled
+every hook is a single flag check, so the wrappers stay in place for good,
+and connections are plain sqlite3 ones.
+
+- instrument_endpoints(namespace) wraps every api_* function (sync or
+  async). Each outermost call records its latency plus the SQL statements,
+  rows and SQLite VM work it caused, and time spent in each external
+  service.
+- While enabled, utils.connect() builds connections with
+  InstrumentedConnection, so all SQL is timed without touching call
+  sites. Pooled connections opened before enable()/disable() are
+  replaced the next time they are borrowed.
+- @external("google"|"jac", ...) wraps the HTTP and Jac call points.
+- count_cache() records cache hits/misses; the route cache and the text
+  classifier memo are read directly at snapshot time.
+
+prometheus_text() renders everything in the Prometheus text format. Calls
+slower than WASTELINK_SLOW_MS (default 500) go to the "wastelink.slow"
+logger as one JSON line with the time breakdown.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+ENABLED = os.environ.get("WASTELINK_METRICS", "0") == "1"
+SLOW_CALL_S = float(os.environ.get("WASTELINK_SLOW_MS", "500")) / 1000.0
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 10000)
+
+# the progress handler fires every this many SQLite VM instructions
+VM_STEP_UNIT = 1000
+
+slow_log = logging.getLogger("wastelink.slow")
+
+_call = contextvars.ContextVar("wastelink_call", default=None)
+
+
+def enable(slow_ms=None):
+    global ENABLED, SLOW_CALL_S
+    ENABLED = True
+    if slow_ms is not None:
+        SLOW_CALL_S = slow_ms / 1000.0
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+# -------------------------
+# METRIC TYPES
+# -------------------------
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.n += 1
+
+
+class Registry:
+    """Histograms and counters keyed by (metric name, sorted label pairs)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram(buckets)
+            h.observe(value)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+REGISTRY = Registry()
+
+HELP = {
+    "wastelink_endpoint_seconds": ("histogram", "api_* call latency"),
+    "wastelink_endpoint_queries": ("histogram", "SQL statements per api_* call"),
+    "wastelink_endpoint_rows": ("histogram", "rows returned or changed per api_* call"),
+    "wastelink_endpoint_vm_steps": ("histogram", f"SQLite VM work per api_* call, in units of {VM_STEP_UNIT} instructions"),
+    "wastelink_endpoint_errors_total": ("counter", "api_* calls that raised"),
+    "wastelink_sql_seconds": ("histogram", "SQL statement execution time by statement kind"),
+    "wastelink_external_seconds": ("histogram", "external call latency (Google, Jac)"),
+    "wastelink_external_errors_total": ("counter", "external calls that raised"),
+    "wastelink_cache_requests_total": ("counter", "cache lookups by result"),
+    "wastelink_job_wait_seconds": ("histogram", "time from enqueue to a worker starting a background job"),
+    "wastelink_job_run_seconds": ("histogram", "background job run time"),
+    "wastelink_jobs_total": ("counter", "background job runs by outcome (done, retry, failed, stale)"),
+    "wastelink_job_queue_depth": ("gauge", "background jobs in the table by queue and status"),
+    "wastelink_audit_buffered": ("gauge", "audit entries waiting to be written"),
+    "wastelink_audit_wait_seconds": ("histogram", "time a caller blocked on a full audit buffer"),
+    "wastelink_audit_dropped_total": ("counter", "audit entries dropped after waiting on a full buffer"),
+}
+
+
+# -------------------------
+# CALL CONTEXT
+# -------------------------
+class _CallStats:
+    __slots__ = ("queries", "rows", "vm_steps", "sql_s", "external")
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.vm_steps = 0
+        self.sql_s = 0.0
+        self.external = {}
+
+
+def _begin():
+    if _call.get() is not None:
+        return None, None
+    stats = _CallStats()
+    return stats, _call.set(stats)
+
+
+def _finish(name, stats, token, elapsed, failed):
+    labels = {"endpoint": name}
+    REGISTRY.observe("wastelink_endpoint_seconds", labels, elapsed)
+    if failed:
+        REGISTRY.inc("wastelink_endpoint_errors_total", labels)
+    if stats is None:
+        return
+    _call.reset(token)
+    REGISTRY.observe("wastelink_endpoint_queries", labels, stats.queries, COUNT_BUCKETS)
+    REGISTRY.observe("wastelink_endpoint_rows", labels, stats.rows, COUNT_BUCKETS)
+    REGISTRY.observe("wastelink_endpoint_vm_steps", labels, stats.vm_steps, COUNT_BUCKETS)
+    if elapsed >= SLOW_CALL_S:
+        slow_log.warning(json.dumps({
+            "endpoint": name,
+            "ms": round(elapsed * 1000, 1),
+            "sql_ms": round(stats.sql_s * 1000, 1),
+            "queries": stats.queries,
+            "rows": stats.rows,
+            "vm_steps": stats.vm_steps * VM_STEP_UNIT,
+            "external_ms": {k: round(v * 1000, 1) for k, v in stats.external.items()},
+            "failed": failed,
+        }))
+
+
+def instrumented(fn, name=None):
+    """Wrap one endpoint. Nested endpoint calls are timed but count towards the outer call."""
+    name = name or fn.__name__
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if not ENABLED:
+                return await fn(*args, **kwargs)
+            stats, token = _begin()
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = await fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _finish(name, stats, token, time.perf_counter() - start, failed)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        stats, token = _begin()
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _finish(name, stats, token, time.perf_counter() - start, failed)
+    return wrapper
+
+
+def instrument_endpoints(namespace, prefix="api_"):
+    """Replace every callable `prefix*` in a module namespace with its instrumented wrapper."""
+    for name, obj in list(namespace.items()):
+        if name.startswith(prefix) and inspect.isfunction(obj) and not getattr(obj, "_instrumented", False):
+            wrapped = instrumented(obj)
+            wrapped._instrumented = True
+            namespace[name] = wrapped
+
+
+# -------------------------
+# EXTERNAL CALLS
+# -------------------------
+def _record_external(service, kind, elapsed, failed):
+    labels = {"service": service, "call": kind}
+    REGISTRY.observe("wastelink_external_seconds", labels, elapsed)
+    if failed:
+        REGISTRY.inc("wastelink_external_errors_total", labels)
+    stats = _call.get()
+    if stats is not None:
+        stats.external[service] = stats.external.get(service, 0.0) + elapsed
+
+
+def external(service, kind_of):
+    """Time calls to another service; kind_of(*args, **kwargs) names the call for the `call` label."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await fn(*args, **kwargs)
+                start = time.perf_counter()
+                failed = True
+                try:
+                    result = await fn(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    _record_external(service, kind_of(*args, **kwargs), time.perf_counter() - start, failed)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _record_external(service, kind_of(*args, **kwargs), time.perf_counter() - start, failed)
+        return wrapper
+    return decorate
+
+
+def count_cache(cache, hits=0, misses=0):
+    if not ENABLED:
+        return
+    if hits:
+        REGISTRY.inc("wastelink_cache_requests_total", {"cache": cache, "result": "hit"}, hits)
+    if misses:
+        REGISTRY.inc("wastelink_cache_requests_total", {"cache": cache, "result": "miss"}, misses)
+
+
+# -------------------------
+# SQLITE
+# -------------------------
+def _statement_kind(sql):
+    head = sql.lstrip().split(None, 1)
+    return head[0].upper() if head else "?"
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+
+    def _timed(self, method, sql, *args):
+        if not ENABLED:
+            return method(sql, *args)
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            REGISTRY.observe("wastelink_sql_seconds", {"statement": _statement_kind(sql)}, elapsed)
+            stats = _call.get()
+            if stats is not None:
+                stats.queries += 1
+                stats.sql_s += elapsed
+                if self.rowcount > 0:
+                    stats.rows += self.rowcount
+
+    def execute(self, sql, *args):
+        return self._timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(super().executemany, sql, *args)
+
+    def _count_rows(self, n):
+        if ENABLED and n:
+            stats = _call.get()
+            if stats is not None:
+                stats.rows += n
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count_rows(row is not None)
+        return row
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._count_rows(1)
+        return row
+
+
+def _on_progress():
+    stats = _call.get() if ENABLED else None
+    if stats is not None:
+        stats.vm_steps += 1
+    return 0
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute's) are InstrumentedCursor."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_progress_handler(_on_progress, VM_STEP_UNIT)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # the C implementations of these skip cursor(), so route them through it
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+# -------------------------
+# EXPORT
+# -------------------------
+def _pull_caches():
+    """Counters kept by the caches themselves."""
+    out = []
+    try:
+        from route_cache import ROUTE_CACHE
+        stats = ROUTE_CACHE.stats()
+        out += [("route_memory", "hit", stats["memory_hits"]), ("route_db", "hit", stats["db_hits"]),
+                ("route", "miss", stats["misses"])]
+    except Exception:
+        pass
+    try:
+        from text_classifier import get_classifier
+        info = get_classifier().cache_info()
+        out += [("text_classifier_memo", "hit", info.hits), ("text_classifier_memo", "miss", info.misses)]
+    except Exception:
+        pass
+    return out
+
+
+def _pull_gauges():
+    """Values read at snapshot time: (name, labels, value)."""
+    out = []
+    try:
+        import jobs
+        from utils import get_conn
+        with get_conn() as conn:
+            for queue, counts in jobs.stats(conn).items():
+                out += [("wastelink_job_queue_depth", {"queue": queue, "status": status}, counts[status])
+                        for status in ("queued", "running", "failed")]
+    except Exception:
+        pass
+    audit = sys.modules.get("audit")
+    if audit is not None:
+        out.append(("wastelink_audit_buffered", {}, audit.WRITER.pending()))
+    return out
+
+
+def _labels(pairs, extra=()):
+    items = list(pairs) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _fmt(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def prometheus_text():
+    """Snapshot of every metric in the Prometheus text exposition format."""
+    with REGISTRY._lock:
+        histograms = {k: (list(h.buckets), list(h.counts), h.total, h.n) for k, h in REGISTRY.histograms.items()}
+        counters = dict(REGISTRY.counters)
+    for cache, result, value in _pull_caches():
+        key = ("wastelink_cache_requests_total", tuple(sorted({"cache": cache, "result": result}.items())))
+        counters[key] = counters.get(key, 0) + value
+    gauges = {(name, tuple(sorted(labels.items()))): value for name, labels, value in _pull_gauges()}
+
+    lines = []
+    seen = set()
+
+    def header(name):
+        if name not in seen:
+            seen.add(name)
+            kind, text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), (buckets, counts, total, n) in sorted(histograms.items()):
+        header(name)
+        cumulative = 0
+        for bound, c in zip(buckets, counts):
+            cumulative += c
+            lines.append(f"{name}_bucket{_labels(labels, [('le', _fmt(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {n}")
+        lines.append(f"{name}_sum{_labels(labels)} {_fmt(total)}")
+        lines.append(f"{name}_count{_labels(labels)} {n}")
+    for (name, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+        header(name)
+        lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,512 @@
+# jac_worker.py
+"""
+Long-lived Jac worker processes.
+
+Instead of paying interpreter start-up and Jac program load on every
+`jac run ...`, the Python side keeps a small pool of worker processes and
+talks to them over stdin/stdout, one JSON object per line:
+
+    -> {"id": 1, "target": "WasteNode.classify_image", "params": {...}, "root": null}
+    <- {"id": 1, "ok": true, "result": {...}}
+    <- {"id": 1, "ok": false, "error": "..."}
+
+Each worker imports the Jac modules in JAC_DIR once at start-up through
+jaclang's in-process API (JacProgram) and serves every call from them: a
+walker target is spawned on the root node, `Node.ability` calls the
+ability on a fresh node. Only calls against a persisted graph (`root`)
+still go through the `jac` CLI. Crashed or hung workers are replaced on
+the next call.
+
+    python jac_worker.py              # serve on stdin/stdout
+    python jac_worker.py --once T P   # load the program, run one call and exit
+
+AsyncJacWorkerPool speaks the same protocol to processes started with
+asyncio.create_subprocess_exec, for callers running on an event loop.
+"""
+import asyncio
+import glob
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from itertools import count
+
+from instrumentation import external
+
+POOL_SIZE = int(os.environ.get("JAC_WORKERS", "2"))
+CALL_TIMEOUT_S = float(os.environ.get("JAC_CALL_TIMEOUT", "30"))
+START_TIMEOUT_S = 15.0
+# set JAC_WORKER_POOL=0 to go back to one `jac run` subprocess per call
+POOL_ENABLED = os.environ.get("JAC_WORKER_POOL", "1") != "0"
+
+WORKER_CMD = [sys.executable, "-u", os.path.abspath(__file__)]
+JAC_DIR = os.environ.get("WASTELINK_JAC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "jac"))
+
+ECHO_TARGET = "__echo__"
+# answers with what the worker loaded: {"jaclang", "modules", "failed", "archetypes", "load_ms"}
+INFO_TARGET = "__info__"
+
+
+class JacWorkerError(RuntimeError):
+    pass
+
+
+class JacWorkerTimeout(JacWorkerError):
+    pass
+
+
+def parse_jac_output(out):
+    """First JSON line of `jac run` output, else the raw text."""
+    for line in out.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            return json.loads(line)
+        except Exception:
+            continue
+    return {"raw": out}
+
+
+def spawn_call(target, params=None, root=None, timeout=CALL_TIMEOUT_S):
+    """The original path: one `jac run` subprocess per call."""
+    cmd = ["jac", "run", target, json.dumps(params or {})]
+    if root:
+        cmd.extend(["--root", root])
+    try:
+        out = subprocess.check_output(cmd, text=True, stderr=subprocess.STDOUT, timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        raise JacWorkerError(f"jac CLI failed: {getattr(e, 'output', str(e))}")
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise JacWorkerError(f"jac CLI failed: {e}")
+    return parse_jac_output(out)
+
+
+# -------------------------
+# WORKER PROCESS SIDE
+# -------------------------
+class JacProgram:
+    """The Jac modules of one directory, imported once with jaclang and kept loaded."""
+
+    def __init__(self, base_path=JAC_DIR):
+        start = time.perf_counter()
+        self.base_path = os.path.abspath(base_path)
+        self.archetypes = {}
+        self.modules = []
+        self.failed = {}
+        try:
+            from jaclang.runtimelib.archetype import WalkerArchetype
+            from jaclang.runtimelib.machine import JacMachineInterface as Jac
+        except ImportError:
+            self.jac = None
+        else:
+            self.jac, self._walker = Jac, WalkerArchetype
+            for path in sorted(glob.glob(os.path.join(self.base_path, "*.jac"))):
+                name = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    mod = Jac.jac_import(target=name, base_path=self.base_path)[0]
+                except Exception as e:
+                    self.failed[name] = str(e)
+                    continue
+                self.modules.append(name)
+                for attr, value in vars(mod).items():
+                    if isinstance(value, type):
+                        self.archetypes.setdefault(attr, value)
+        self.load_ms = (time.perf_counter() - start) * 1000
+
+    def info(self):
+        return {"jaclang": self.jac is not None, "modules": self.modules, "failed": self.failed,
+                "archetypes": len(self.archetypes), "load_ms": round(self.load_ms, 1)}
+
+    def run(self, target, params):
+        if self.jac is None:
+            raise JacWorkerError("jaclang is not installed in the jac worker")
+        name, _, ability = target.partition(".")
+        arch = self.archetypes.get(name)
+        if arch is None:
+            raise JacWorkerError(f"unknown Jac target: {target}")
+        if issubclass(arch, self._walker):
+            walker = self.jac.spawn(arch(**params), self.jac.root())
+            reports = getattr(walker, "reports", None) or []
+            return reports[0] if len(reports) == 1 else reports
+        method = getattr(arch(), ability, None)
+        if method is None:
+            raise JacWorkerError(f"unknown Jac target: {target}")
+        return method(**params)
+
+
+def _handle(program, req):
+    target = req.get("target")
+    params = req.get("params") or {}
+    if req.get("op") == "ping" or target == ECHO_TARGET:
+        return params
+    if target == INFO_TARGET:
+        return program.info()
+    if req.get("root"):
+        # a persisted graph lives with the CLI's session, not in this process
+        return spawn_call(target, params, req.get("root"))
+    return program.run(target, params)
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    # anything the Jac program prints must not corrupt the protocol stream
+    sys.stdout = sys.stderr
+    program = JacProgram()
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        req = {}
+        try:
+            req = json.loads(line)
+            resp = {"id": req.get("id"), "ok": True, "result": _handle(program, req)}
+        except Exception as e:
+            resp = {"id": req.get("id"), "ok": False, "error": str(e)}
+        stdout.write(json.dumps(resp, default=str) + "\n")
+        stdout.flush()
+
+
+# -------------------------
+# PYTHON SIDE
+# -------------------------
+class JacWorker:
+    """One worker process plus a reader thread feeding its responses into a queue."""
+
+    def __init__(self, cmd=None):
+        self.cmd = cmd or WORKER_CMD
+        self.proc = None
+        self.responses = None
+        self.calls = 0
+        self.start()
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1,
+        )
+        self.responses = queue.Queue()
+        threading.Thread(target=self._read, args=(self.proc, self.responses), daemon=True).start()
+
+    @staticmethod
+    def _read(proc, responses):
+        for line in proc.stdout:
+            try:
+                responses.put(json.loads(line))
+            except ValueError:
+                continue
+        responses.put(None)  # EOF: the process died
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=1)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def call(self, req, timeout):
+        try:
+            self.proc.stdin.write(json.dumps(req) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            raise JacWorkerError(f"jac worker crashed: {e}")
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                resp = self.responses.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise JacWorkerTimeout(f"jac worker call timed out after {timeout}s")
+            if resp is None:
+                raise JacWorkerError("jac worker crashed")
+            if resp.get("id") == req["id"]:
+                self.calls += 1
+                return resp
+            # a late answer to a call that already timed out; drop it
+
+
+class JacWorkerPool:
+
+    def __init__(self, size=POOL_SIZE, cmd=None, call_timeout=CALL_TIMEOUT_S):
+        self.size = size
+        self.cmd = cmd
+        self.call_timeout = call_timeout
+        self._idle = queue.Queue()
+        self._ids = count(1)
+        self._workers = []
+        self.restarts = 0
+        for _ in range(size):
+            w = JacWorker(cmd)
+            self._workers.append(w)
+            self._idle.put(w)
+
+    def call(self, target, params=None, root=None, timeout=None):
+        """
+        Run `target` on an idle worker. Blocks while all workers are busy,
+        which is what bounds concurrency. Returns the walker result.
+        """
+        timeout = timeout or self.call_timeout
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise JacWorkerTimeout("no jac worker became available")
+        try:
+            if not worker.alive():
+                self._restart(worker)
+            req = {"id": next(self._ids), "target": target, "params": params or {}, "root": root}
+            try:
+                resp = worker.call(req, timeout)
+            except JacWorkerError:
+                # state unknown after a crash or timeout: replace the process
+                self._restart(worker)
+                raise
+        finally:
+            self._idle.put(worker)
+        if not resp.get("ok"):
+            raise JacWorkerError(resp.get("error", "jac worker call failed"))
+        return resp.get("result")
+
+    def _restart(self, worker):
+        self.restarts += 1
+        worker.restart()
+
+    def ping(self, timeout=5.0):
+        try:
+            return self.call(ECHO_TARGET, {"ping": True}, timeout=timeout) == {"ping": True}
+        except JacWorkerError:
+            return False
+
+    def health(self):
+        return {
+            "size": self.size,
+            "alive": sum(1 for w in self._workers if w.alive()),
+            "idle": self._idle.qsize(),
+            "restarts": self.restarts,
+            "calls": sum(w.calls for w in self._workers),
+        }
+
+    def close(self):
+        for w in self._workers:
+            w.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = JacWorkerPool()
+    return _pool
+
+
+# set through use_backend(); replaces the workers with an in-process function
+_backend = None
+
+
+def use_backend(fn):
+    """
+    Route jac_call/jac_call_async through fn(target, params, root) instead of
+    Jac, e.g. a deterministic stand-in for benchmarks. use_backend(None) undoes it.
+    """
+    global _backend
+    _backend = fn
+
+
+@external("jac", lambda target, *args, **kwargs: target)
+def jac_call(target, params=None, root=None, timeout=None):
+    """Run a Jac walker through the worker pool (or a fresh subprocess if disabled)."""
+    if _backend is not None:
+        return _backend(target, params or {}, root)
+    if not POOL_ENABLED:
+        return spawn_call(target, params, root, timeout or CALL_TIMEOUT_S)
+    return get_pool().call(target, params, root, timeout)
+
+
+# -------------------------
+# ASYNC PYTHON SIDE
+# -------------------------
+async def spawn_call_async(target, params=None, root=None, timeout=CALL_TIMEOUT_S):
+    """spawn_call() without blocking the loop; the process is killed on timeout or cancel."""
+    cmd = ["jac", "run", target, json.dumps(params or {})]
+    if root:
+        cmd.extend(["--root", root])
+    try:
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        raise JacWorkerError(f"jac CLI failed: {e}")
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise JacWorkerTimeout(f"jac CLI timed out after {timeout}s")
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    out = out.decode(errors="replace")
+    if proc.returncode:
+        raise JacWorkerError(f"jac CLI failed: {out}")
+    return parse_jac_output(out)
+
+
+class AsyncJacWorker:
+    """One worker process driven through asyncio pipes; started on first use."""
+
+    def __init__(self, cmd=None):
+        self.cmd = cmd or WORKER_CMD
+        self.proc = None
+        self.calls = 0
+
+    def alive(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+
+    async def stop(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+    async def call(self, req):
+        try:
+            self.proc.stdin.write((json.dumps(req) + "\n").encode())
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise JacWorkerError(f"jac worker crashed: {e}")
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                raise JacWorkerError("jac worker crashed")
+            try:
+                resp = json.loads(line)
+            except ValueError:
+                continue
+            if resp.get("id") == req["id"]:
+                self.calls += 1
+                return resp
+
+
+class AsyncJacWorkerPool:
+    """
+    JacWorkerPool for one event loop. A call that times out, fails or is
+    cancelled mid-flight kills its worker, since the process may still be
+    busy with the abandoned walker; it is restarted on the next call.
+    """
+
+    def __init__(self, size=POOL_SIZE, cmd=None, call_timeout=CALL_TIMEOUT_S):
+        self.size = size
+        self.call_timeout = call_timeout
+        self._idle = asyncio.Queue()
+        self._ids = count(1)
+        self._workers = [AsyncJacWorker(cmd) for _ in range(size)]
+        self.restarts = 0
+        for w in self._workers:
+            self._idle.put_nowait(w)
+
+    async def call(self, target, params=None, root=None, timeout=None):
+        timeout = timeout or self.call_timeout
+        try:
+            worker = await asyncio.wait_for(self._idle.get(), timeout)
+        except asyncio.TimeoutError:
+            raise JacWorkerTimeout("no jac worker became available")
+        try:
+            if not worker.alive():
+                if worker.proc is not None:
+                    await self._discard(worker)
+                await worker.start()
+            req = {"id": next(self._ids), "target": target, "params": params or {}, "root": root}
+            try:
+                resp = await asyncio.wait_for(worker.call(req), timeout)
+            except asyncio.TimeoutError:
+                await self._discard(worker)
+                raise JacWorkerTimeout(f"jac worker call timed out after {timeout}s")
+            except BaseException:
+                await asyncio.shield(self._discard(worker))
+                raise
+        finally:
+            self._idle.put_nowait(worker)
+        if not resp.get("ok"):
+            raise JacWorkerError(resp.get("error", "jac worker call failed"))
+        return resp.get("result")
+
+    async def _discard(self, worker):
+        self.restarts += 1
+        await worker.stop()
+
+    async def ping(self, timeout=5.0):
+        try:
+            return await self.call(ECHO_TARGET, {"ping": True}, timeout=timeout) == {"ping": True}
+        except JacWorkerError:
+            return False
+
+    def health(self):
+        return {
+            "size": self.size,
+            "alive": sum(1 for w in self._workers if w.alive()),
+            "idle": self._idle.qsize(),
+            "restarts": self.restarts,
+            "calls": sum(w.calls for w in self._workers),
+        }
+
+    async def close(self):
+        for w in self._workers:
+            await w.stop()
+
+
+_async_pools = weakref.WeakKeyDictionary()
+
+
+def get_async_pool():
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = _async_pools[loop] = AsyncJacWorkerPool()
+    return pool
+
+
+async def close_async_pool():
+    pool = _async_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+@external("jac", lambda target, *args, **kwargs: target)
+async def jac_call_async(target, params=None, root=None, timeout=None):
+    """jac_call() for asyncio callers."""
+    if _backend is not None:
+        return _backend(target, params or {}, root)
+    if not POOL_ENABLED:
+        return await spawn_call_async(target, params, root, timeout or CALL_TIMEOUT_S)
+    return await get_async_pool().call(target, params, root, timeout)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--once":
+        target = sys.argv[2] if len(sys.argv) > 2 else ECHO_TARGET
+        params = json.loads(sys.argv[3]) if len(sys.argv) > 3 else {}
+        print(json.dumps(_handle(JacProgram(), {"target": target, "params": params}), default=str))
+    else:
+        serve()
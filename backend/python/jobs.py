@@ -0,0 +1,281 @@
+# jobs.py
+"""
+Durable background jobs in SQLite.
+
+A job is a row in `jobs`: queue name, JSON payload, attempts and the time it
+may next run. enqueue() is an INSERT, so a job written in the same
+transaction as the data it refers to is committed (or rolled back) with it.
+
+- Claiming is one UPDATE ... RETURNING that marks the job 'running' and
+  pushes run_after to now + visibility timeout. A worker that dies mid-job
+  simply lets the lease run out and another worker claims it again, so
+  handlers must be safe to run twice.
+- A handler that raises is retried with exponential backoff; after
+  max_attempts the job stays in the table as 'failed' with its last error.
+  Finished jobs are deleted.
+- Finishing a job is guarded by its attempt number, so a worker whose lease
+  expired cannot overwrite the outcome of the retry.
+
+Each JobQueue runs a small pool of worker threads, started as soon as the
+process opens the database (utils.ensure_initialized) so jobs left queued by
+an earlier run are picked up without waiting for a new enqueue(). Startup
+also hands expired leases back to the queue.
+WASTELINK_JOB_WORKERS=0 leaves the work to a separate `python jobs.py`
+process. Wait and run times, outcomes and queue depth are exported through
+instrumentation.
+
+    python jobs.py        # work every registered queue until interrupted
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+import instrumentation
+from instrumentation import REGISTRY
+import utils
+from utils import write
+
+JOBS = "jobs"
+
+WORKERS = int(os.environ.get("WASTELINK_JOB_WORKERS", "2"))
+VISIBILITY_S = float(os.environ.get("WASTELINK_JOB_VISIBILITY_S", "120"))
+MAX_ATTEMPTS = int(os.environ.get("WASTELINK_JOB_MAX_ATTEMPTS", "5"))
+POLL_INTERVAL_S = float(os.environ.get("WASTELINK_JOB_POLL_MS", "500")) / 1000.0
+BACKOFF_S = 2.0
+MAX_BACKOFF_S = 300.0
+
+# the IN terms match idx_jobs_ready's WHERE, so SQLite can use that partial index
+CLAIM_SQL = f"""
+    UPDATE {JOBS} SET status = 'running', attempts = attempts + 1, run_after = ?
+    WHERE id IN (
+        SELECT id FROM {JOBS} WHERE queue = ? AND status IN ('queued','running') AND run_after <= ?
+        ORDER BY run_after, id LIMIT ?)
+    RETURNING id, queue, payload, attempts, max_attempts, enqueued_at
+"""
+RECLAIM_SQL = f"""
+    UPDATE {JOBS} SET status = 'queued'
+    WHERE queue = ? AND status IN ('queued','running') AND run_after <= ? AND status = 'running'
+"""
+
+Job = namedtuple("Job", "id queue payload attempts max_attempts enqueued_at")
+
+
+def _backoff(attempts):
+    return min(MAX_BACKOFF_S, BACKOFF_S * 2 ** (attempts - 1))
+
+
+# -------------------------
+# QUEUE
+# -------------------------
+class JobQueue:
+    """One named queue: enqueue, claim and finish jobs, plus its worker threads."""
+
+    def __init__(self, name, handler, workers=WORKERS, visibility_s=VISIBILITY_S,
+                 max_attempts=MAX_ATTEMPTS, poll_interval=POLL_INTERVAL_S):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.visibility_s = visibility_s
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def enqueue(self, payload, conn=None, delay=0.0):
+        """
+        Add a job and return its id. Pass `conn` to enqueue inside the
+        caller's transaction; call wake() once it has committed.
+        """
+        now = time.time()
+        row = (self.name, json.dumps(payload), self.max_attempts, now + delay, now)
+        sql = f"INSERT INTO {JOBS} (queue, payload, max_attempts, run_after, enqueued_at) VALUES (?, ?, ?, ?, ?)"
+        if conn is not None:
+            return conn.execute(sql, row).lastrowid
+        job_id = write(lambda c: c.execute(sql, row).lastrowid)
+        self.wake()
+        return job_id
+
+    def enqueue_many(self, payloads, conn):
+        """Add one job per payload inside the caller's transaction; call wake() once it has committed."""
+        now = time.time()
+        rows = [(self.name, json.dumps(p), self.max_attempts, now, now) for p in payloads]
+        conn.executemany(f"INSERT INTO {JOBS} (queue, payload, max_attempts, run_after, enqueued_at) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def wake(self):
+        """Start the workers if needed and have one look for work now."""
+        self._start()
+        self._wake.set()
+
+    def start(self):
+        """Requeue jobs whose lease ran out, then start the workers. Returns how many were requeued."""
+        reclaimed = self.reclaim()
+        self.wake()
+        return reclaimed
+
+    def reclaim(self):
+        """
+        Put 'running' jobs whose lease has expired back to 'queued'; their
+        workers died (or the process stopped) before finishing them.
+        """
+        return write(lambda conn: conn.execute(RECLAIM_SQL, (self.name, time.time())).rowcount)
+
+    def claim(self, limit=1):
+        """Lease up to `limit` due jobs to the caller."""
+        now = time.time()
+        rows = write(lambda conn: conn.execute(CLAIM_SQL, (now + self.visibility_s, self.name, now, limit)).fetchall())
+        return [Job(r[0], r[1], json.loads(r[2]), r[3], r[4], r[5]) for r in rows]
+
+    def _finish(self, job, error=None):
+        """
+        Delete a finished job, or schedule its retry / mark it failed. Returns
+        the outcome, "stale" if the lease had already passed to another worker.
+        """
+        if error is None:
+            outcome = "done"
+            sql, params = f"DELETE FROM {JOBS} WHERE id = ? AND attempts = ?", (job.id, job.attempts)
+        elif job.attempts >= job.max_attempts:
+            outcome = "failed"
+            sql, params = (f"UPDATE {JOBS} SET status = 'failed', last_error = ? WHERE id = ? AND attempts = ?",
+                           (error, job.id, job.attempts))
+        else:
+            outcome = "retry"
+            sql, params = (f"UPDATE {JOBS} SET status = 'queued', run_after = ?, last_error = ? WHERE id = ? AND attempts = ?",
+                           (time.time() + _backoff(job.attempts), error, job.id, job.attempts))
+        changed = write(lambda conn: conn.execute(sql, params).rowcount)
+        return outcome if changed else "stale"
+
+    def run_once(self):
+        """Claim and run one job. Returns False if none was due."""
+        jobs = self.claim()
+        if not jobs:
+            return False
+        job = jobs[0]
+        started = time.time()
+        if job.attempts > job.max_attempts:
+            # the last attempt's worker died holding the lease
+            outcome = self._finish(job, "lease expired on the last attempt")
+        else:
+            try:
+                self.handler(job.payload)
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            outcome = self._finish(job, error)
+        if instrumentation.ENABLED:
+            labels = {"queue": self.name}
+            REGISTRY.observe("wastelink_job_wait_seconds", labels, max(0.0, started - job.enqueued_at))
+            REGISTRY.observe("wastelink_job_run_seconds", labels, time.time() - started)
+            REGISTRY.inc("wastelink_jobs_total", {"queue": self.name, "result": outcome})
+        return True
+
+    def drain(self, timeout=None):
+        """Run due jobs in the calling thread until none are left (or `timeout` s pass). Returns how many ran."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        n = 0
+        while self.run_once():
+            n += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return n
+
+    # ---- workers ----
+    def _start(self):
+        if self._threads or self.workers <= 0:
+            return
+        with self._lock:
+            if not self._threads:
+                self._stop.clear()
+                for i in range(self.workers):
+                    t = threading.Thread(target=self._run, name=f"jobs-{self.name}-{i}", daemon=True)
+                    t.start()
+                    self._threads.append(t)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                print(f"Job worker for {self.name} failed:", traceback.format_exc())
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def close(self):
+        """Stop the workers after their current job; unfinished jobs stay queued."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        self._wake.set()
+        for t in threads:
+            t.join()
+
+
+QUEUES = {}
+
+
+def register(name, handler, **options):
+    """Create the queue `name` whose jobs are run by handler(payload)."""
+    q = QUEUES[name] = JobQueue(name, handler, **options)
+    utils.on_initialized(lambda db_path: db_path == utils.DB_NAME and q.start())
+    return q
+
+
+def close_all():
+    for q in QUEUES.values():
+        q.close()
+
+
+atexit.register(close_all)
+
+
+# -------------------------
+# STATS
+# -------------------------
+def stats(conn):
+    """Per queue: jobs by status, and the age in seconds of the oldest due job."""
+    now = time.time()
+    out = {}
+    for queue, status, n, oldest in conn.execute(f"""
+        SELECT queue, status, COUNT(*), MIN(CASE WHEN status = 'queued' THEN run_after END) FROM {JOBS} GROUP BY queue, status
+    """):
+        q = out.setdefault(queue, {"queued": 0, "running": 0, "failed": 0, "oldest_due_s": 0.0})
+        q[status] = n
+        if oldest is not None:
+            q["oldest_due_s"] = round(max(0.0, now - oldest), 3)
+    return out
+
+
+def failed(conn, queue, limit=50):
+    return [dict(r) for r in conn.execute(f"""
+        SELECT id, payload, attempts, last_error FROM {JOBS} WHERE queue = ? AND status = 'failed' ORDER BY id DESC LIMIT ?
+    """, (queue, limit))]
+
+
+def retry_failed(conn, queue):
+    """Requeue every failed job of `queue` with a fresh set of attempts."""
+    return conn.execute(f"""
+        UPDATE {JOBS} SET status = 'queued', attempts = 0, run_after = ? WHERE queue = ? AND status = 'failed'
+    """, (time.time(), queue)).rowcount
+
+
+if __name__ == "__main__":
+    # api registers the queues on the importable `jobs` module, not on __main__
+    import api  # noqa: F401
+    import jobs
+
+    for q in jobs.QUEUES.values():
+        q.workers = max(1, q.workers)
+        q.start()
+    print("working", ", ".join(jobs.QUEUES))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        jobs.close_all()
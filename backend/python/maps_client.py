@@ -1,20 +1,206 @@
 # maps_client.py
+import asyncio
+import contextvars
+import importlib.util
 import os
-import requests
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from distance_engine import local_distance_matrix, nearest_k, to_array
+from instrumentation import external
+from route_cache import ROUTE_CACHE
+from utils import run_db
+
+# optional: non-blocking HTTP for the asyncio API, imported with the first
+# async client since it is slow to import
+HTTPX_PRESENT = importlib.util.find_spec("httpx") is not None
+httpx = None
 
 GOOGLE_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY")
-DIST_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
-DIR_URL = "https://maps.googleapis.com/maps/api/directions/json"
+# overridable so the client can be pointed at a local stub server
+BASE_URL = os.environ.get("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com/maps/api")
+DIST_URL = f"{BASE_URL}/distancematrix/json"
+DIR_URL = f"{BASE_URL}/directions/json"
+
+# Distance Matrix per-request limits
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+MAX_WORKERS = int(os.environ.get("GOOGLE_MAPS_WORKERS", "8"))
+# concurrent Google requests per event loop on the async path
+MAX_ASYNC_REQUESTS = int(os.environ.get("GOOGLE_MAPS_ASYNC_REQUESTS", "64"))
+# httpx's pool bookkeeping grows with the square of its size; several small
+# clients used round-robin stay fast where one big one stalls
+CONNECTIONS_PER_CLIENT = 8
+MAX_RETRIES = 3
+BACKOFF_S = 0.25
+RETRY_HTTP = {429, 500, 502, 503, 504}
+RETRY_API = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+class MapsRequestError(RuntimeError):
+    pass
+
+
+# -------------------------
+# SHARED SESSION / POOL
+# -------------------------
+requests = None                       # imported with the first session; it is slow to import
+_session = None
+_executor = None
+_init_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _get_session():
+    global _session, requests
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="maps")
+    return _executor
+
+
+def _endpoint_of(url, *args, **kwargs):
+    return url.rstrip("/").split("/")[-2]
+
+
+@external("google", _endpoint_of)
+def _get_json(url, params, timeout):
+    return _request_json(url, params, timeout)
 
-def get_distance_matrix(origin_list, destination_list):
+
+def _request_json(url, params, timeout):
+    """GET with retry and exponential backoff on transient HTTP/API errors."""
+    session = _get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        last = attempt == MAX_RETRIES
+        try:
+            r = session.get(url, params=params, timeout=timeout)
+            if r.status_code in RETRY_HTTP and not last:
+                raise MapsRequestError(f"HTTP {r.status_code}")
+            r.raise_for_status()
+            data = r.json()
+            if data.get("status") in RETRY_API and not last:
+                raise MapsRequestError(data["status"])
+            return data
+        except (requests.ConnectionError, requests.Timeout, MapsRequestError):
+            if last:
+                raise
+        time.sleep(BACKOFF_S * (2 ** attempt) * (0.5 + random.random()))
+
+
+def _dedup_get_json(url, params, timeout):
+    """Identical concurrent requests share one network call."""
+    key = (url, tuple(sorted(params.items())))
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = _inflight[key] = Future()
+    if not owner:
+        return fut.result()
+    try:
+        fut.set_result(_get_json(url, params, timeout))
+    except BaseException as e:
+        fut.set_exception(e)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return fut.result()
+
+
+# -------------------------
+# PUBLIC API
+# -------------------------
+def get_distance_matrix(origin_list, destination_list, use_cache=True):
+    if use_cache:
+        return ROUTE_CACHE.distance_matrix(origin_list, destination_list, _fetch_distance_matrix)
+    return _fetch_distance_matrix(origin_list, destination_list)
+
+def get_directions(origin, destination, waypoints=None, optimize=False, use_cache=True):
+    if use_cache:
+        return ROUTE_CACHE.directions(origin, destination, waypoints, optimize, _fetch_directions)
+    return _fetch_directions(origin, destination, waypoints=waypoints, optimize=optimize)
+
+def _tiles(n_origins, n_destinations):
+    """Split an n x m request into (origin slice, destination slice) tiles within API limits."""
+    if not n_origins or not n_destinations:
+        return []
+    d_size = min(n_destinations, MAX_DESTINATIONS)
+    o_size = max(1, min(n_origins, MAX_ORIGINS, MAX_ELEMENTS // d_size))
+    return [
+        (slice(i, i + o_size), slice(j, j + d_size))
+        for i in range(0, n_origins, o_size)
+        for j in range(0, n_destinations, d_size)
+    ]
+
+def _fetch_tile(origins, destinations):
+    params = _tile_params(origins, destinations)
+    return _check_tile(_dedup_get_json(DIST_URL, params, timeout=10), origins, destinations)
+
+def _tile_params(origins, destinations):
+    return {"origins":"|".join(origins), "destinations":"|".join(destinations), "key":GOOGLE_API_KEY, "units":"metric"}
+
+def _check_tile(data, origins, destinations):
+    if data.get("status") != "OK":
+        raise MapsRequestError(f"distance matrix tile failed: {data.get('status')} {data.get('error_message', '')}".strip())
+    rows = data.get("rows", [])
+    if len(rows) != len(origins) or any(len(r.get("elements", [])) != len(destinations) for r in rows):
+        raise MapsRequestError("distance matrix tile has unexpected shape")
+    return data
+
+def _fetch_distance_matrix(origin_list, destination_list):
     if not GOOGLE_API_KEY:
         raise RuntimeError("GOOGLE_MAPS_API_KEY not set")
-    params = {"origins":"|".join(origin_list), "destinations":"|".join(destination_list), "key":GOOGLE_API_KEY, "units":"metric"}
-    r = requests.get(DIST_URL, params=params, timeout=10)
-    r.raise_for_status()
-    return r.json()
+    origin_list = list(origin_list)
+    destination_list = list(destination_list)
+    tiles = _tiles(len(origin_list), len(destination_list))
+    if not tiles:
+        return _stitch(origin_list, destination_list, tiles, [])
+    if len(tiles) == 1:
+        results = [_fetch_tile(origin_list, destination_list)]
+    else:
+        pool = _get_executor()
+        futures = [pool.submit(contextvars.copy_context().run, _fetch_tile, origin_list[o], destination_list[d]) for o, d in tiles]
+        results = [f.result() for f in futures]
+    return _stitch(origin_list, destination_list, tiles, results)
 
-def get_directions(origin, destination, waypoints=None, optimize=False):
+def _stitch(origin_list, destination_list, tiles, results):
+    """Put tile responses back together into one n x m matrix."""
+    rows = [{"elements": [None] * len(destination_list)} for _ in origin_list]
+    origin_addresses = list(origin_list)
+    destination_addresses = list(destination_list)
+    for (o, d), data in zip(tiles, results):
+        origin_addresses[o] = data.get("origin_addresses", origin_list[o])
+        destination_addresses[d] = data.get("destination_addresses", destination_list[d])
+        for i, row in zip(range(o.start, min(o.stop, len(origin_list))), data["rows"]):
+            rows[i]["elements"][d] = row["elements"]
+    return {"status": "OK", "origin_addresses": origin_addresses, "destination_addresses": destination_addresses, "rows": rows}
+
+def _fetch_directions(origin, destination, waypoints=None, optimize=False):
+    return _dedup_get_json(DIR_URL, _directions_params(origin, destination, waypoints, optimize), timeout=15)
+
+def _directions_params(origin, destination, waypoints, optimize):
     if not GOOGLE_API_KEY:
         raise RuntimeError("GOOGLE_MAPS_API_KEY not set")
     params = {"origin":origin, "destination":destination, "key":GOOGLE_API_KEY, "units":"metric"}
@@ -23,6 +209,190 @@ def get_directions(origin, destination, waypoints=None, optimize=False):
         if optimize:
             wp = "optimize:true|" + wp
         params["waypoints"] = wp
-    r = requests.get(DIR_URL, params=params, timeout=15)
-    r.raise_for_status()
-    return r.json()
+    return params
+
+def distance_matrix(origin_list, destination_list, top_k=None):
+    """
+    Distance Matrix with a local fallback.
+
+    With top_k set, only the top_k straight-line nearest destinations of each
+    origin are sent to Google; the other cells keep their local estimate.
+    Without an API key, or if the request fails, the whole matrix is local.
+    The response always has one element per origin/destination pair.
+    """
+    local = local_distance_matrix(origin_list, destination_list)
+    if not GOOGLE_API_KEY or not origin_list or not destination_list:
+        return local
+    cols = _remote_columns(origin_list, destination_list, top_k)
+    try:
+        remote = get_distance_matrix(origin_list, [destination_list[j] for j in cols])
+    except Exception:
+        return local
+    return _merge_remote(local, remote, cols)
+
+def _remote_columns(origin_list, destination_list, top_k):
+    """Destination indexes worth sending to Google."""
+    if top_k and top_k < len(destination_list):
+        dests = to_array(destination_list)
+        keep = set()
+        for origin in origin_list:
+            keep.update(nearest_k(origin, dests, top_k).tolist())
+        return sorted(keep)
+    return list(range(len(destination_list)))
+
+def _merge_remote(local, remote, cols):
+    """Overlay the OK cells of a remote matrix (over columns `cols`) onto the local one."""
+    if remote.get("status", "OK") != "OK":
+        return local
+    for i, row in enumerate(remote["rows"]):
+        for el, j in zip(row["elements"], cols):
+            if el.get("status") == "OK":
+                local["rows"][i]["elements"][j] = el
+    local["source"] = "google" if len(cols) == len(local["destination_addresses"]) else "mixed"
+    return local
+
+
+# -------------------------
+# ASYNC API
+# -------------------------
+class _AsyncState:
+    """Per-event-loop HTTP clients, concurrency limit and in-flight table."""
+
+    def __init__(self):
+        global httpx
+        self.clients = []
+        if HTTPX_PRESENT:
+            import httpx
+            limits = httpx.Limits(max_connections=CONNECTIONS_PER_CLIENT, max_keepalive_connections=CONNECTIONS_PER_CLIENT)
+            n = max(1, -(-MAX_ASYNC_REQUESTS // CONNECTIONS_PER_CLIENT))
+            self.clients = [httpx.AsyncClient(limits=limits) for _ in range(n)]
+        self.next_client = 0
+        self.limit = asyncio.Semaphore(MAX_ASYNC_REQUESTS)
+        self.inflight = {}
+
+    def client(self):
+        self.next_client = (self.next_client + 1) % len(self.clients)
+        return self.clients[self.next_client]
+
+
+_async_states = weakref.WeakKeyDictionary()
+
+
+def _async_state():
+    loop = asyncio.get_running_loop()
+    state = _async_states.get(loop)
+    if state is None:
+        state = _async_states[loop] = _AsyncState()
+    return state
+
+
+async def close_async_client():
+    """Close the running loop's HTTP clients; call before the loop shuts down."""
+    state = _async_states.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        for client in state.clients:
+            await client.aclose()
+
+
+@external("google", _endpoint_of)
+async def _get_json_async(url, params, timeout):
+    state = _async_state()
+    if not state.clients:
+        # no httpx: run the blocking client on the maps thread pool (undecorated,
+        # this call is already counted)
+        async with state.limit:
+            return await asyncio.get_running_loop().run_in_executor(_get_executor(), _request_json, url, params, timeout)
+    for attempt in range(MAX_RETRIES + 1):
+        last = attempt == MAX_RETRIES
+        try:
+            async with state.limit:
+                r = await state.client().get(url, params=params, timeout=timeout)
+            if r.status_code in RETRY_HTTP and not last:
+                raise MapsRequestError(f"HTTP {r.status_code}")
+            r.raise_for_status()
+            data = r.json()
+            if data.get("status") in RETRY_API and not last:
+                raise MapsRequestError(data["status"])
+            return data
+        except (httpx.TransportError, MapsRequestError):
+            if last:
+                raise
+        await asyncio.sleep(BACKOFF_S * (2 ** attempt) * (0.5 + random.random()))
+
+
+async def _dedup_get_json_async(url, params, timeout):
+    """
+    Identical concurrent requests await one task. A waiter being cancelled
+    leaves the others alone; the request itself is cancelled once nobody
+    is waiting for it.
+    """
+    state = _async_state()
+    key = (url, tuple(sorted(params.items())))
+    entry = state.inflight.get(key)
+    if entry is None:
+        task = asyncio.ensure_future(_get_json_async(url, params, timeout))
+        entry = state.inflight[key] = [task, 0]
+        task.add_done_callback(lambda _, e=entry: state.inflight.get(key) is e and state.inflight.pop(key))
+    entry[1] += 1
+    try:
+        return await asyncio.shield(entry[0])
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and not entry[0].done():
+            entry[0].cancel()
+
+
+async def _fetch_tile_async(origins, destinations):
+    data = await _dedup_get_json_async(DIST_URL, _tile_params(origins, destinations), timeout=10)
+    return _check_tile(data, origins, destinations)
+
+
+async def _fetch_distance_matrix_async(origin_list, destination_list):
+    if not GOOGLE_API_KEY:
+        raise RuntimeError("GOOGLE_MAPS_API_KEY not set")
+    origin_list = list(origin_list)
+    destination_list = list(destination_list)
+    tiles = _tiles(len(origin_list), len(destination_list))
+    if not tiles:
+        return _stitch(origin_list, destination_list, tiles, [])
+    tasks = [asyncio.ensure_future(_fetch_tile_async(origin_list[o], destination_list[d])) for o, d in tiles]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+    return _stitch(origin_list, destination_list, tiles, results)
+
+
+async def get_distance_matrix_async(origin_list, destination_list, use_cache=True):
+    if not use_cache:
+        return await _fetch_distance_matrix_async(origin_list, destination_list)
+    plan = await run_db(ROUTE_CACHE.matrix_lookup, origin_list, destination_list)
+    if not plan["fetch"]:
+        return ROUTE_CACHE.matrix_fill(plan, None)
+    remote = await _fetch_distance_matrix_async(*plan["fetch"])
+    return await run_db(ROUTE_CACHE.matrix_fill, plan, remote)
+
+
+async def get_directions_async(origin, destination, waypoints=None, optimize=False, use_cache=True):
+    if not use_cache:
+        return await _dedup_get_json_async(DIR_URL, _directions_params(origin, destination, waypoints, optimize), timeout=15)
+    key, value = await run_db(ROUTE_CACHE.directions_lookup, origin, destination, waypoints, optimize)
+    if value is not None:
+        return value
+    value = await _dedup_get_json_async(DIR_URL, _directions_params(origin, destination, waypoints, optimize), timeout=15)
+    return await run_db(ROUTE_CACHE.directions_fill, key, value)
+
+
+async def distance_matrix_async(origin_list, destination_list, top_k=None):
+    """distance_matrix() for asyncio callers: same local fallback, non-blocking I/O."""
+    local = local_distance_matrix(origin_list, destination_list)
+    if not GOOGLE_API_KEY or not origin_list or not destination_list:
+        return local
+    cols = _remote_columns(origin_list, destination_list, top_k)
+    try:
+        remote = await get_distance_matrix_async(origin_list, [destination_list[j] for j in cols])
+    except Exception:
+        return local
+    return _merge_remote(local, remote, cols)
@@ -0,0 +1,79 @@
+# metrics.py
+"""
+Incrementally maintained counters for the admin dashboard.
+
+Triggers on the write path keep two things current:
+
+- `system_counters`: all-time totals (users, requests, collections), so
+  api_get_stats is a primary-key lookup instead of COUNT(*) scans.
+- `daily_metrics`: one row per day with requests, collections, weight,
+  earnings, completions, completion rate and average collection time.
+
+The triggers are installed by migration 5 (and 10 for re-priced earnings).
+backfill() rebuilds both tables from the base tables, e.g. after a bulk
+load that bypassed them.
+"""
+from utils import COLLECTIONS, DAILY_METRICS, EARNINGS, PICKUP_REQUESTS, USERS
+
+SYSTEM_COUNTERS = "system_counters"
+
+COUNTER_NAMES = ("total_users", "total_requests", "total_collections")
+
+_RATES = """completion_rate = CASE WHEN total_requests > 0
+            THEN MIN(1.0, CAST(completed_requests AS REAL) / total_requests) ELSE 0 END,
+        avg_collection_time_minutes = CASE WHEN completed_requests > 0
+            THEN total_collection_minutes / completed_requests ELSE 0 END"""
+
+
+# -------------------------
+# BACKFILL
+# -------------------------
+def backfill(conn):
+    """Recompute system_counters and daily_metrics from the base tables."""
+    conn.execute(f"DELETE FROM {SYSTEM_COUNTERS}")
+    conn.execute(f"""
+        INSERT INTO {SYSTEM_COUNTERS} (name, value)
+        SELECT 'total_users', COUNT(*) FROM {USERS}
+        UNION ALL SELECT 'total_requests', COUNT(*) FROM {PICKUP_REQUESTS}
+        UNION ALL SELECT 'total_collections', COUNT(*) FROM {COLLECTIONS}
+    """)
+    conn.execute(f"DELETE FROM {DAILY_METRICS}")
+    conn.execute(f"""
+        INSERT INTO {DAILY_METRICS} (metric_date, total_requests, completed_requests, total_collection_minutes,
+                                     total_collections, total_weight_kg, total_earnings)
+        SELECT day, SUM(req), SUM(done), SUM(mins), SUM(cols), SUM(kg), SUM(amt) FROM (
+            SELECT date(requested_at) AS day, 1 AS req, 0 AS done, 0 AS mins, 0 AS cols, 0 AS kg, 0 AS amt
+            FROM {PICKUP_REQUESTS}
+            UNION ALL
+            SELECT date(COALESCE(completed_at, requested_at)), 0, 1,
+                   MAX(0, (julianday(COALESCE(completed_at, requested_at)) - julianday(requested_at)) * 1440), 0, 0, 0
+            FROM {PICKUP_REQUESTS} WHERE status = 'completed'
+            UNION ALL
+            SELECT date(collected_at), 0, 0, 0, 1, COALESCE(total_weight_kg, 0), 0 FROM {COLLECTIONS}
+            UNION ALL
+            SELECT date(created_at), 0, 0, 0, 0, 0, COALESCE(amount, 0) FROM {EARNINGS}
+        ) WHERE day IS NOT NULL GROUP BY day
+    """)
+    conn.execute(f"UPDATE {DAILY_METRICS} SET {_RATES}")
+
+
+# -------------------------
+# READS
+# -------------------------
+COUNTERS_SQL = f"SELECT name, value FROM {SYSTEM_COUNTERS} WHERE name IN ({','.join('?' * len(COUNTER_NAMES))})"
+
+DAILY_SQL = f"""
+    SELECT metric_date, total_requests, completed_requests, total_collections, total_weight_kg,
+           total_earnings, completion_rate, avg_collection_time_minutes, total_collection_minutes
+    FROM {DAILY_METRICS} WHERE metric_date BETWEEN ? AND ? ORDER BY metric_date
+"""
+
+
+def read_counters(conn):
+    values = dict(conn.execute(COUNTERS_SQL, COUNTER_NAMES).fetchall())
+    return {name: int(values.get(name, 0)) for name in COUNTER_NAMES}
+
+
+def read_daily(conn, start_date, end_date):
+    rows = conn.execute(DAILY_SQL, (start_date, end_date)).fetchall()
+    return [dict(r) for r in rows]
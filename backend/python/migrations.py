@@ -0,0 +1,536 @@
+# migrations.py
+"""
+Versioned schema migrations tracked in `PRAGMA user_version`.
+
+utils.ensure_initialized() creates the base tables, then migrate() applies
+every step newer than the database's user_version, bumping it after each
+one; a database already at SCHEMA_VERSION skips both. A database with no
+user_version yet goes through prepare() first, which moves the prototype
+tables the base script would otherwise keep out of the way.
+Steps must be idempotent (IF NOT EXISTS, column checks): DDL run through
+executescript commits as it goes, so a step interrupted halfway is simply
+run again on the next start.
+
+Each step carries its own SQL rather than calling into the module that
+uses the tables, so editing that module cannot change a step that has
+already run somewhere. To change the schema, append a new
+(version, name, step) entry; never edit a step that has shipped.
+
+    python migrations.py     # migrate a copy of the checked-in wastelink.db
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import utils
+from utils import (
+    AUDIT_LOGS, COLLECTIONS, DAILY_METRICS, EARNINGS, LOCATIONS, NOTIFICATIONS, PICKUP_REQUESTS, ROUTES,
+    TRANSACTIONS, USERS, WASTE_PRICING,
+)
+
+# the prototype users(id INTEGER, username, password, role) table, kept with its rows
+LEGACY_USERS = "legacy_users"
+
+
+# -------------------------
+# BEFORE THE BASE SCHEMA
+# -------------------------
+def _move_prototype_users(conn):
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_info({USERS})")}
+    if not cols or "email" in cols:
+        return
+    # legacy_alter_table keeps the REFERENCES users(id) of the other tables
+    # pointing at `users`, which the base script then creates
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        conn.execute(f"ALTER TABLE {USERS} RENAME TO {LEGACY_USERS}")
+        conn.commit()
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+
+
+def prepare(conn):
+    """Run before the base schema script on a database that has no user_version yet."""
+    if schema_version(conn) == 0:
+        _move_prototype_users(conn)
+
+
+# -------------------------
+# STEPS
+# -------------------------
+def _spatial_index(cur):
+    cur.executescript(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS pickup_rtree USING rtree(
+        id, min_lat, max_lat, min_lng, max_lng
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_pickup_rtree_insert
+    AFTER INSERT ON {PICKUP_REQUESTS} WHEN NEW.status = 'pending'
+    BEGIN
+        INSERT INTO pickup_rtree VALUES (NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_pickup_rtree_update
+    AFTER UPDATE OF status, latitude, longitude ON {PICKUP_REQUESTS}
+    BEGIN
+        DELETE FROM pickup_rtree WHERE id = OLD.rowid;
+        INSERT INTO pickup_rtree
+            SELECT NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.status = 'pending';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_pickup_rtree_delete
+    AFTER DELETE ON {PICKUP_REQUESTS}
+    BEGIN
+        DELETE FROM pickup_rtree WHERE id = OLD.rowid;
+    END;
+    """)
+    # pick up pending rows written before the index existed
+    cur.execute(f"""
+        INSERT INTO pickup_rtree
+        SELECT rowid, latitude, latitude, longitude, longitude FROM {PICKUP_REQUESTS}
+        WHERE status = 'pending' AND rowid NOT IN (SELECT id FROM pickup_rtree)
+    """)
+
+
+def _add_columns(cur, table, columns):
+    existing = {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns:
+        if name not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+def _route_cache(cur):
+    _add_columns(cur, ROUTES, (("kind", "TEXT DEFAULT 'matrix'"), ("payload", "TEXT")))
+    cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_routes_cache_key ON {ROUTES}(kind, origin, destination)")
+
+
+def _classification_cache(cur):
+    cur.executescript("""
+    CREATE TABLE IF NOT EXISTS classification_cache (
+        content_hash TEXT PRIMARY KEY,
+        phash TEXT,
+        result TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_classification_cache_phash ON classification_cache(phash);
+    """)
+
+
+def _hot_path_indexes(cur):
+    cur.executescript(f"""
+    -- api_get_tasks fallback / api_assign_pending_batch: pending work, oldest first
+    CREATE INDEX IF NOT EXISTS idx_pickup_pending
+        ON {PICKUP_REQUESTS}(requested_at, id, latitude, longitude, address)
+        WHERE status = 'pending';
+
+    -- open jobs per collector (current load)
+    CREATE INDEX IF NOT EXISTS idx_pickup_open_by_collector
+        ON {PICKUP_REQUESTS}(assigned_collector_id)
+        WHERE status IN ('assigned','arrived');
+
+    -- api_assign_collector / api_assign_pending_batch: available collectors
+    CREATE INDEX IF NOT EXISTS idx_users_available_collectors
+        ON {USERS}(id, collector_latitude, collector_longitude, capacity_kg, rating)
+        WHERE role = 'collector' AND is_available = 1;
+
+    -- api_auth: answered from the index alone
+    CREATE INDEX IF NOT EXISTS idx_users_auth
+        ON {USERS}(email, password_hash, id, role, full_name);
+
+    -- api_log_weight pricing lookup
+    CREATE INDEX IF NOT EXISTS idx_waste_pricing_active
+        ON {WASTE_PRICING}(waste_type, price_per_kg)
+        WHERE is_active = 1;
+
+    CREATE INDEX IF NOT EXISTS idx_collections_request ON {COLLECTIONS}(request_id);
+    CREATE INDEX IF NOT EXISTS idx_collections_collector ON {COLLECTIONS}(collector_id, collected_at);
+    CREATE INDEX IF NOT EXISTS idx_earnings_collection ON {EARNINGS}(collection_id);
+    CREATE INDEX IF NOT EXISTS idx_earnings_collector_status ON {EARNINGS}(collector_id, status);
+    """)
+
+
+_DAILY_RATES = """completion_rate = CASE WHEN total_requests > 0
+            THEN MIN(1.0, CAST(completed_requests AS REAL) / total_requests) ELSE 0 END,
+        avg_collection_time_minutes = CASE WHEN completed_requests > 0
+            THEN total_collection_minutes / completed_requests ELSE 0 END"""
+
+
+def _metrics(cur):
+    _add_columns(cur, DAILY_METRICS, (("completed_requests", "INTEGER DEFAULT 0"),
+                                      ("total_collection_minutes", "REAL DEFAULT 0.00")))
+    cur.executescript(f"""
+    CREATE TABLE IF NOT EXISTS system_counters (
+        name TEXT PRIMARY KEY,
+        value REAL NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_user_insert AFTER INSERT ON {USERS}
+    BEGIN
+        UPDATE system_counters SET value = value + (1) WHERE name = 'total_users';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_user_delete AFTER DELETE ON {USERS}
+    BEGIN
+        UPDATE system_counters SET value = value + (-1) WHERE name = 'total_users';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_request_insert AFTER INSERT ON {PICKUP_REQUESTS}
+    BEGIN
+        UPDATE system_counters SET value = value + (1) WHERE name = 'total_requests';
+        INSERT OR IGNORE INTO {DAILY_METRICS} (metric_date) VALUES (date(NEW.requested_at));
+        UPDATE {DAILY_METRICS} SET total_requests = total_requests + 1 WHERE metric_date = date(NEW.requested_at);
+        UPDATE {DAILY_METRICS} SET {_DAILY_RATES} WHERE metric_date = date(NEW.requested_at);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_request_delete AFTER DELETE ON {PICKUP_REQUESTS}
+    BEGIN
+        UPDATE system_counters SET value = value + (-1) WHERE name = 'total_requests';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_request_completed
+    AFTER UPDATE OF status ON {PICKUP_REQUESTS}
+    WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed'
+    BEGIN
+        INSERT OR IGNORE INTO {DAILY_METRICS} (metric_date) VALUES (date(COALESCE(NEW.completed_at, CURRENT_TIMESTAMP)));
+        UPDATE {DAILY_METRICS} SET completed_requests = completed_requests + 1, total_collection_minutes = total_collection_minutes + MAX(0, (julianday(COALESCE(NEW.completed_at, CURRENT_TIMESTAMP)) - julianday(NEW.requested_at)) * 1440) WHERE metric_date = date(COALESCE(NEW.completed_at, CURRENT_TIMESTAMP));
+        UPDATE {DAILY_METRICS} SET {_DAILY_RATES} WHERE metric_date = date(COALESCE(NEW.completed_at, CURRENT_TIMESTAMP));
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_collection_insert AFTER INSERT ON {COLLECTIONS}
+    BEGIN
+        UPDATE system_counters SET value = value + (1) WHERE name = 'total_collections';
+        INSERT OR IGNORE INTO {DAILY_METRICS} (metric_date) VALUES (date(NEW.collected_at));
+        UPDATE {DAILY_METRICS} SET total_collections = total_collections + 1, total_weight_kg = total_weight_kg + COALESCE(NEW.total_weight_kg, 0) WHERE metric_date = date(NEW.collected_at);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_collection_delete AFTER DELETE ON {COLLECTIONS}
+    BEGIN
+        UPDATE system_counters SET value = value + (-1) WHERE name = 'total_collections';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_earning_insert AFTER INSERT ON {EARNINGS}
+    BEGIN
+        INSERT OR IGNORE INTO {DAILY_METRICS} (metric_date) VALUES (date(NEW.created_at));
+        UPDATE {DAILY_METRICS} SET total_earnings = total_earnings + COALESCE(NEW.amount, 0) WHERE metric_date = date(NEW.created_at);
+    END;
+    """)
+    # counters and days as of now; the triggers keep them current from here on
+    cur.execute("DELETE FROM system_counters")
+    cur.execute(f"""
+        INSERT INTO system_counters (name, value)
+        SELECT 'total_users', COUNT(*) FROM {USERS}
+        UNION ALL SELECT 'total_requests', COUNT(*) FROM {PICKUP_REQUESTS}
+        UNION ALL SELECT 'total_collections', COUNT(*) FROM {COLLECTIONS}
+    """)
+    cur.execute(f"DELETE FROM {DAILY_METRICS}")
+    cur.execute(f"""
+        INSERT INTO {DAILY_METRICS} (metric_date, total_requests, completed_requests, total_collection_minutes,
+                                     total_collections, total_weight_kg, total_earnings)
+        SELECT day, SUM(req), SUM(done), SUM(mins), SUM(cols), SUM(kg), SUM(amt) FROM (
+            SELECT date(requested_at) AS day, 1 AS req, 0 AS done, 0 AS mins, 0 AS cols, 0 AS kg, 0 AS amt
+            FROM {PICKUP_REQUESTS}
+            UNION ALL
+            SELECT date(COALESCE(completed_at, requested_at)), 0, 1,
+                   MAX(0, (julianday(COALESCE(completed_at, requested_at)) - julianday(requested_at)) * 1440), 0, 0, 0
+            FROM {PICKUP_REQUESTS} WHERE status = 'completed'
+            UNION ALL
+            SELECT date(collected_at), 0, 0, 0, 1, COALESCE(total_weight_kg, 0), 0 FROM {COLLECTIONS}
+            UNION ALL
+            SELECT date(created_at), 0, 0, 0, 0, 0, COALESCE(amount, 0) FROM {EARNINGS}
+        ) WHERE day IS NOT NULL GROUP BY day
+    """)
+    cur.execute(f"UPDATE {DAILY_METRICS} SET {_DAILY_RATES}")
+
+
+def _collector_locations(cur):
+    cur.executescript(f"""
+    -- keep only the newest row per user before making user_id unique
+    DELETE FROM {LOCATIONS} WHERE user_id IS NOT NULL AND rowid NOT IN (
+        -- SQLite returns the bare rowid from the row holding MAX(updated_at)
+        SELECT rowid FROM (SELECT rowid, MAX(updated_at) FROM {LOCATIONS} WHERE user_id IS NOT NULL GROUP BY user_id)
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_locations_user ON {LOCATIONS}(user_id);
+    """)
+
+
+def _notifications(cur):
+    cur.executescript(f"""
+    CREATE INDEX IF NOT EXISTS idx_notifications_feed
+        ON {NOTIFICATIONS}(user_id, is_read, created_at, id);
+
+    CREATE TABLE IF NOT EXISTS notification_counters (
+        user_id TEXT PRIMARY KEY,
+        unread INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_insert
+    AFTER INSERT ON {NOTIFICATIONS} WHEN COALESCE(NEW.is_read, 0) = 0
+    BEGIN
+        INSERT INTO notification_counters (user_id, unread) VALUES (NEW.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET unread = unread + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_update
+    AFTER UPDATE OF is_read ON {NOTIFICATIONS}
+    WHEN COALESCE(OLD.is_read, 0) != COALESCE(NEW.is_read, 0)
+    BEGIN
+        UPDATE notification_counters SET unread = unread + (CASE WHEN COALESCE(NEW.is_read, 0) = 0 THEN 1 ELSE -1 END)
+        WHERE user_id = NEW.user_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_delete
+    AFTER DELETE ON {NOTIFICATIONS} WHEN COALESCE(OLD.is_read, 0) = 0
+    BEGIN
+        UPDATE notification_counters SET unread = unread - 1 WHERE user_id = OLD.user_id;
+    END;
+    """)
+    cur.execute("DELETE FROM notification_counters")
+    cur.execute(f"""
+        INSERT INTO notification_counters (user_id, unread)
+        SELECT user_id, COUNT(*) FROM {NOTIFICATIONS} WHERE COALESCE(is_read, 0) = 0 GROUP BY user_id
+    """)
+
+
+def _export_indexes(cur):
+    # export.py walks (owner, timestamp, rowid) / (timestamp, rowid) keysets;
+    # collections already has idx_collections_collector(collector_id, collected_at)
+    cur.executescript(f"""
+    CREATE INDEX IF NOT EXISTS idx_collections_collected_at ON {COLLECTIONS}(collected_at);
+    CREATE INDEX IF NOT EXISTS idx_earnings_created ON {EARNINGS}(created_at);
+    CREATE INDEX IF NOT EXISTS idx_earnings_collector_created ON {EARNINGS}(collector_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_transactions_created ON {TRANSACTIONS}(created_at);
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON {TRANSACTIONS}(user_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_audit_logs_created ON {AUDIT_LOGS}(created_at);
+    CREATE INDEX IF NOT EXISTS idx_audit_logs_actor_created ON {AUDIT_LOGS}(actor_id, created_at);
+    """)
+
+
+def _payouts(cur):
+    _add_columns(cur, EARNINGS, (("payout_batch", "TEXT"),))
+    _add_columns(cur, USERS, (("paid_earnings", "INTEGER DEFAULT 0"),))
+    cur.executescript(f"""
+    CREATE TABLE IF NOT EXISTS payout_batches (
+        id TEXT PRIMARY KEY,
+        cutoff TEXT NOT NULL,
+        min_amount REAL NOT NULL DEFAULT 0,
+        status TEXT CHECK(status IN ('processing','paid')) NOT NULL DEFAULT 'processing',
+        collectors INTEGER DEFAULT 0,
+        earnings INTEGER DEFAULT 0,
+        amount REAL DEFAULT 0.00,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        claimed_at TEXT,
+        paid_at TEXT
+    );
+
+    -- open_batch: pending earnings up to a cutoff
+    CREATE INDEX IF NOT EXISTS idx_earnings_pending_created
+        ON {EARNINGS}(created_at, collector_id, amount)
+        WHERE status = 'pending';
+
+    -- settle_batch / per-batch aggregates
+    CREATE INDEX IF NOT EXISTS idx_earnings_payout_batch
+        ON {EARNINGS}(payout_batch, collector_id, amount)
+        WHERE payout_batch IS NOT NULL;
+
+    CREATE INDEX IF NOT EXISTS idx_transactions_reference ON {TRANSACTIONS}(reference, type);
+
+    UPDATE {USERS} SET total_earnings = COALESCE(t.amount, 0), paid_earnings = COALESCE(t.n, 0)
+    FROM (SELECT u.id AS id, SUM(e.amount) AS amount, COUNT(e.id) AS n
+          FROM {USERS} u LEFT JOIN {EARNINGS} e ON e.collector_id = u.id AND e.status = 'paid'
+          WHERE u.role = 'collector' GROUP BY u.id) AS t
+    WHERE {USERS}.id = t.id;
+
+    UPDATE {USERS} SET completed_pickups = COALESCE(
+        (SELECT COUNT(*) FROM {PICKUP_REQUESTS} r WHERE r.assigned_collector_id = {USERS}.id AND r.status = 'completed'), 0)
+    WHERE role = 'collector';
+
+    -- completed_pickups follows pickup requests into and out of 'completed'
+    CREATE TRIGGER IF NOT EXISTS trg_users_completed_pickups
+    AFTER UPDATE OF status ON {PICKUP_REQUESTS}
+    WHEN NEW.assigned_collector_id IS NOT NULL AND (NEW.status IS 'completed') != (OLD.status IS 'completed')
+    BEGIN
+        UPDATE {USERS} SET completed_pickups = completed_pickups + (CASE WHEN NEW.status = 'completed' THEN 1 ELSE -1 END)
+        WHERE id = NEW.assigned_collector_id;
+    END;
+    """)
+
+
+def _jobs(cur):
+    cur.executescript(f"""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        queue TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT CHECK(status IN ('queued','running','failed')) NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_after REAL NOT NULL,             -- epoch s; the lease deadline while 'running'
+        enqueued_at REAL NOT NULL,
+        last_error TEXT
+    );
+
+    -- claim(): jobs that are due, or whose lease has run out, oldest first
+    CREATE INDEX IF NOT EXISTS idx_jobs_ready
+        ON jobs(queue, run_after, id)
+        WHERE status IN ('queued','running');
+
+    -- earnings re-priced after classification
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_earning_amount
+    AFTER UPDATE OF amount ON {EARNINGS}
+    WHEN COALESCE(NEW.amount, 0) != COALESCE(OLD.amount, 0)
+    BEGIN
+        INSERT OR IGNORE INTO {DAILY_METRICS} (metric_date) VALUES (date(NEW.created_at));
+        UPDATE {DAILY_METRICS} SET total_earnings = total_earnings + COALESCE(NEW.amount, 0) - COALESCE(OLD.amount, 0) WHERE metric_date = date(NEW.created_at);
+    END;
+    """)
+
+
+def _snapshot(cur):
+    cur.executescript(f"""
+    -- the snapshot answers the nearest-pending reads migration 1's R*Tree served
+    DROP TRIGGER IF EXISTS trg_pickup_rtree_insert;
+    DROP TRIGGER IF EXISTS trg_pickup_rtree_update;
+    DROP TRIGGER IF EXISTS trg_pickup_rtree_delete;
+    DROP TABLE IF EXISTS pickup_rtree;
+
+    CREATE TABLE IF NOT EXISTS pickup_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id TEXT NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_pickup_changes_insert
+    AFTER INSERT ON {PICKUP_REQUESTS}
+    BEGIN
+        INSERT INTO pickup_changes (request_id) VALUES (NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_pickup_changes_update
+    AFTER UPDATE OF id, status, latitude, longitude, address, requested_at ON {PICKUP_REQUESTS}
+    BEGIN
+        INSERT INTO pickup_changes (request_id) VALUES (NEW.id);
+        INSERT INTO pickup_changes (request_id) SELECT OLD.id WHERE OLD.id != NEW.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_pickup_changes_delete
+    AFTER DELETE ON {PICKUP_REQUESTS}
+    BEGIN
+        INSERT INTO pickup_changes (request_id) VALUES (OLD.id);
+    END;
+
+    -- bounded log (100000 entries): each insert drops the entry that fell out of the window
+    CREATE TRIGGER IF NOT EXISTS trg_pickup_changes_trim
+    AFTER INSERT ON pickup_changes
+    BEGIN
+        DELETE FROM pickup_changes WHERE seq <= NEW.seq - 100000;
+    END;
+    """)
+
+
+def _audit(cur):
+    cur.executescript(f"""
+    -- audit.query(): one entity, or one entity id, newest first
+    CREATE INDEX IF NOT EXISTS idx_audit_logs_entity
+        ON {AUDIT_LOGS}(entity, entity_id, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_audit_logs_entity_created
+        ON {AUDIT_LOGS}(entity, created_at, id);
+    """)
+
+
+MIGRATIONS = [
+    (1, "pickup spatial index", _spatial_index),
+    (2, "route cache columns", _route_cache),
+    (3, "classification cache", _classification_cache),
+    (4, "hot path indexes", _hot_path_indexes),
+    (5, "incremental dashboard metrics", _metrics),
+    (6, "one location row per collector", _collector_locations),
+    (7, "notification feed index and unread counters", _notifications),
+    (8, "export keyset indexes", _export_indexes),
+    (9, "payout batches and collector totals", _payouts),
+    (10, "background jobs and re-priced earnings metrics", _jobs),
+    (11, "pickup change log for the dispatch snapshot, R*Tree dropped", _snapshot),
+    (12, "audit log entity indexes", _audit),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# -------------------------
+# RUNNER
+# -------------------------
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations; returns the list of versions applied."""
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        step(conn.cursor())
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.commit()
+        applied.append(version)
+    return applied
+
+
+# -------------------------
+# CHECK
+# -------------------------
+def describe(conn):
+    """{table: columns} and the index / trigger names of a database."""
+    tables = {
+        name: tuple(r[1] for r in conn.execute(f"PRAGMA table_info({name})"))
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    objects = {tuple(r) for r in conn.execute("SELECT type, name FROM sqlite_master WHERE type IN ('index','trigger')")}
+    return tables, objects
+
+
+def check_upgrade(src):
+    """
+    Migrate a copy of the database at `src` and compare it with a new one.
+    Returns a list of differences; empty means the upgrade gives the same
+    schema. Tables that only the old database has are not differences.
+    """
+    tmp = tempfile.mkdtemp(prefix="wastelink-migrate-")
+    try:
+        upgraded, fresh = os.path.join(tmp, "upgraded.db"), os.path.join(tmp, "fresh.db")
+        shutil.copyfile(src, upgraded)
+        try:
+            utils.ensure_initialized(upgraded)
+        except sqlite3.Error as e:
+            return [f"migration failed: {e}"]
+        utils.ensure_initialized(fresh)
+        described = []
+        for path in (upgraded, fresh):
+            conn = utils.connect(path)
+            try:
+                described.append((schema_version(conn), describe(conn)))
+            finally:
+                conn.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    (version, (tables, objects)), (_, (want_tables, want_objects)) = described
+    problems = []
+    if version != SCHEMA_VERSION:
+        problems.append(f"user_version {version}, expected {SCHEMA_VERSION}")
+    for name, cols in want_tables.items():
+        if name not in tables:
+            problems.append(f"missing table {name}")
+        elif set(tables[name]) != set(cols):
+            problems.append(f"{name} columns {sorted(tables[name])}, expected {sorted(cols)}")
+    problems += [f"missing {kind} {name}" for kind, name in sorted(want_objects - objects)]
+    return problems
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else utils.DB_NAME
+    problems = check_upgrade(src)
+    for p in problems:
+        print("FAIL ", p)
+    print(f"{src}: migrated to {SCHEMA_VERSION}, {len(problems)} differences from a new database")
+    sys.exit(1 if problems else 0)
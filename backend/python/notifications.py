@@ -0,0 +1,232 @@
+# notifications.py
+"""
+Notification writes and the per-user feed.
+
+- send() queues one notification; a flusher thread inserts the queue
+  through the group-commit writer (utils.write) in batches of up to
+  BATCH_SIZE, every FLUSH_INTERVAL_S (or as soon as a batch fills). The caller gets the id
+  straight away; the row is readable within one interval.
+- broadcast() writes the same notification for many users with one
+  executemany, and broadcast_to_role() with a single INSERT ... SELECT.
+- `notification_counters` holds each user's unread count, kept current by
+  triggers, so unread_count() is a primary-key lookup.
+- feed() pages newest-first with a keyset cursor over the
+  (user_id, is_read, created_at, id) index instead of OFFSET.
+"""
+import atexit
+import heapq
+import os
+import threading
+import time
+import uuid
+
+from utils import NOTIFICATIONS, USERS, write
+
+NOTIFICATION_COUNTERS = "notification_counters"
+
+FLUSH_INTERVAL_S = float(os.environ.get("WASTELINK_NOTIFY_FLUSH_MS", "250")) / 1000.0
+BATCH_SIZE = int(os.environ.get("WASTELINK_NOTIFY_BATCH", "500"))
+MAX_PAGE = 100
+
+TYPES = ("new_request", "task_assigned", "collector_arrived", "pickup_completed", "system_alert")
+# names used by the Jac flows for the same events
+TYPE_ALIASES = {"new_pickup": "task_assigned"}
+
+_COLUMNS = "id, user_id, title, message, type, related_request_id, related_collection_id, is_read, created_at"
+
+
+def _insert(conn, rows):
+    conn.executemany(f"INSERT INTO {NOTIFICATIONS} ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def _now():
+    """CURRENT_TIMESTAMP's format plus milliseconds; ties are broken by id."""
+    t = time.time()
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t)) + f".{int(t * 1000) % 1000:03d}"
+
+
+def _type(kind):
+    kind = TYPE_ALIASES.get(kind, kind)
+    if kind not in TYPES:
+        raise ValueError(f"unknown notification type: {kind}")
+    return kind
+
+
+# -------------------------
+# BUFFERED WRITER
+# -------------------------
+class NotificationWriter:
+    """Queues notifications and inserts them in batches from a background thread."""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL_S, batch_size=BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def send(self, user_id, title, message, kind, related_request_id=None, related_collection_id=None):
+        """Queue one notification and return its id."""
+        nid = uuid.uuid4().hex
+        row = (nid, user_id, title, message, _type(kind), related_request_id, related_collection_id, 0, _now())
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        self._start()
+        if full:
+            self._wake.set()
+        return nid
+
+    def flush(self):
+        """Insert everything queued so far. Returns the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+                if not batch:
+                    return written
+                try:
+                    write(_insert, batch)
+                except Exception:
+                    with self._lock:
+                        self._buffer[:0] = batch
+                    raise
+                written += len(batch)
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _start(self):
+        if self._thread is None:
+            with self._flush_lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="notify-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("Notification flush failed:", e)
+
+    def close(self):
+        """Stop the flusher and write whatever is still queued."""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+
+WRITER = NotificationWriter()
+atexit.register(WRITER.close)
+
+
+def send(user_id, title, message, kind, related_request_id=None, related_collection_id=None):
+    return WRITER.send(user_id, title, message, kind, related_request_id, related_collection_id)
+
+
+# -------------------------
+# BROADCAST
+# -------------------------
+def broadcast(user_ids, title, message, kind, related_request_id=None, conn=None):
+    """Same notification to every user in user_ids, one executemany. Returns the number written."""
+    kind = _type(kind)
+    created = _now()
+    rows = [(uuid.uuid4().hex, uid, title, message, kind, related_request_id, None, 0, created) for uid in user_ids]
+    if conn is not None:
+        _insert(conn, rows)
+    else:
+        write(_insert, rows)
+    return len(rows)
+
+
+def broadcast_to_role(role, title, message, kind, related_request_id=None, available_only=False):
+    """Same notification to every user with `role`, generated inside SQLite. Returns the number written."""
+    where = "role = ?" + (" AND is_available = 1" if available_only else "")
+    return write(lambda conn: conn.execute(f"""
+        INSERT INTO {NOTIFICATIONS} ({_COLUMNS})
+        SELECT lower(hex(randomblob(16))), id, ?, ?, ?, ?, NULL, 0, ? FROM {USERS} WHERE {where}
+    """, (title, message, _type(kind), related_request_id, _now(), role)).rowcount)
+
+
+# -------------------------
+# READS
+# -------------------------
+def _encode_cursor(row):
+    return f"{row['created_at']}|{row['id']}"
+
+
+def _decode_cursor(cursor):
+    created_at, _, nid = cursor.rpartition("|")
+    if not created_at or not nid:
+        raise ValueError("invalid cursor")
+    return created_at, nid
+
+
+def page_query(user_id, is_read, after, limit):
+    """SQL and params for up to `limit` of a user's read or unread notifications older than `after`."""
+    sql = f"SELECT {_COLUMNS} FROM {NOTIFICATIONS} WHERE user_id = ? AND is_read = ?"
+    params = [user_id, is_read]
+    if after:
+        sql += " AND (created_at, id) < (?, ?)"
+        params += after
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    return sql, params + [limit]
+
+
+def _page(conn, user_id, is_read, after, limit):
+    return [dict(r) for r in conn.execute(*page_query(user_id, is_read, after, limit))]
+
+
+def feed(conn, user_id, limit=20, cursor=None, unread_only=False):
+    """
+    Newest-first page of a user's notifications. Pass the returned
+    next_cursor back to get the following page; it is None on the last one.
+    Each page is one or two index range reads (unread, then read), merged.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE))
+    after = list(_decode_cursor(cursor)) if cursor else None
+    # one extra row tells whether another page exists
+    pages = [_page(conn, user_id, 0, after, limit + 1)]
+    if not unread_only:
+        pages.append(_page(conn, user_id, 1, after, limit + 1))
+    rows = list(heapq.merge(*pages, key=lambda r: (r["created_at"], r["id"]), reverse=True))
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {"notifications": rows, "next_cursor": _encode_cursor(rows[-1]) if more else None}
+
+
+UNREAD_COUNT_SQL = f"SELECT unread FROM {NOTIFICATION_COUNTERS} WHERE user_id = ?"
+
+
+def unread_count(conn, user_id):
+    row = conn.execute(UNREAD_COUNT_SQL, (user_id,)).fetchone()
+    return max(0, row[0]) if row else 0
+
+
+def mark_read(conn, user_id, ids=None):
+    """Mark the given notifications (or all of them) read. Returns how many changed."""
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return 0
+    return conn.execute(*mark_read_query(user_id, ids)).rowcount
+
+
+def mark_read_query(user_id, ids=None):
+    """SQL and params marking a user's unread notifications (only `ids`, if given) read."""
+    sql = f"UPDATE {NOTIFICATIONS} SET is_read = 1 WHERE user_id = ? AND is_read = 0"
+    if ids is None:
+        return sql, [user_id]
+    return sql + f" AND id IN ({','.join('?' * len(ids))})", [user_id] + list(ids)
@@ -0,0 +1,298 @@
+# payouts.py
+"""
+Set-based payout batches, written in bounded chunks.
+
+A payout moves every eligible pending earning through two steps:
+
+1. open_batch(): record the batch and one 'processing' payout transaction
+   per eligible collector, then tag those collectors' pending earnings
+   created up to `cutoff` with the batch id and mark them 'processing'.
+2. settle_batch(): mark the batch's earnings 'paid' (and their
+   collections), add each collector's amount and count to
+   users.total_earnings / users.paid_earnings, and complete the
+   transactions.
+
+run_payout() does both steps at once (pay_batch), rewriting each earning
+once instead of twice; the two-step form is for payouts where the money
+moves outside the app between claiming and settling.
+
+Earnings are moved a rowid range of PAYOUT_CHUNK rows at a time, each
+range its own short BEGIN IMMEDIATE transaction, so the group-commit
+writer and other writers get the lock between chunks instead of waiting
+out the whole payout; rowid order keeps each chunk's pages together. The
+batch's transactions, written when the batch is created, fix which
+collectors it pays, so the min_amount check does not drift as earnings
+move.
+
+The batch id defaults to one derived from the cutoff, so running the same
+payout twice returns the existing batch instead of paying again, and
+run_payout() first finishes any batch a crash left in 'processing'. Every
+chunk only touches rows still 'pending' or 'processing', so an
+interrupted step simply runs again: claimed_at is set once every chunk is
+claimed, status 'paid' once every chunk is settled.
+
+Chunks still rewrite rows in several earnings indexes in no useful order,
+so the payout connection runs with a PAYOUT_CACHE_KIB page cache.
+
+users.total_earnings and users.paid_earnings count paid-out earnings;
+users.completed_pickups counts completed pickup requests and is kept by a
+trigger, not by payouts.
+"""
+import os
+from contextlib import contextmanager
+
+from utils import COLLECTIONS, EARNINGS, PICKUP_REQUESTS, TRANSACTIONS, USERS, get_conn
+
+PAYOUT_BATCHES = "payout_batches"
+
+# earnings rowids per transaction
+PAYOUT_CHUNK = int(os.environ.get("WASTELINK_PAYOUT_CHUNK", "10000"))
+PAYOUT_CACHE_KIB = int(os.environ.get("WASTELINK_PAYOUT_CACHE_KIB", "262144"))
+
+# -------------------------
+# TOTALS
+# -------------------------
+def backfill_totals(conn):
+    """Recompute the collector totals: paid earnings, and completed pickup requests."""
+    conn.execute(f"""
+        UPDATE {USERS} SET total_earnings = COALESCE(t.amount, 0), paid_earnings = COALESCE(t.n, 0)
+        FROM (SELECT u.id AS id, SUM(e.amount) AS amount, COUNT(e.id) AS n
+              FROM {USERS} u LEFT JOIN {EARNINGS} e ON e.collector_id = u.id AND e.status = 'paid'
+              WHERE u.role = 'collector' GROUP BY u.id) AS t
+        WHERE {USERS}.id = t.id
+    """)
+    conn.execute(f"""
+        UPDATE {USERS} SET completed_pickups = COALESCE(
+            (SELECT COUNT(*) FROM {PICKUP_REQUESTS} r WHERE r.assigned_collector_id = {USERS}.id AND r.status = 'completed'), 0)
+        WHERE role = 'collector'
+    """)
+
+
+def batch_id_for(cutoff, min_amount=0.0):
+    return f"payout-{cutoff}" + (f"-min{min_amount:g}" if min_amount else "")
+
+
+# -------------------------
+# STEPS
+# -------------------------
+def get_batch(conn, batch_id):
+    row = conn.execute(f"SELECT * FROM {PAYOUT_BATCHES} WHERE id = ?", (batch_id,)).fetchone()
+    return dict(row) if row else None
+
+
+@contextmanager
+def _large_cache(conn):
+    previous = conn.execute("PRAGMA cache_size").fetchone()[0]
+    conn.execute(f"PRAGMA cache_size = -{PAYOUT_CACHE_KIB}")
+    try:
+        yield
+    finally:
+        conn.execute(f"PRAGMA cache_size = {previous}")
+
+
+# earnings a batch still has to claim / to settle; both take (cutoff, batch_id) / (batch_id).
+# Chunks read earnings NOT INDEXED so the rowid range stays the access path.
+_TO_CLAIM = f"""status = 'pending' AND created_at <= ? AND collector_id IN (
+    SELECT user_id FROM {TRANSACTIONS} WHERE reference = ? AND type = 'payout')"""
+_TO_SETTLE = "payout_batch = ? AND status = 'processing'"
+
+BATCH_RANGE_SQL = f"SELECT MIN(rowid), MAX(rowid) FROM {EARNINGS} WHERE payout_batch = ?"
+PENDING_RANGE_SQL = f"SELECT MIN(rowid), MAX(rowid) FROM {EARNINGS} WHERE status = 'pending' AND created_at <= ?"
+CLAIM_SQL = f"""
+    UPDATE {EARNINGS} NOT INDEXED SET status = 'processing', payout_batch = ?
+    WHERE rowid > ? AND rowid <= ? AND {_TO_CLAIM}
+"""
+
+
+def owed_query(batch_id, cutoff, min_amount):
+    """SQL and params inserting a batch's 'processing' transaction for each collector owed at least min_amount."""
+    sql = f"""
+        INSERT INTO {TRANSACTIONS} (id, user_id, amount, type, reference, status)
+        SELECT lower(hex(randomblob(16))), collector_id, ROUND(SUM(amount), 2), 'payout', ?, 'processing'
+        FROM {EARNINGS} WHERE status = 'pending' AND created_at <= ? GROUP BY collector_id"""
+    params = [batch_id, cutoff]
+    if min_amount:
+        sql += " HAVING SUM(amount) >= ?"
+        params.append(min_amount)
+    return sql, params
+
+
+def chunk_query(batch_id, after, upto, cutoff=None):
+    """
+    SQL and params selecting the (after, upto] rowid range's 'processing'
+    earnings of the batch and, with `cutoff`, the ones it has yet to claim.
+    """
+    where, params = _TO_SETTLE, [batch_id]
+    if cutoff is not None:
+        where, params = f"({where}) OR ({_TO_CLAIM})", params + [cutoff, batch_id]
+    sql = f"""
+        SELECT rowid AS rid, collector_id, collection_id, amount FROM {EARNINGS} NOT INDEXED
+        WHERE rowid > ? AND rowid <= ? AND ({where})"""
+    return sql, [after, upto] + params
+
+
+def finish_query(batch_id, paid):
+    """SQL and params setting each payout transaction of the batch to what its earnings add up to."""
+    return f"""
+        UPDATE {TRANSACTIONS} SET amount = COALESCE(
+            (SELECT ROUND(SUM(amount), 2) FROM {EARNINGS} WHERE payout_batch = ? AND collector_id = {TRANSACTIONS}.user_id), 0)
+            {", status = 'completed'" if paid else ""}
+        WHERE reference = ? AND type = 'payout'
+    """, (batch_id, batch_id)
+
+
+def _begin_batch(conn, batch_id, cutoff, min_amount):
+    """
+    Create the batch and its 'processing' transactions, one per collector
+    owed at least min_amount, in one transaction. Returns the existing
+    batch instead if there is one.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    existing = get_batch(conn, batch_id)
+    if existing:
+        conn.commit()
+        return existing
+    conn.execute(f"INSERT INTO {PAYOUT_BATCHES} (id, cutoff, min_amount) VALUES (?, ?, ?)", (batch_id, cutoff, min_amount))
+    conn.execute(*owed_query(batch_id, cutoff, min_amount))
+    conn.commit()
+    return None
+
+
+def _ranges(conn, batch_id, cutoff=None):
+    """(after, upto] rowid ranges of PAYOUT_CHUNK earnings spanning the batch's rows and, with cutoff, those left to claim."""
+    bounds = [conn.execute(BATCH_RANGE_SQL, (batch_id,)).fetchone()]
+    if cutoff is not None:
+        bounds.append(conn.execute(PENDING_RANGE_SQL, (cutoff,)).fetchone())
+    bounds = [b for b in bounds if b[0] is not None]
+    if not bounds:
+        return
+    lo, hi = min(b[0] for b in bounds) - 1, max(b[1] for b in bounds)
+    while lo < hi:
+        yield lo, min(lo + PAYOUT_CHUNK, hi)
+        lo += PAYOUT_CHUNK
+
+
+def _claim(conn, batch_id, cutoff, after, upto):
+    """One chunk of open_batch."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(CLAIM_SQL, (batch_id, after, upto, cutoff, batch_id))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _pay(conn, batch_id, after, upto, cutoff=None):
+    """
+    One chunk of settle_batch, or with `cutoff` of pay_batch: pay the
+    range's 'processing' earnings of the batch (and its unclaimed ones).
+    """
+    sql, params = chunk_query(batch_id, after, upto, cutoff)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp.payout_rows")
+        conn.execute("CREATE TEMP TABLE payout_rows AS" + sql, params)
+        conn.execute(f"""
+            UPDATE {USERS} SET total_earnings = total_earnings + t.amount,
+                               paid_earnings = paid_earnings + t.n,
+                               updated_at = CURRENT_TIMESTAMP
+            FROM (SELECT collector_id, SUM(amount) AS amount, COUNT(*) AS n FROM temp.payout_rows GROUP BY collector_id) AS t
+            WHERE {USERS}.id = t.collector_id
+        """)
+        conn.execute(f"UPDATE {COLLECTIONS} SET payment_status = 'paid' WHERE id IN (SELECT collection_id FROM temp.payout_rows)")
+        conn.execute(f"""
+            UPDATE {EARNINGS} SET status = 'paid', payout_batch = ?, payment_date = CURRENT_TIMESTAMP
+            WHERE rowid IN (SELECT rid FROM temp.payout_rows)
+        """, (batch_id,))
+        conn.execute("DROP TABLE temp.payout_rows")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _finish(conn, batch_id, paid):
+    """Bring the transactions and the batch summary in line with the earnings the batch holds."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(*finish_query(batch_id, paid))
+        conn.execute(f"""
+            UPDATE {PAYOUT_BATCHES} SET claimed_at = COALESCE(claimed_at, CURRENT_TIMESTAMP),
+                {"status = 'paid', paid_at = CURRENT_TIMESTAMP," if paid else ""}
+                (collectors, earnings, amount) = (
+                    SELECT COUNT(DISTINCT collector_id), COUNT(*), COALESCE(ROUND(SUM(amount), 2), 0)
+                    FROM {EARNINGS} WHERE payout_batch = ?)
+            WHERE id = ?
+        """, (batch_id, batch_id))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return get_batch(conn, batch_id)
+
+
+def open_batch(conn, cutoff, min_amount=0.0, batch_id=None):
+    """
+    Claim eligible pending earnings into a batch; returns the batch summary.
+    A collector is eligible when their pending total up to cutoff is at
+    least min_amount. Reopening a claimed batch changes nothing; one a crash
+    interrupted is claimed the rest of the way.
+    """
+    batch_id = batch_id or batch_id_for(cutoff, min_amount)
+    existing = _begin_batch(conn, batch_id, cutoff, min_amount)
+    if existing:
+        if existing["claimed_at"] or existing["status"] == "paid":
+            return existing
+        cutoff = existing["cutoff"]
+    with _large_cache(conn):
+        for after, upto in _ranges(conn, batch_id, cutoff):
+            _claim(conn, batch_id, cutoff, after, upto)
+    return _finish(conn, batch_id, paid=False)
+
+
+def settle_batch(conn, batch_id):
+    """Mark a batch paid and roll it into the collector totals. Settling twice changes nothing."""
+    batch = get_batch(conn, batch_id)
+    if batch is None:
+        raise ValueError(f"unknown payout batch: {batch_id}")
+    if batch["status"] == "paid":
+        return batch
+    if not batch["claimed_at"]:
+        # interrupted before every chunk was claimed: pay the rest in one pass
+        return pay_batch(conn, batch["cutoff"], batch["min_amount"], batch_id)
+    with _large_cache(conn):
+        for after, upto in _ranges(conn, batch_id):
+            _pay(conn, batch_id, after, upto)
+    return _finish(conn, batch_id, paid=True)
+
+
+def pay_batch(conn, cutoff, min_amount=0.0, batch_id=None):
+    """open_batch + settle_batch chunk by chunk, touching each earning once."""
+    batch_id = batch_id or batch_id_for(cutoff, min_amount)
+    existing = _begin_batch(conn, batch_id, cutoff, min_amount)
+    if existing:
+        if existing["status"] == "paid":
+            return existing
+        if existing["claimed_at"]:
+            return settle_batch(conn, batch_id)
+        cutoff = existing["cutoff"]
+    with _large_cache(conn):
+        for after, upto in _ranges(conn, batch_id, cutoff):
+            _pay(conn, batch_id, after, upto, cutoff)
+    return _finish(conn, batch_id, paid=True)
+
+
+def unsettled(conn):
+    return [r[0] for r in conn.execute(f"SELECT id FROM {PAYOUT_BATCHES} WHERE status = 'processing' ORDER BY created_at")]
+
+
+def run_payout(cutoff, min_amount=0.0, batch_id=None):
+    """
+    Finish any interrupted batches, then pay the batch for `cutoff`.
+    Returns {"resumed": [...], "batch": summary}.
+    """
+    with get_conn() as conn:
+        resumed = [settle_batch(conn, b)["id"] for b in unsettled(conn)]
+        batch = pay_batch(conn, cutoff, min_amount, batch_id)
+    return {"resumed": [b for b in resumed if b != batch["id"]], "batch": batch}
@@ -0,0 +1,256 @@
+# positions.py
+"""
+High-rate collector GPS ingest.
+
+Collector apps report their position every few seconds. Writing each ping
+would cost a pool checkout and a commit, so ping() only touches memory:
+
+- an array-backed index of every collector's current position and
+  availability, which api_get_tasks and api_assign_collector read
+  instead of querying `users`;
+- a bounded ring buffer of recent points per collector (track());
+- a pending map that coalesces pings per collector, newest wins.
+
+A flusher thread writes the pending map every FLUSH_INTERVAL_S in one
+transaction: an upsert into `locations` (one row per collector) and an
+UPDATE of users.collector_latitude/longitude. The index reloads from
+`users` every POSITIONS_TTL_S to pick up new collectors and availability
+changes; positions that are still waiting to be flushed survive a reload.
+A collector the index has not seen is looked up by id on first use.
+"""
+import atexit
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import utils
+from utils import LOCATIONS, USERS, get_conn, write
+
+FLUSH_INTERVAL_S = float(os.environ.get("WASTELINK_GPS_FLUSH_MS", "1000")) / 1000.0
+POSITIONS_TTL_S = float(os.environ.get("WASTELINK_POSITIONS_TTL", "30"))
+TRACK_POINTS = int(os.environ.get("WASTELINK_GPS_TRACK_POINTS", "256"))
+
+INITIAL_SLOTS = 1024
+
+# answered from idx_users_available_collectors
+COLLECTORS_SQL = f"SELECT id, collector_latitude, collector_longitude FROM {USERS} WHERE role='collector' AND is_available=1"
+POSITION_SQL = f"SELECT collector_latitude, collector_longitude FROM {USERS} WHERE id=?"
+STORE_LOCATION_SQL = f"""
+    INSERT INTO {LOCATIONS} (user_type, user_id, latitude, longitude, updated_at)
+    VALUES ('collector', ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        latitude = excluded.latitude, longitude = excluded.longitude, updated_at = excluded.updated_at
+    WHERE excluded.updated_at >= {LOCATIONS}.updated_at
+"""
+
+
+def _ts(epoch):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+
+
+def validate(lat, lng):
+    lat, lng = float(lat), float(lng)
+    if not (math.isfinite(lat) and math.isfinite(lng)) or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"invalid position {lat},{lng}")
+    return lat, lng
+
+
+def _store(conn, batch):
+    """Write {collector_id: (lat, lng, ts)} to locations and users."""
+    conn.executemany(STORE_LOCATION_SQL, [(cid, lat, lng, _ts(ts)) for cid, (lat, lng, ts) in batch.items()])
+    conn.executemany(f"""
+        UPDATE {USERS} SET collector_latitude=?, collector_longitude=?, updated_at=? WHERE id=?
+    """, [(lat, lng, _ts(ts), cid) for cid, (lat, lng, ts) in batch.items()])
+
+
+# -------------------------
+# POSITION STORE
+# -------------------------
+class PositionStore:
+    """Current positions, recent tracks and not-yet-written pings for all collectors."""
+
+    def __init__(self, ttl=POSITIONS_TTL_S, flush_interval=FLUSH_INTERVAL_S, track_points=TRACK_POINTS):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.track_points = track_points
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._clear()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _clear(self):
+        self._slots = {}                      # collector id -> row in the arrays
+        self._ids = []
+        self._coords = np.full((INITIAL_SLOTS, 2), np.nan)
+        self._available = np.zeros(INITIAL_SLOTS, dtype=bool)
+        self._tracks = {}
+        self._latest = {}                     # collector id -> epoch of the newest ping
+        self._pending = {}                    # collector id -> (lat, lng, epoch)
+        self._flushing = {}
+        self._db = None
+        self._loaded_at = None
+
+    def _slot(self, collector_id):
+        i = self._slots.get(collector_id)
+        if i is None:
+            i = len(self._ids)
+            if i == len(self._coords):
+                self._coords = np.vstack([self._coords, np.full_like(self._coords, np.nan)])
+                self._available = np.concatenate([self._available, np.zeros_like(self._available)])
+            self._slots[collector_id] = i
+            self._ids.append(collector_id)
+        return i
+
+    # ---- loading ----
+    def _ensure_loaded(self, conn=None):
+        if self._db != utils.DB_NAME:
+            with self._lock:
+                if self._db != utils.DB_NAME:
+                    # a different database (tests, benchmarks): nothing here applies to it
+                    self._clear()
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self.reload(conn)
+
+    def _read_collectors(self, conn):
+        return conn.execute(COLLECTORS_SQL).fetchall()
+
+    def _read_one(self, conn, collector_id):
+        return conn.execute(POSITION_SQL, (collector_id,)).fetchone()
+
+    def reload(self, conn=None):
+        """Re-read the available collectors and their positions from `users`."""
+        if conn is not None:
+            rows = self._read_collectors(conn)
+        else:
+            with get_conn() as c:
+                rows = self._read_collectors(c)
+        with self._lock:
+            self._available[:] = False
+            for cid, lat, lng in rows:
+                i = self._slot(cid)
+                self._available[i] = True
+                if cid not in self._pending and cid not in self._flushing:
+                    self._coords[i] = (np.nan if lat is None else lat, np.nan if lng is None else lng)
+            self._db = utils.DB_NAME
+            self._loaded_at = time.monotonic()
+
+    # ---- ingest ----
+    def ping(self, collector_id, lat, lng, ts=None):
+        """Record a position report. Older reports than the newest one seen only go to the track."""
+        lat, lng = validate(lat, lng)
+        ts = time.time() if ts is None else float(ts)
+        self._ensure_loaded()
+        with self._lock:
+            track = self._tracks.get(collector_id)
+            if track is None:
+                track = self._tracks[collector_id] = deque(maxlen=self.track_points)
+            track.append((ts, lat, lng))
+            if ts >= self._latest.get(collector_id, ts):
+                self._latest[collector_id] = ts
+                self._pending[collector_id] = (lat, lng, ts)
+                self._coords[self._slot(collector_id)] = (lat, lng)
+        self._start()
+
+    def ping_many(self, pings):
+        """pings: iterable of (collector_id, lat, lng[, ts]). All are validated before any is applied."""
+        checked = [(p[0], *validate(p[1], p[2]), *p[3:]) for p in pings]
+        for p in checked:
+            self.ping(*p)
+        return len(checked)
+
+    def flush(self):
+        """Write all pending pings in one write() op. Returns the number of collectors written."""
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+            if not batch:
+                return 0
+            try:
+                write(_store, batch)
+            except Exception:
+                # put the batch back unless newer pings have replaced it
+                with self._lock:
+                    for cid, ping in batch.items():
+                        self._pending.setdefault(cid, ping)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            return len(batch)
+
+    def _start(self):
+        if self._thread is None:
+            with self._flush_lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="gps-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("GPS flush failed:", e)
+
+    def close(self):
+        """Stop the flusher and write whatever is still pending."""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        self.flush()
+
+    # ---- reads ----
+    def position(self, collector_id, conn=None):
+        """(lat, lng) or None. A collector the index has not seen yet is looked up once."""
+        self._ensure_loaded(conn)
+        with self._lock:
+            i = self._slots.get(collector_id)
+            if i is not None:
+                lat, lng = self._coords[i]
+                return None if np.isnan(lat) else (float(lat), float(lng))
+        if conn is not None:
+            row = self._read_one(conn, collector_id)
+        else:
+            with get_conn() as c:
+                row = self._read_one(c, collector_id)
+        if not row or row[0] is None or row[1] is None:
+            return None
+        with self._lock:
+            i = self._slot(collector_id)
+            if np.isnan(self._coords[i, 0]):
+                self._coords[i] = (row[0], row[1])
+            lat, lng = self._coords[i]
+        return float(lat), float(lng)
+
+    def available(self, conn=None):
+        """(ids, coords) of available collectors with a known position; coords is an n x 2 array."""
+        self._ensure_loaded(conn)
+        with self._lock:
+            n = len(self._ids)
+            rows = np.flatnonzero(self._available[:n] & ~np.isnan(self._coords[:n, 0]))
+            return [self._ids[i] for i in rows], self._coords[rows].copy()
+
+    def track(self, collector_id, limit=None):
+        """Most recent points for a collector, newest first, as dicts."""
+        with self._lock:
+            points = list(self._tracks.get(collector_id, ()))
+        points.reverse()
+        if limit:
+            points = points[:limit]
+        return [{"latitude": lat, "longitude": lng, "timestamp": _ts(ts)} for ts, lat, lng in points]
+
+    def stats(self):
+        with self._lock:
+            return {"collectors": len(self._ids), "pending": len(self._pending), "tracked": len(self._tracks)}
+
+
+POSITIONS = PositionStore()
+atexit.register(POSITIONS.close)
@@ -0,0 +1,79 @@
+# pricing.py
+"""
+In-memory copy of the active rows of `waste_pricing`.
+
+api_log_weight needs a price for every collection; the table holds a
+handful of rows that change rarely, so the whole active set is loaded once
+and served from a dict. Writes made through set_price()/deactivate_price()
+invalidate it immediately; the TTL only bounds how long an edit made by
+another process can go unseen.
+"""
+import os
+import threading
+import time
+
+from instrumentation import count_cache
+from utils import WASTE_PRICING, get_conn, write
+
+PRICING_TTL_S = float(os.environ.get("WASTELINK_PRICING_TTL", "60"))
+
+# KES per kg when the waste type is unknown or has no active price
+DEFAULT_PRICE_PER_KG = 5.0
+
+ACTIVE_PRICES_SQL = f"SELECT waste_type, price_per_kg FROM {WASTE_PRICING} WHERE is_active=1"
+
+
+class PricingCache:
+    def __init__(self, ttl=PRICING_TTL_S):
+        self.ttl = ttl
+        self._prices = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, conn):
+        rows = conn.execute(ACTIVE_PRICES_SQL).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def prices(self, conn=None):
+        """{waste_type: price_per_kg} for every active price."""
+        with self._lock:
+            if self._prices is not None and time.monotonic() - self._loaded_at < self.ttl:
+                count_cache("pricing", hits=1)
+                return self._prices
+        count_cache("pricing", misses=1)
+        if conn is not None:
+            prices = self._load(conn)
+        else:
+            with get_conn() as c:
+                prices = self._load(c)
+        with self._lock:
+            self._prices = prices
+            self._loaded_at = time.monotonic()
+        return prices
+
+    def price_per_kg(self, waste_type, conn=None):
+        price = self.prices(conn).get(waste_type) if waste_type else None
+        return DEFAULT_PRICE_PER_KG if price is None else price
+
+    def invalidate(self):
+        with self._lock:
+            self._prices = None
+
+
+PRICING = PricingCache()
+
+
+# -------------------------
+# WRITES
+# -------------------------
+def set_price(waste_type, price_per_kg):
+    write(lambda conn: conn.execute(f"""
+        INSERT INTO {WASTE_PRICING} (waste_type, price_per_kg, is_active) VALUES (?, ?, 1)
+        ON CONFLICT(waste_type) DO UPDATE SET price_per_kg = excluded.price_per_kg, is_active = 1
+    """, (waste_type, price_per_kg)))
+    PRICING.invalidate()
+
+
+def deactivate_price(waste_type):
+    write(lambda conn: conn.execute(f"UPDATE {WASTE_PRICING} SET is_active=0 WHERE waste_type=?", (waste_type,)))
+    PRICING.invalidate()
@@ -0,0 +1,152 @@
+# query_plans.py
+"""
+Query-plan regression check for the api_* hot paths.
+
+Seeds a throwaway database at realistic scale, runs ANALYZE, then asks
+EXPLAIN QUERY PLAN about every query the API issues and fails if any of
+them falls back to a full table scan. A scan of a partial index or of a
+virtual table is fine: it only touches the rows it indexes.
+So is a scan of a table with fewer than SMALL_TABLE_ROWS rows, such as
+system_counters.
+
+    python query_plans.py            # exit status 1 on regressions
+"""
+import os
+import re
+import sys
+import tempfile
+
+import api
+import audit
+import classification_cache
+import export
+import jobs
+import metrics
+import notifications
+import payouts
+import positions
+import pricing
+import route_cache
+import seed_data
+import snapshot
+import utils
+
+# (name, sql, params) for every query the API issues, taken from the modules
+# that run them; the dynamic ones come from the same builder functions.
+HOT_QUERIES = [
+    ("api_auth", api.AUTH_SQL, ("a@x", "h")),
+    ("utils.get_user_by_email", utils.USER_BY_EMAIL_SQL, ("a@x",)),
+    ("positions.read_one", positions.POSITION_SQL, ("c1",)),
+    ("api_assign_pending_batch.requests", api.PENDING_BATCH_SQL, (10,)),
+    ("snapshot.rebuild", snapshot.REBUILD_SQL, ()),
+    ("snapshot.refresh", snapshot.REFRESH_SQL, (0,)),
+    ("api_assign_collector.request", api.REQUEST_LOCATION_SQL, ("x",)),
+    ("positions.reload", positions.COLLECTORS_SQL, ()),
+    ("api_assign_pending_batch.collectors", api.BATCH_COLLECTORS_SQL, ()),
+    ("api_assign_pending_batch.open_jobs", api.OPEN_JOBS_SQL, ()),
+    ("pricing.load", pricing.ACTIVE_PRICES_SQL, ()),
+    ("api_log_weight.complete_request", api.COMPLETE_REQUEST_SQL, ("x",)),
+    ("api_optimize_route_for_collector.collector", api.COLLECTOR_CAPACITY_SQL, ("c1",)),
+    ("positions.flush.location", positions.STORE_LOCATION_SQL, ("c1", -1.3, 36.8, "2025-01-01 00:00:00")),
+    ("notifications.feed", *notifications.page_query("u1", 0, ["2025-01-01", "x"], 21)),
+    ("notifications.feed_first", *notifications.page_query("u1", 1, None, 21)),
+    ("notifications.unread_count", notifications.UNREAD_COUNT_SQL, ("u1",)),
+    ("notifications.mark_read", *notifications.mark_read_query("u1")),
+    ("notifications.mark_read_ids", *notifications.mark_read_query("u1", ["n1", "n2"])),
+    ("export.by_rowid", *export.page_query(export.EXPORTS["earnings"], None, None, None, None, 5000)[:2]),
+    ("export.by_owner",
+     *export.page_query(export.EXPORTS["earnings"], "c1", "2025-01-01", "2025-01-31", "2025-01-02|7", 5000)[:2]),
+    ("export.by_date",
+     *export.page_query(export.EXPORTS["collections"], None, "2025-01-01", "2025-01-31", None, 5000)[:2]),
+    ("payouts.owed", *payouts.owed_query("b", "2025-01-01", 100.0)),
+    ("payouts.pending_range", payouts.PENDING_RANGE_SQL, ("2025-01-01",)),
+    ("payouts.batch_range", payouts.BATCH_RANGE_SQL, ("b",)),
+    ("payouts.claim", payouts.CLAIM_SQL, ("b", 0, 10000, "2025-01-01", "b")),
+    ("payouts.chunk", *payouts.chunk_query("b", 0, 10000, "2025-01-01")),
+    ("payouts.finish", *payouts.finish_query("b", True)),
+    ("jobs.claim", jobs.CLAIM_SQL, (0, "classify_collection", 0, 1)),
+    ("jobs.reclaim", jobs.RECLAIM_SQL, ("classify_collection", 0)),
+    ("jobs.reprice", api.REPRICE_EARNING_SQL, (10.0, 10.0, "k1")),
+    ("audit.query", *audit.query_sql("pickup_request", "x", "2025-01-01", "2025-02-01", 51, "2025-01-15|x")),
+    ("audit.query_entity", *audit.query_sql("payout_batch", start="2025-01-01", limit=51)),
+    ("api_get_stats", metrics.COUNTERS_SQL, metrics.COUNTER_NAMES),
+    ("api_get_stats_range", metrics.DAILY_SQL, ("2025-01-01", "2025-01-31")),
+    ("route_cache.lookup", *route_cache.lookup_query("matrix", ["a", "b"], ["c", "d"], "2020-01-01")),
+    ("classification_cache.by_hash", *classification_cache.lookup_query("content_hash", ["a", "b"])),
+    ("classification_cache.by_phash", *classification_cache.lookup_query("phash", ["a", "b"])),
+]
+
+# Scans that are understood and accepted, with the reason.
+KNOWN_SCANS = {}
+
+# scanning a table this small is cheaper than any index probe
+SMALL_TABLE_ROWS = 100
+
+_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?")
+
+
+# -------------------------
+# SEEDING
+# -------------------------
+def seed_large_db(conn, residents=20000, collectors=2000, requests=100000, seed=1):
+    seed_data.seed(conn, residents=residents, collectors=collectors, requests=requests, seed=seed)
+
+
+# -------------------------
+# CHECK
+# -------------------------
+def _partial_indexes(conn):
+    return {
+        r["name"] for r in conn.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")
+        if " WHERE " in r["sql"].upper()
+    }
+
+
+def _table_of(sql, alias):
+    m = re.search(rf"(\w+)\s+(?:AS\s+)?{alias}\b", sql)
+    return m.group(1) if m and m.group(1).upper() not in ("FROM", "JOIN") else alias
+
+
+def full_scans(conn, queries=HOT_QUERIES):
+    """[(name, plan detail)] for every query that scans a whole table or non-partial index."""
+    partial = _partial_indexes(conn)
+    bad = []
+    for name, sql, params in queries:
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[3]
+            m = _SCAN.match(detail)
+            if not m or "VIRTUAL TABLE" in detail:
+                continue
+            if m.group(2) and m.group(2) in partial:
+                continue
+            table = _table_of(sql, m.group(1))
+            if conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} LIMIT {SMALL_TABLE_ROWS})").fetchone()[0] < SMALL_TABLE_ROWS:
+                continue
+            bad.append((name, detail))
+    return bad
+
+
+def check(residents=20000, collectors=2000, requests=100000):
+    path = os.path.join(tempfile.mkdtemp(prefix="wastelink-plans-"), "plans.db")
+    # the path is passed rather than swapped into utils.DB_NAME, so importing
+    # api's job queues does not start workers against this database
+    try:
+        utils.init_db(path)
+        with utils.get_conn(path) as conn:
+            seed_large_db(conn, residents, collectors, requests)
+            bad = full_scans(conn)
+    finally:
+        utils.close_pools()
+    regressions = [(n, d) for n, d in bad if n not in KNOWN_SCANS]
+    known = [(n, d) for n, d in bad if n in KNOWN_SCANS]
+    return regressions, known
+
+
+if __name__ == "__main__":
+    regressions, known = check()
+    for name, detail in known:
+        print(f"known   {name}: {detail}  ({KNOWN_SCANS[name]})")
+    for name, detail in regressions:
+        print(f"SCAN    {name}: {detail}")
+    print(f"{len(HOT_QUERIES)} queries checked, {len(regressions)} full scans")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,269 @@
+# route_cache.py
+"""
+Two-level cache for Distance Matrix cells and Directions responses.
+
+Keys are origin/destination coordinates snapped to a ~50 m grid, so repeat
+polls from a collector who has barely moved reuse the same entries. Lookups
+go to an in-memory LRU with TTL first, then to the `routes` table, and only
+the cells missing from both are fetched from the network.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from distance_engine import element, parse_latlng
+from utils import ROUTES, get_conn, write
+
+# ~55 m of latitude; longitude cells shrink with cos(lat) which is fine near the equator
+QUANT_STEP_DEG = 0.0005
+MEMORY_SIZE = int(os.environ.get("WASTELINK_ROUTE_CACHE_SIZE", "50000"))
+MEMORY_TTL_S = 15 * 60
+PERSIST_TTL_S = 7 * 24 * 3600
+
+KIND_MATRIX = "matrix"
+KIND_DIRECTIONS = "directions"
+
+
+# -------------------------
+# KEYS
+# -------------------------
+def quantize(point, step=QUANT_STEP_DEG):
+    lat, lng = parse_latlng(point)
+    # + 0.0 folds -0.0 into 0.0 so both sides of the equator/meridian share a key
+    return f"{round(lat / step) * step + 0.0:.4f},{round(lng / step) * step + 0.0:.4f}"
+
+
+def directions_key(destination, waypoints=None, optimize=False):
+    key = quantize(destination)
+    if waypoints:
+        key += "|" + "|".join(quantize(w) for w in waypoints)
+        if optimize:
+            key += "|opt"
+    return key
+
+
+def lookup_query(kind, origins, destinations, cutoff):
+    """SQL and params for the stored routes between `origins` and `destinations` newer than `cutoff`."""
+    sql = f"""
+        SELECT origin, destination, distance_m, duration_s, payload FROM {ROUTES}
+        WHERE kind=? AND origin IN ({",".join("?" * len(origins))}) AND destination IN ({",".join("?" * len(destinations))})
+          AND created_at >= ?
+    """
+    return sql, (kind, *origins, *destinations, cutoff)
+
+
+# -------------------------
+# IN-MEMORY LRU
+# -------------------------
+class TTLCache:
+    """Thread-safe LRU whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=MEMORY_SIZE, ttl=MEMORY_TTL_S):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# -------------------------
+# ROUTE CACHE
+# -------------------------
+class RouteCache:
+
+    def __init__(self, maxsize=MEMORY_SIZE, ttl=MEMORY_TTL_S, persist_ttl=PERSIST_TTL_S):
+        self.memory = TTLCache(maxsize, ttl)
+        self.persist_ttl = persist_ttl
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    def _count(self, name, n=1):
+        if n:
+            with self._lock:
+                self.counters[name] += n
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+        lookups = out["memory_hits"] + out["db_hits"] + out["misses"]
+        out["hit_rate"] = round((out["memory_hits"] + out["db_hits"]) / lookups, 4) if lookups else 0.0
+        out["memory_entries"] = len(self.memory)
+        return out
+
+    def _cutoff(self):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - self.persist_ttl))
+
+    # ---- persistent store ----
+    def _load(self, kind, origins, destinations):
+        if not origins or not destinations:
+            return {}
+        with get_conn() as conn:
+            rows = conn.execute(*lookup_query(kind, origins, destinations, self._cutoff())).fetchall()
+        return {(r["origin"], r["destination"]): r for r in rows}
+
+    def _store(self, kind, rows):
+        if not rows:
+            return
+        write(lambda conn: conn.executemany(f"""
+            INSERT INTO {ROUTES} (kind, origin, destination, distance_m, duration_s, payload)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(kind, origin, destination) DO UPDATE SET
+                distance_m=excluded.distance_m, duration_s=excluded.duration_s,
+                payload=excluded.payload, created_at=CURRENT_TIMESTAMP
+        """, [(kind, *row) for row in rows]))
+
+    # ---- distance matrix ----
+    def distance_matrix(self, origin_list, destination_list, fetch):
+        """
+        Serve a Distance Matrix request from cache where possible and call
+        fetch(origins, destinations) only for the rows/columns that still
+        have missing cells.
+        """
+        plan = self.matrix_lookup(origin_list, destination_list)
+        remote = fetch(*plan["fetch"]) if plan["fetch"] else None
+        return self.matrix_fill(plan, remote)
+
+    def matrix_lookup(self, origin_list, destination_list):
+        """
+        First half of distance_matrix(): resolve what memory and the DB hold.
+        plan["fetch"] is the (origins, destinations) still to request, or None.
+        """
+        o_keys = [quantize(o) for o in origin_list]
+        d_keys = [quantize(d) for d in destination_list]
+        cells = {}
+        missing = set()
+        for ok in set(o_keys):
+            for dk in set(d_keys):
+                value = self.memory.get((KIND_MATRIX, ok, dk))
+                if value is None:
+                    missing.add((ok, dk))
+                else:
+                    cells[(ok, dk)] = value
+        self._count("memory_hits", len(cells))
+
+        if missing:
+            found = self._load(KIND_MATRIX, sorted({o for o, _ in missing}), sorted({d for _, d in missing}))
+            db_hits = 0
+            for key in list(missing):
+                row = found.get(key)
+                if row is not None:
+                    value = (row["distance_m"], row["duration_s"])
+                    cells[key] = value
+                    self.memory.put((KIND_MATRIX, *key), value)
+                    missing.discard(key)
+                    db_hits += 1
+            self._count("db_hits", db_hits)
+
+        plan = {"o_keys": o_keys, "d_keys": d_keys, "cells": cells, "rows": [], "cols": [], "fetch": None,
+                "origins": list(origin_list), "destinations": list(destination_list)}
+        if missing:
+            self._count("misses", len(missing))
+            miss_o = {o for o, _ in missing}
+            miss_d = {d for _, d in missing}
+            rows_i = [i for i, k in enumerate(o_keys) if k in miss_o]
+            cols_j = [j for j, k in enumerate(d_keys) if k in miss_d]
+            # one representative input per key; duplicates share the cell
+            plan["rows"] = list({o_keys[i]: i for i in reversed(rows_i)}.values())
+            plan["cols"] = list({d_keys[j]: j for j in reversed(cols_j)}.values())
+            plan["fetch"] = ([origin_list[i] for i in plan["rows"]], [destination_list[j] for j in plan["cols"]])
+        return plan
+
+    def matrix_fill(self, plan, remote):
+        """Second half: cache the fetched cells and build the full response."""
+        o_keys, d_keys, cells = plan["o_keys"], plan["d_keys"], plan["cells"]
+        status = "OK"
+        if remote is not None:
+            status = remote.get("status", "OK")
+            fresh = []
+            for row, i in zip(remote.get("rows", []), plan["rows"]):
+                for el, j in zip(row.get("elements", []), plan["cols"]):
+                    key = (o_keys[i], d_keys[j])
+                    if el.get("status") != "OK":
+                        continue
+                    value = (el["distance"]["value"], el["duration"]["value"])
+                    if key not in cells:
+                        fresh.append((*key, *value, None))
+                    cells[key] = value
+                    self.memory.put((KIND_MATRIX, *key), value)
+            self._store(KIND_MATRIX, fresh)
+
+        return {
+            "status": status,
+            "origin_addresses": plan["origins"],
+            "destination_addresses": plan["destinations"],
+            "rows": [
+                {"elements": [
+                    element(*cells[(ok, dk)]) if (ok, dk) in cells else {"status": "NOT_FOUND"}
+                    for dk in d_keys
+                ]}
+                for ok in o_keys
+            ],
+        }
+
+    # ---- directions ----
+    def directions(self, origin, destination, waypoints, optimize, fetch):
+        key, value = self.directions_lookup(origin, destination, waypoints, optimize)
+        if value is not None:
+            return value
+        return self.directions_fill(key, fetch(origin, destination, waypoints=waypoints, optimize=optimize))
+
+    def directions_lookup(self, origin, destination, waypoints=None, optimize=False):
+        """(cache key, cached response or None)."""
+        key = (quantize(origin), directions_key(destination, waypoints, optimize))
+        value = self.memory.get((KIND_DIRECTIONS, *key))
+        if value is not None:
+            self._count("memory_hits")
+            return key, value
+
+        row = self._load(KIND_DIRECTIONS, [key[0]], [key[1]]).get(key)
+        if row is not None and row["payload"]:
+            self._count("db_hits")
+            value = json.loads(row["payload"])
+            self.memory.put((KIND_DIRECTIONS, *key), value)
+            return key, value
+
+        self._count("misses")
+        return key, None
+
+    def directions_fill(self, key, value):
+        if value.get("status") == "OK":
+            legs = value["routes"][0].get("legs", []) if value.get("routes") else []
+            meters = sum(leg.get("distance", {}).get("value", 0) for leg in legs)
+            seconds = sum(leg.get("duration", {}).get("value", 0) for leg in legs)
+            self.memory.put((KIND_DIRECTIONS, *key), value)
+            self._store(KIND_DIRECTIONS, [(*key, meters, seconds, json.dumps(value))])
+        return value
+
+
+ROUTE_CACHE = RouteCache()
+
+
+def cache_stats():
+    return ROUTE_CACHE.stats()
@@ -0,0 +1,220 @@
+# route_optimizer.py
+"""
+In-process, capacity-aware pickup route optimizer.
+
+Python counterpart of the `::optimize_tsp_route(start, points, capacity)`
+ability that flows.jac `handle_optimize_route` expects: seed with nearest
+neighbour, improve with 2-opt and Or-opt on a precomputed distance matrix,
+and split the tour into depot round trips whenever the load would exceed
+the vehicle capacity. Improvement stops at the time budget.
+"""
+import time
+
+from distance_engine import AVG_SPEED_KMH, parse_latlng, road_matrix, to_array
+
+TIME_BUDGET_S = 1.0
+DEFAULT_STOP_WEIGHT_KG = 10.0
+SERVICE_MIN_PER_STOP = 3.0
+
+# small collection truck
+FUEL_L_PER_KM = 0.12
+FUEL_PRICE_USD_PER_L = 1.35
+CO2_KG_PER_L = 2.68
+
+_EPS = 1e-9
+
+
+# -------------------------
+# TOUR HELPERS
+# -------------------------
+def _point_latlng(p):
+    if isinstance(p, dict) and "lat" not in p and "latitude" not in p and "location" in p:
+        p = p["location"]
+    return parse_latlng(p)
+
+
+def _path_cost(path, d, closed):
+    cost = sum(d[path[k]][path[k + 1]] for k in range(len(path) - 1))
+    if closed and len(path) > 1:
+        cost += d[path[-1]][path[0]]
+    return cost
+
+
+def _nearest_neighbour(nodes, d, depot=0):
+    path = [depot]
+    left = set(nodes)
+    cur = depot
+    while left:
+        row = d[cur]
+        cur = min(left, key=row.__getitem__)
+        left.remove(cur)
+        path.append(cur)
+    return path
+
+
+def _two_opt(path, d, closed, deadline):
+    """Reverse segments while that shortens the path; path[0] stays fixed."""
+    n = len(path)
+    improved_any = False
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a = path[i - 1]
+            for j in range(i + 1, n):
+                b = path[i]
+                c = path[j]
+                if j + 1 < n:
+                    e = path[j + 1]
+                    delta = d[a][c] + d[b][e] - d[a][b] - d[c][e]
+                elif closed:
+                    e = path[0]
+                    delta = d[a][c] + d[b][e] - d[a][b] - d[c][e]
+                else:
+                    delta = d[a][c] - d[a][b]
+                if delta < -_EPS:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    improved = improved_any = True
+            if time.perf_counter() >= deadline:
+                break
+    return improved_any
+
+
+def _or_opt(path, d, closed, deadline):
+    """Move runs of 1-3 stops (either orientation) to a cheaper position."""
+    improved_any = False
+    for seg_len in (1, 2, 3):
+        i = 1
+        while i + seg_len <= len(path):
+            if time.perf_counter() >= deadline:
+                return improved_any
+            seg = path[i:i + seg_len]
+            prev = path[i - 1]
+            nxt = path[i + seg_len] if i + seg_len < len(path) else (path[0] if closed else None)
+            gain = d[prev][seg[0]]
+            if nxt is not None:
+                gain += d[seg[-1]][nxt] - d[prev][nxt]
+            rest = path[:i] + path[i + seg_len:]
+            best = None
+            for k in range(len(rest)):
+                if k == i - 1:
+                    continue
+                p = rest[k]
+                q = rest[k + 1] if k + 1 < len(rest) else (rest[0] if closed else None)
+                for s in (seg, seg[::-1]):
+                    cost = d[p][s[0]]
+                    if q is not None:
+                        cost += d[s[-1]][q] - d[p][q]
+                    if cost < gain - _EPS and (best is None or cost < best[0]):
+                        best = (cost, k, s)
+            if best is not None:
+                _, k, s = best
+                path[:] = rest[:k + 1] + s + rest[k + 1:]
+                improved_any = True
+            else:
+                i += 1
+    return improved_any
+
+
+def _improve(path, d, closed, deadline):
+    while time.perf_counter() < deadline:
+        changed = _two_opt(path, d, closed, deadline)
+        changed = _or_opt(path, d, closed, deadline) or changed
+        if not changed:
+            break
+    return path
+
+
+def _split_by_capacity(order, weights, capacity):
+    """Cut a giant tour into consecutive trips whose load fits the capacity."""
+    if not capacity or capacity <= 0:
+        return [list(order)]
+    trips, trip, load = [], [], 0.0
+    for node in order:
+        w = weights[node]
+        if trip and load + w > capacity:
+            trips.append(trip)
+            trip, load = [], 0.0
+        trip.append(node)
+        load += w
+    if trip:
+        trips.append(trip)
+    return trips
+
+
+def _trips_cost(trips, d, depot=0):
+    # every trip but the last returns to the depot to unload
+    total = 0.0
+    for t, trip in enumerate(trips):
+        total += _path_cost([depot] + trip, d, closed=t < len(trips) - 1)
+    return total
+
+
+# -------------------------
+# OPTIMIZER
+# -------------------------
+def optimize_tsp_route(start, points, capacity=None, time_budget_s=TIME_BUDGET_S):
+    """
+    Order `points` (dicts with lat/lng or latitude/longitude, optional
+    `weight_kg` and `id`) into depot trips starting from `start`.
+
+    Returns the keys flows.jac reads: sequence, distance (km), duration (min),
+    fuel_cost, co2 (kg), time_saved (min), fuel_saved, efficiency_percent,
+    polyline and directions, plus `trips` and the ordered `stops`.
+    """
+    deadline = time.perf_counter() + time_budget_s
+    if not points:
+        return _result([], [], None, 0.0, 0.0)
+
+    coords = [_point_latlng(p) for p in points]
+    depot = parse_latlng(start) if start is not None else coords[0]
+    meters, _ = road_matrix(to_array([depot] + coords), to_array([depot] + coords))
+    d = meters.tolist()
+
+    weights = [0.0] + [float(p.get("weight_kg") or DEFAULT_STOP_WEIGHT_KG) if isinstance(p, dict) else DEFAULT_STOP_WEIGHT_KG
+                       for p in points]
+    nodes = list(range(1, len(points) + 1))
+
+    # baseline: stops in the order they were given
+    naive_cost = _trips_cost(_split_by_capacity(nodes, weights, capacity), d)
+
+    giant = _nearest_neighbour(nodes, d)
+    _improve(giant, d, closed=False, deadline=deadline)
+    trips = _split_by_capacity(giant[1:], weights, capacity)
+    if len(trips) > 1:
+        for t, trip in enumerate(trips):
+            path = [0] + trip
+            _improve(path, d, closed=t < len(trips) - 1, deadline=deadline)
+            trips[t] = path[1:]
+
+    return _result(points, trips, d, _trips_cost(trips, d), naive_cost)
+
+
+def _result(points, trips, d, cost_m, naive_m):
+    order = [n for trip in trips for n in trip]
+    stops = [points[n - 1] for n in order]
+    km = cost_m / 1000.0
+    naive_km = naive_m / 1000.0
+    travel_min = km / AVG_SPEED_KMH * 60
+    naive_min = naive_km / AVG_SPEED_KMH * 60
+    fuel_cost = km * FUEL_L_PER_KM * FUEL_PRICE_USD_PER_L
+    naive_fuel = naive_km * FUEL_L_PER_KM * FUEL_PRICE_USD_PER_L
+
+    def ref(n):
+        p = points[n - 1]
+        return p.get("id", n - 1) if isinstance(p, dict) else n - 1
+
+    return {
+        "sequence": [ref(n) for n in order],
+        "trips": [[ref(n) for n in trip] for trip in trips],
+        "stops": stops,
+        "distance": round(km, 3),
+        "duration": round(travel_min + SERVICE_MIN_PER_STOP * len(order), 1),
+        "fuel_cost": round(fuel_cost, 2),
+        "co2": round(km * FUEL_L_PER_KM * CO2_KG_PER_L, 2),
+        "time_saved": round(max(naive_min - travel_min, 0.0), 1),
+        "fuel_saved": round(max(naive_fuel - fuel_cost, 0.0), 2),
+        "efficiency_percent": round(100.0 * (naive_m - cost_m) / naive_m, 1) if naive_m > 0 else 0.0,
+        "polyline": "",
+        "directions": [],
+    }
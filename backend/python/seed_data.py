@@ -0,0 +1,206 @@
+# seed_data.py
+"""
+Deterministic synthetic data at city scale.
+
+Residents live in gaussian neighbourhoods around the city centre,
+collectors are spread across the same area, and pickup requests are
+placed over the last `days` days: old ones mostly completed (with a
+collection and an earning each), recent ones pending or in progress.
+The same seed always produces the same database.
+
+    python seed_data.py --out /tmp/city.db                  # 100k residents, 2k collectors, 500k requests
+    python seed_data.py --out /tmp/small.db --residents 5000 --collectors 200 --requests 20000
+"""
+import argparse
+import math
+import os
+import random
+import time
+
+import payouts
+import utils
+
+CITY_CENTER = (-1.2864, 36.8172)   # Nairobi CBD
+CITY_RADIUS_DEG = 0.15
+NEIGHBOURHOODS = 40
+
+WASTE_PRICES = {"plastic": 12.0, "paper": 6.0, "metal": 25.0, "glass": 4.0, "organic": 2.0, "e-waste": 40.0}
+WASTE_MIX = {"plastic": 0.35, "organic": 0.25, "paper": 0.15, "glass": 0.1, "metal": 0.1, "e-waste": 0.05}
+
+CHUNK = 50000
+
+
+def _id(rnd):
+    """Same shape as the schema's lower(hex(randomblob(16))) default."""
+    return f"{rnd.getrandbits(128):032x}"
+
+
+def _ts(epoch):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+
+
+def _chunks(rows, size=CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -------------------------
+# GENERATORS
+# -------------------------
+def _neighbourhoods(rnd, n=NEIGHBOURHOODS):
+    lat0, lng0 = CITY_CENTER
+    out = []
+    for _ in range(n):
+        r = CITY_RADIUS_DEG * math.sqrt(rnd.random())
+        a = rnd.uniform(0, 2 * math.pi)
+        out.append((lat0 + r * math.sin(a), lng0 + r * math.cos(a), rnd.uniform(0.004, 0.02)))
+    return out
+
+
+def _home(rnd, hoods):
+    lat, lng, spread = rnd.choice(hoods)
+    return lat + rnd.gauss(0, spread), lng + rnd.gauss(0, spread)
+
+
+def _status_for_age(rnd, age_days):
+    """Older requests are settled; the last day or two still has open work."""
+    if age_days > 2:
+        return "completed" if rnd.random() < 0.93 else "cancelled"
+    x = rnd.random()
+    if x < 0.45:
+        return "pending"
+    if x < 0.7:
+        return "assigned"
+    if x < 0.8:
+        return "arrived"
+    return "completed" if x < 0.97 else "cancelled"
+
+
+def seed(conn, residents=100000, collectors=2000, requests=500000, days=365, seed=42, now=None):
+    """
+    Fill an initialised, empty database. Returns {"collector_ids": [...],
+    "residents": [(id, lat, lng)], "counts": {...}} for callers that drive load
+    against it. Collector i logs in as collector{i}@wastelink.test / "h{i}".
+    """
+    rnd = random.Random(seed)
+    now = now or time.time()
+    hoods = _neighbourhoods(rnd)
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO waste_pricing (waste_type, price_per_kg) VALUES (?, ?)", list(WASTE_PRICES.items()))
+
+    collector_rows, collector_ids = [], []
+    for i in range(collectors):
+        cid = _id(rnd)
+        collector_ids.append(cid)
+        lat, lng = _home(rnd, hoods)
+        collector_rows.append((
+            cid, f"collector{i}@wastelink.test", f"h{i}", "collector", f"Collector {i}", f"+2547{i:08d}",
+            lat, lng, int(rnd.random() < 0.7), round(rnd.uniform(3.0, 5.0), 2),
+            rnd.choice(("pickup", "tuk-tuk", "handcart")), rnd.choice((100.0, 200.0, 500.0)),
+        ))
+    conn.executemany("""
+        INSERT INTO users (id, email, password_hash, role, full_name, phone, collector_latitude, collector_longitude,
+                           is_available, rating, vehicle_type, capacity_kg)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, collector_rows)
+
+    homes = []
+    for batch in _chunks(range(residents)):
+        rows = []
+        for i in batch:
+            rid = _id(rnd)
+            lat, lng = _home(rnd, hoods)
+            homes.append((rid, lat, lng))
+            rows.append((rid, f"resident{i}@wastelink.test", f"h{collectors + i}", "resident", f"Resident {i}", f"+2541{i:08d}"))
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, role, full_name, phone) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    types = list(WASTE_MIX)
+    mix = list(WASTE_MIX.values())
+    span_s = days * 86400
+    counts = {"requests": 0, "collections": 0, "earnings": 0}
+    for batch in _chunks(range(requests)):
+        reqs, cols, earns = [], [], []
+        for _ in batch:
+            rid, lat, lng = rnd.choice(homes)
+            age_s = span_s * (rnd.random() ** 1.5)   # more recent activity than old
+            requested = now - age_s
+            status = _status_for_age(rnd, age_s / 86400)
+            collector = None if status == "pending" else rnd.choice(collector_ids)
+            assigned_at = _ts(requested + rnd.uniform(60, 1800)) if collector else None
+            completed = requested + rnd.uniform(1800, 6 * 3600) if status == "completed" else None
+            req_id = _id(rnd)
+            reqs.append((req_id, rid, lat + rnd.gauss(0, 0.0003), lng + rnd.gauss(0, 0.0003), f"Plot {rnd.randint(1, 999)}",
+                         status, collector, assigned_at, _ts(requested), _ts(completed) if completed else None))
+            if status == "completed":
+                waste_type = rnd.choices(types, mix)[0]
+                kg = round(rnd.lognormvariate(2.0, 0.6), 2)
+                rate = WASTE_PRICES[waste_type]
+                col_id = _id(rnd)
+                paid = age_s > 14 * 86400
+                cols.append((col_id, req_id, collector, kg, f'{{"waste_type": "{waste_type}"}}', round(rate * kg, 2),
+                             "paid" if paid else "pending", _ts(completed)))
+                earns.append((_id(rnd), collector, col_id, round(rate * kg, 2), rate, kg,
+                              "paid" if paid else "pending", _ts(completed)))
+        conn.executemany("""
+            INSERT INTO pickup_requests (id, resident_id, latitude, longitude, address, status,
+                                         assigned_collector_id, assigned_at, requested_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, reqs)
+        conn.executemany("""
+            INSERT INTO collections (id, request_id, collector_id, total_weight_kg, ai_classification_data,
+                                     earnings_amount, payment_status, collected_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, cols)
+        conn.executemany("""
+            INSERT INTO earnings (id, collector_id, collection_id, amount, rate_per_kg, weight_kg, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, earns)
+        conn.commit()
+        counts["requests"] += len(reqs)
+        counts["collections"] += len(cols)
+        counts["earnings"] += len(earns)
+
+    # bulk inserts bypass the payout engine, so derive the collector totals once
+    payouts.backfill_totals(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    counts.update(residents=residents, collectors=collectors)
+    return {"collector_ids": collector_ids, "residents": homes, "counts": counts}
+
+
+def build(path, **kwargs):
+    """Create a fresh database file at `path` and seed it. Returns seed()'s summary."""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    utils.close_pools()
+    saved, utils.DB_NAME = utils.DB_NAME, path
+    try:
+        utils.init_db()
+        with utils.get_conn() as conn:
+            return seed(conn, **kwargs)
+    finally:
+        utils.close_pools()
+        utils.DB_NAME = saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a synthetic WasteLink database")
+    parser.add_argument("--out", required=True, help="path of the database to create")
+    parser.add_argument("--residents", type=int, default=100000)
+    parser.add_argument("--collectors", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    summary = build(args.out, residents=args.residents, collectors=args.collectors,
+                    requests=args.requests, days=args.days, seed=args.seed)
+    print(f"{args.out}: {summary['counts']} in {time.perf_counter() - start:.1f}s")
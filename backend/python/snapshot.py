@@ -0,0 +1,357 @@
+# snapshot.py
+"""
+In-memory, array-backed snapshot of open pickup requests.
+
+The dispatch reads (api_get_tasks, and through it
+api_optimize_route_for_collector, and api_assign_collector) are answered
+from here instead of querying pickup_requests and building a dict per row;
+dicts are only made for the rows a call returns. Collectors come from
+positions.POSITIONS, which is array-backed the same way.
+
+- One slot per open request (pending, assigned or arrived): latitude,
+  longitude, status code and julianday(requested_at) in NumPy arrays, id
+  and address in parallel lists, and a dict from request id to slot.
+  Slots of completed, cancelled or deleted requests are reused.
+- Two sorted indexes over the slots: by GRID_DEG grid cell for nearest
+  queries and by requested_at for oldest-first. Status changes do not
+  touch them; a slot that is new or has moved since they were built is
+  flagged dirty and checked directly, and once more than 1/8 of the slots
+  are dirty the next read re-sorts.
+- Triggers append the id of every inserted, changed or deleted request to
+  `pickup_changes`. Its AUTOINCREMENT seq is the watermark: refresh() reads
+  only the changes after it and re-reads those requests by primary key.
+  The log keeps the newest CHANGE_LOG_ROWS entries; a snapshot that fell
+  further behind than that rebuilds from pickup_requests.
+- Staleness bound: a read first refreshes if the last refresh is older
+  than MAX_STALE_S, so it reflects every commit made at least MAX_STALE_S
+  before it, from any process. api.py calls mark_stale() after its own
+  dispatch writes, so this process sees them on the next read.
+"""
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+import utils
+from distance_engine import EARTH_RADIUS_M
+from utils import PICKUP_REQUESTS, get_conn
+
+PICKUP_CHANGES = "pickup_changes"
+
+MAX_STALE_S = float(os.environ.get("WASTELINK_SNAPSHOT_MAX_STALE_MS", "500")) / 1000.0
+CHANGE_LOG_ROWS = 100000                      # the trim trigger's window (migration 11)
+
+INITIAL_SLOTS = 1024
+GRID_DEG = 0.01                               # about 1.1 km of latitude per cell
+GRID_COLS = int(round(360 / GRID_DEG)) + 1
+
+STATUS_CODES = {"pending": 0, "assigned": 1, "arrived": 2}
+PENDING = STATUS_CODES["pending"]
+FREE = -1
+
+METERS_PER_DEG_LAT = 111320.0
+
+# expanding ring search bounds
+START_RADIUS_M = 500.0
+MAX_RADIUS_M = 50000.0
+
+# one branch per partial index, so neither reads the closed requests
+REBUILD_SQL = f"""
+    SELECT id, latitude, longitude, address, status, julianday(requested_at)
+    FROM {PICKUP_REQUESTS} WHERE status = 'pending'
+    UNION ALL
+    SELECT id, latitude, longitude, address, status, julianday(requested_at)
+    FROM {PICKUP_REQUESTS} WHERE status IN ('assigned','arrived')
+"""
+
+REFRESH_SQL = f"""
+    SELECT c.seq, c.request_id, p.latitude, p.longitude, p.address, p.status, julianday(p.requested_at)
+    FROM {PICKUP_CHANGES} c LEFT JOIN {PICKUP_REQUESTS} p ON p.id = c.request_id
+    WHERE c.seq > ? ORDER BY c.seq
+"""
+
+
+def bounding_box(lat, lng, radius_m):
+    """(min_lat, max_lat, min_lng, max_lng) of a box containing the circle."""
+    dlat = radius_m / METERS_PER_DEG_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(radius_m / (METERS_PER_DEG_LAT * cos_lat), 180.0)
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def _haversine_m(lat, lng, lats, lngs):
+    """Great-circle distances in meters from one point to arrays of points."""
+    p1 = np.radians(lat)
+    p2 = np.radians(lats)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(np.radians(lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _cell_row(lat):
+    return np.floor((np.asarray(lat) + 90.0) / GRID_DEG).astype(np.int64)
+
+
+def _cell_col(lng):
+    return np.clip(np.floor((np.asarray(lng) + 180.0) / GRID_DEG).astype(np.int64), 0, GRID_COLS - 1)
+
+
+# -------------------------
+# SNAPSHOT
+# -------------------------
+class PickupSnapshot:
+    """Open pickup requests as parallel arrays, kept current from `pickup_changes`."""
+
+    __slots__ = ("max_stale_s", "rebuilds", "refreshes", "reindexes", "_lock", "_refresh_lock",
+                 "_slots", "_ids", "_addresses", "_free", "_size", "_lat", "_lng", "_status", "_requested",
+                 "_dirty", "_dirty_count", "_grid_keys", "_grid_slots", "_by_time",
+                 "_watermark", "_refreshed_at", "_db")
+
+    def __init__(self, max_stale_s=MAX_STALE_S):
+        self.max_stale_s = max_stale_s
+        self.rebuilds = 0
+        self.refreshes = 0
+        self.reindexes = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._clear()
+
+    def _clear(self, capacity=INITIAL_SLOTS):
+        self._slots = {}                      # request id -> row in the arrays
+        self._ids = [None] * capacity
+        self._addresses = [None] * capacity
+        self._free = []
+        self._size = 0                        # rows [0, _size) have been used
+        self._lat = np.full(capacity, np.nan)
+        self._lng = np.full(capacity, np.nan)
+        self._status = np.full(capacity, FREE, dtype=np.int8)
+        self._requested = np.zeros(capacity)  # julianday(requested_at)
+        self._dirty = np.zeros(capacity, dtype=bool)
+        self._dirty_count = 0
+        self._grid_keys = self._grid_slots = self._by_time = np.zeros(0, dtype=np.int64)
+        self._watermark = 0
+        self._refreshed_at = None
+        self._db = None
+
+    def _alloc(self):
+        if self._free:
+            return self._free.pop()
+        i = self._size
+        if i == len(self._lat):
+            n = len(self._lat)
+            self._lat = np.concatenate([self._lat, np.full(n, np.nan)])
+            self._lng = np.concatenate([self._lng, np.full(n, np.nan)])
+            self._status = np.concatenate([self._status, np.full(n, FREE, dtype=np.int8)])
+            self._requested = np.concatenate([self._requested, np.zeros(n)])
+            self._dirty = np.concatenate([self._dirty, np.zeros(n, dtype=bool)])
+            self._ids.extend([None] * n)
+            self._addresses.extend([None] * n)
+        self._size += 1
+        return i
+
+    def _apply(self, request_id, row):
+        """row: (lat, lng, address, status, julianday) of the request, or None if it is gone."""
+        i = self._slots.get(request_id)
+        code = STATUS_CODES.get(row[3]) if row is not None else None
+        if code is None:
+            if i is not None:
+                # the indexes may still list the slot; FREE keeps it out of every result
+                del self._slots[request_id]
+                self._status[i] = FREE
+                self._ids[i] = self._addresses[i] = None
+                self._free.append(i)
+            return
+        requested = row[4] or 0.0
+        if i is None:
+            i = self._slots[request_id] = self._alloc()
+            self._ids[i] = request_id
+            moved = True
+        else:
+            moved = (self._lat[i], self._lng[i], self._requested[i]) != (row[0], row[1], requested)
+        if moved and not self._dirty[i]:
+            self._dirty[i] = True
+            self._dirty_count += 1
+        self._lat[i], self._lng[i], self._addresses[i] = row[0], row[1], row[2]
+        self._status[i] = code
+        self._requested[i] = requested
+
+    def _reindex(self):
+        """Re-sort the grid and time indexes over every live slot and clear the dirty flags."""
+        n = self._size
+        live = np.flatnonzero(self._status[:n] != FREE)
+        keys = _cell_row(self._lat[live]) * GRID_COLS + _cell_col(self._lng[live])
+        order = np.argsort(keys, kind="stable")
+        self._grid_keys = keys[order]
+        self._grid_slots = live[order]
+        # ties (requested_at has whole seconds) go to the earlier slot
+        self._by_time = live[np.lexsort((live, self._requested[live]))]
+        self._dirty[:] = False
+        self._dirty_count = 0
+        self.reindexes += 1
+
+    def _indexed(self):
+        """Dirty slots, after re-sorting first if too many slots have changed."""
+        if self._dirty_count > max(INITIAL_SLOTS, len(self._slots) >> 3):
+            self._reindex()
+        return np.flatnonzero(self._dirty[:self._size]) if self._dirty_count else self._by_time[:0]
+
+    # ---- loading ----
+    def rebuild(self, conn):
+        """Reload every open request from pickup_requests."""
+        with self._refresh_lock:
+            self._rebuild(conn)
+
+    def _rebuild(self, conn):
+        # the watermark is read first: a change committed in between is simply applied twice
+        started = time.monotonic()
+        watermark = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {PICKUP_CHANGES}").fetchone()[0]
+        rows = conn.execute(REBUILD_SQL).fetchall()
+        n = len(rows)
+        with self._lock:
+            self._clear(max(INITIAL_SLOTS, 1 << n.bit_length()))
+            if n:
+                ids, lat, lng, addresses, status, requested = zip(*rows)
+                self._lat[:n] = lat
+                self._lng[:n] = lng
+                self._status[:n] = [STATUS_CODES[s] for s in status]
+                self._requested[:n] = [r or 0.0 for r in requested]
+                self._ids[:n] = ids
+                self._addresses[:n] = addresses
+                self._slots = {rid: i for i, rid in enumerate(ids)}
+                self._size = n
+            self._reindex()
+            self._watermark = watermark
+            self._db = utils.DB_NAME
+            self._refreshed_at = started
+            self.rebuilds += 1
+
+    def refresh(self, conn):
+        """Apply the changes logged since the watermark. Returns how many requests were re-read."""
+        with self._refresh_lock:
+            if self._db != utils.DB_NAME:
+                # first use, or a different database (tests, benchmarks)
+                self._rebuild(conn)
+                return len(self._slots)
+            oldest = conn.execute(f"SELECT MIN(seq) FROM {PICKUP_CHANGES}").fetchone()[0]
+            if oldest is not None and oldest > self._watermark + 1:
+                # the entries after our watermark have been trimmed
+                self._rebuild(conn)
+                return len(self._slots)
+            started = time.monotonic()
+            rows = conn.execute(REFRESH_SQL, (self._watermark,)).fetchall()
+            with self._lock:
+                # rows hold the current state of each request, so later entries win
+                latest = {r[1]: (r[2:] if r[5] is not None else None) for r in rows}
+                for request_id, row in latest.items():
+                    self._apply(request_id, row)
+                if rows:
+                    self._watermark = rows[-1][0]
+                self._refreshed_at = started
+                self.refreshes += 1
+            return len(latest)
+
+    def _ensure_fresh(self, conn=None):
+        at = self._refreshed_at
+        if at is not None and self._db == utils.DB_NAME and time.monotonic() - at < self.max_stale_s:
+            return
+        if conn is not None:
+            self.refresh(conn)
+        else:
+            with get_conn() as c:
+                self.refresh(c)
+
+    def mark_stale(self):
+        """Have the next read refresh first (call after committing a change to pickup_requests)."""
+        self._refreshed_at = None
+
+    # ---- reads ----
+    def _record(self, i):
+        return {"id": self._ids[i], "latitude": float(self._lat[i]), "longitude": float(self._lng[i]),
+                "address": self._addresses[i]}
+
+    def _in_box(self, min_lat, max_lat, min_lng, max_lng, dirty):
+        """Pending slots inside the box: grid cells covering it, plus the dirty slots."""
+        rows = np.arange(_cell_row(min_lat), _cell_row(max_lat) + 1, dtype=np.int64) * GRID_COLS
+        lo = np.searchsorted(self._grid_keys, rows + _cell_col(min_lng), "left")
+        hi = np.searchsorted(self._grid_keys, rows + _cell_col(max_lng), "right")
+        parts = [self._grid_slots[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a]
+        found = np.concatenate(parts) if parts else dirty[:0]
+        found = np.concatenate([found[~self._dirty[found]], dirty])
+        lat, lng = self._lat[found], self._lng[found]
+        keep = (self._status[found] == PENDING) & (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+        return found[keep]
+
+    def nearest_pending(self, lat, lng, k, start_radius_m=START_RADIUS_M, max_radius_m=MAX_RADIUS_M, conn=None):
+        """
+        Up to k pending requests closest to (lat, lng), nearest first, each
+        with its `distance_m`. Expanding ring search: look in the box around
+        a circle of radius r and double r until at least k hits lie inside
+        the circle itself, since only those are guaranteed to beat anything
+        outside the box.
+        """
+        if k <= 0:
+            return []
+        self._ensure_fresh(conn)
+        with self._lock:
+            dirty = self._indexed()
+            radius = start_radius_m
+            while True:
+                found = self._in_box(*bounding_box(lat, lng, radius), dirty)
+                dist = _haversine_m(lat, lng, self._lat[found], self._lng[found])
+                if np.count_nonzero(dist <= radius) >= k or radius >= max_radius_m:
+                    break
+                radius = min(radius * 2, max_radius_m)
+            if len(found) > k:
+                top = np.argpartition(dist, k - 1)[:k]
+                found, dist = found[top], dist[top]
+            out = []
+            for j in np.lexsort((found, dist)).tolist():
+                item = self._record(found[j])
+                item["distance_m"] = float(dist[j])
+                out.append(item)
+            return out
+
+    def oldest_pending(self, k, conn=None):
+        """Up to k pending requests, oldest requested_at first."""
+        if k <= 0:
+            return []
+        self._ensure_fresh(conn)
+        with self._lock:
+            dirty = self._indexed()
+            by_time = self._by_time
+            # the front of the time index may be mostly assigned by now: widen until k pending turn up
+            m = 4 * k
+            while True:
+                head = by_time[:m]
+                head = head[(self._status[head] == PENDING) & ~self._dirty[head]]
+                if len(head) >= k or m >= len(by_time):
+                    break
+                m *= 4
+            found = np.concatenate([head[:k], dirty[self._status[dirty] == PENDING]])
+            found = found[np.lexsort((found, self._requested[found]))][:k]
+            return [self._record(i) for i in found.tolist()]
+
+    def location(self, request_id, conn=None):
+        """(lat, lng) of an open request, or None if the snapshot does not hold it."""
+        self._ensure_fresh(conn)
+        with self._lock:
+            i = self._slots.get(request_id)
+            return None if i is None else (float(self._lat[i]), float(self._lng[i]))
+
+    def stats(self):
+        with self._lock:
+            n = self._size
+            return {
+                "open": len(self._slots),
+                "pending": int(np.count_nonzero(self._status[:n] == PENDING)),
+                "slots": len(self._lat),
+                "dirty": self._dirty_count,
+                "watermark": self._watermark,
+                "rebuilds": self.rebuilds,
+                "refreshes": self.refreshes,
+                "reindexes": self.reindexes,
+            }
+
+
+SNAPSHOT = PickupSnapshot()
@@ -0,0 +1,177 @@
+# text_classifier.py
+"""
+In-process keyword classifier for waste descriptions.
+
+An Aho-Corasick automaton is built once from a vocabulary mapping each
+waste_pricing.waste_type to its keywords and synonyms. One pass over the
+normalized text finds every whole-word match; each type scores the number
+of words its matches cover, and the winner's share of the total becomes
+the confidence.
+
+The vocabulary can be extended with a JSON file of the same shape named by
+WASTELINK_WASTE_VOCAB, e.g. {"plastic": ["jerrycan"], "e-waste": ["charger"]}.
+"""
+import json
+import os
+import re
+from collections import deque
+from functools import lru_cache
+
+FALLBACK_TYPE = "mixed"
+MEMO_SIZE = 10000
+
+DEFAULT_VOCABULARY = {
+    "plastic": [
+        "plastic", "plastics", "pet", "pet bottle", "plastic bottle", "water bottle", "soda bottle",
+        "polythene", "polyethylene", "nylon bag", "carrier bag", "shopping bag", "jerrycan",
+        "container", "straw", "straws", "wrapper", "wrappers", "packaging film", "styrofoam", "polystyrene",
+    ],
+    "organic": [
+        "organic", "food", "food waste", "leftovers", "banana", "banana peel", "peel", "peels",
+        "vegetable", "vegetables", "fruit", "fruits", "garden waste", "grass", "leaves", "compost",
+        "kitchen waste", "eggshells", "coffee grounds", "bones", "rice", "bread",
+    ],
+    "glass": [
+        "glass", "glass bottle", "jar", "jars", "broken glass", "beer bottle", "wine bottle", "window pane",
+    ],
+    "paper": [
+        "paper", "papers", "cardboard", "carton", "cartons", "box", "boxes", "newspaper", "newspapers",
+        "magazine", "magazines", "office paper", "paper bag", "egg tray", "books",
+    ],
+    "metal": [
+        "metal", "metals", "scrap metal", "can", "cans", "tin", "tins", "aluminium", "aluminum",
+        "steel", "iron", "copper", "soda can", "bottle caps", "wire",
+    ],
+    "e-waste": [
+        "e-waste", "ewaste", "electronic", "electronics", "phone", "phones", "laptop", "computer",
+        "battery", "batteries", "charger", "cable", "cables", "bulb", "tv", "television",
+    ],
+    "textile": [
+        "textile", "textiles", "clothes", "clothing", "fabric", "shoes", "rags", "mitumba",
+    ],
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9\-]+")
+
+
+def normalize(text):
+    return " ".join(_NON_WORD.sub(" ", str(text).lower()).split())
+
+
+# -------------------------
+# AHO-CORASICK AUTOMATON
+# -------------------------
+class KeywordAutomaton:
+    """Multi-pattern matcher: goto/fail/output tables over characters."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern, label in patterns:
+            self._add(pattern, label)
+        self._build()
+
+    def _add(self, pattern, label):
+        state = 0
+        for ch in pattern:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = nxt
+        self.out[state].append((len(pattern), label))
+
+    def _build(self):
+        q = deque(self.goto[0].values())
+        while q:
+            state = q.popleft()
+            for ch, nxt in self.goto[state].items():
+                q.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(ch, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def finditer(self, text):
+        """Yield (start, end, label) for every pattern occurrence."""
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, label in out[state]:
+                yield i + 1 - length, i + 1, label
+
+
+# -------------------------
+# CLASSIFIER
+# -------------------------
+class WasteTextClassifier:
+
+    def __init__(self, vocabulary=None, memo_size=MEMO_SIZE):
+        self.vocabulary = vocabulary or load_vocabulary()
+        patterns = []
+        for waste_type, words in self.vocabulary.items():
+            for word in set(words) | {waste_type}:
+                word = normalize(word)
+                if word:
+                    patterns.append((word, waste_type))
+        self.automaton = KeywordAutomaton(patterns)
+        self._classify = lru_cache(maxsize=memo_size)(self._classify_normalized)
+
+    def _classify_normalized(self, text):
+        scores = {}
+        hits = {}
+        n = len(text)
+        for start, end, waste_type in self.automaton.finditer(text):
+            # whole words only: "can" must not match inside "scan"
+            if (start > 0 and text[start - 1] != " ") or (end < n and text[end] != " "):
+                continue
+            words = text.count(" ", start, end) + 1
+            scores[waste_type] = scores.get(waste_type, 0) + words
+            hits[waste_type] = hits.get(waste_type, 0) + 1
+        if not scores:
+            return FALLBACK_TYPE, 0.0, ()
+        best = max(scores, key=lambda t: (scores[t], hits[t]))
+        share = scores[best] / sum(scores.values())
+        # one lone keyword is weaker evidence than several agreeing ones
+        support = min(1.0, 0.5 + 0.25 * hits[best])
+        matched = tuple(sorted(scores.items(), key=lambda kv: -kv[1]))
+        return best, round(share * support, 3), matched
+
+    def classify(self, text):
+        waste_type, confidence, matched = self._classify(normalize(text))
+        return {"result": waste_type, "confidence": confidence, "scores": dict(matched)}
+
+    def classify_batch(self, texts):
+        return [self.classify(t) for t in texts]
+
+    def cache_info(self):
+        return self._classify.cache_info()
+
+
+def load_vocabulary(path=None):
+    vocab = {k: list(v) for k, v in DEFAULT_VOCABULARY.items()}
+    path = path or os.environ.get("WASTELINK_WASTE_VOCAB")
+    if path:
+        with open(path) as f:
+            for waste_type, words in json.load(f).items():
+                vocab.setdefault(waste_type, []).extend(words)
+    return vocab
+
+
+_classifier = None
+
+
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        _classifier = WasteTextClassifier()
+    return _classifier
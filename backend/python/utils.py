@@ -1,9 +1,20 @@
 # utils.py
 import sqlite3
+import asyncio
+import contextvars
 import json
+import queue
+import threading
+import time
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 import os
 
+import instrumentation
+from instrumentation import InstrumentedConnection
+
 # -------------------------
 # DATABASE PATH
 # -------------------------
@@ -28,20 +39,414 @@ ROUTES = "routes"
 FEEDBACK = "feedback"
 PAYMENTS = "payments"
 
+# -------------------------
+# CONNECTION SETTINGS
+# -------------------------
+POOL_SIZE = int(os.environ.get("WASTELINK_DB_POOL_SIZE", "8"))
+# group commit: extra time the writer lingers for more writes once a batch is forming, and
+# the batch cap. Callers block until their commit, so by default it only takes what queued
+# during the previous commit; a window helps when writes arrive from async callers.
+GROUP_COMMIT_WINDOW_S = float(os.environ.get("WASTELINK_GROUP_COMMIT_MS", "0")) / 1000.0
+GROUP_COMMIT_MAX_OPS = int(os.environ.get("WASTELINK_GROUP_COMMIT_MAX", "256"))
+
+# Applied to every new connection. WAL lets readers run alongside the single
+# writer, and synchronous=NORMAL is durable across app crashes in WAL mode.
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),       # KiB, i.e. ~16 MB page cache per connection
+    ("mmap_size", 268435456),     # 256 MB
+    ("busy_timeout", 5000),       # ms
+    ("temp_store", "MEMORY"),
+)
+
+
 # -------------------------
 # CONNECT TO DB
 # -------------------------
-def connect():
-    conn = sqlite3.connect(DB_NAME)
+def connect(db_path=None):
+    """
+    Open a connection with PRAGMAS applied. With metrics on it is an
+    InstrumentedConnection; with them off a plain sqlite3.Connection, so
+    no progress handler or Python cursor sits on the query path.
+    """
+    factory = InstrumentedConnection if instrumentation.ENABLED else sqlite3.Connection
+    conn = sqlite3.connect(db_path or DB_NAME, check_same_thread=False, factory=factory)
     conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name}={value}")
     return conn
 
+
+def _current(conn):
+    """False once metrics were switched on or off after conn was opened."""
+    return isinstance(conn, InstrumentedConnection) == instrumentation.ENABLED
+
+
+class ConnectionPool:
+    """
+    Bounded LIFO pool of reusable connections to a single database file.
+    A connection is only ever used by one borrower at a time.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return connect(self.db_path)
+            if _current(conn):
+                return conn
+            conn.close()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=None):
+    db_path = db_path or DB_NAME
+    pool = _pools.get(db_path)
+    if pool is None:
+        ensure_initialized(db_path)
+        with _pools_lock:
+            pool = _pools.setdefault(db_path, ConnectionPool(db_path))
+    return pool
+
+
+def close_pools():
+    close_writers()
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+@contextmanager
+def get_conn(db_path=None):
+    """
+    Borrow a pooled connection. Commits on success, rolls back on error.
+
+        with get_conn() as conn:
+            conn.execute(...)
+    """
+    pool = get_pool(db_path)
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+
+# -------------------------
+# ASYNC ACCESS
+# -------------------------
+_db_executor = None
+
+
+def get_db_executor():
+    """
+    Threads that run blocking SQLite work for asyncio callers. Sized like the
+    connection pool, so it is also the cap on concurrent DB work.
+    """
+    global _db_executor
+    if _db_executor is None:
+        with _pools_lock:
+            if _db_executor is None:
+                _db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="sqlite")
+    return _db_executor
+
+
+async def run_db(fn, *args):
+    """Await fn(*args) on the DB executor. fn opens its own get_conn()."""
+    ctx = contextvars.copy_context()  # keeps the caller's instrumentation context
+    return await asyncio.get_running_loop().run_in_executor(get_db_executor(), lambda: ctx.run(fn, *args))
+
+# -------------------------
+# GROUP COMMIT
+# -------------------------
+class GroupCommitWriter:
+    """
+    A thread that owns the write connection to one database. Callers submit
+    fn(conn, *args) and get a Future. The thread takes everything that
+    queued up while the previous commit ran (at most max_ops, lingering
+    window_s for stragglers when more than one op is waiting) and runs it in
+    one BEGIN IMMEDIATE ... COMMIT, each op under its own savepoint, so an
+    op that raises rolls back only its own writes and gets its own
+    exception. Futures complete after the commit.
+
+    Ops run inside a shared transaction: they must not commit, and should
+    not do slow work (network, classification) since every other write
+    waits behind them.
+
+    Request-path writes go through it. A few write on their own pooled
+    connection instead, and take SQLite's write lock directly:
+    - payouts: each rowid chunk is its own short BEGIN IMMEDIATE, so the
+      writer's batches interleave between chunks rather than waiting
+      behind a whole payout run (or holding one op open for minutes).
+    - migrations and seed_data: run at startup, before any writes are
+      submitted.
+    """
+
+    def __init__(self, db_path, window_s=GROUP_COMMIT_WINDOW_S, max_ops=GROUP_COMMIT_MAX_OPS):
+        self.db_path = db_path
+        self.window_s = window_s
+        self.max_ops = max_ops
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+        self.commits = 0
+        self.ops = 0
+
+    def submit(self, fn, *args):
+        fut = Future()
+        if threading.current_thread() is self._thread:
+            # an op writing through the writer again: it is already in the transaction
+            try:
+                fut.set_result(fn(self._conn, *args))
+            except BaseException as e:
+                fut.set_exception(e)
+            return fut
+        self._start()
+        self._queue.put((fn, args, fut))
+        return fut
+
+    def _start(self):
+        if self._thread is None:
+            # outside the lock: the init hooks may write through this writer
+            ensure_initialized(self.db_path)
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                    self._thread.start()
+
+    def _connect(self):
+        self._conn = connect(self.db_path)
+        self._conn.isolation_level = None      # transactions are explicit
+
+    def _run(self):
+        self._connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                if not _current(self._conn):
+                    self._conn.close()
+                    self._connect()
+                batch = [first]
+                stop = self._gather(batch, 0)
+                if not stop and len(batch) > 1 and self.window_s > 0:
+                    # other writers are active: give stragglers a moment to join
+                    stop = self._gather(batch, self.window_s)
+                self._commit(batch)
+                if stop:
+                    return
+        finally:
+            self._conn.close()
+
+    def _gather(self, batch, window_s):
+        """Add queued ops to batch, waiting up to window_s for more. Returns True on the stop marker."""
+        deadline = time.monotonic() + window_s
+        while len(batch) < self.max_ops:
+            wait = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    def _commit(self, batch):
+        conn = self._conn
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # a lone op needs no savepoint: if it fails, nothing else is in the transaction
+            savepoints = len(batch) > 1
+            for fn, args, fut in batch:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                if savepoints:
+                    conn.execute("SAVEPOINT op")
+                try:
+                    outcomes.append((fut, fn(conn, *args), None))
+                    if savepoints:
+                        conn.execute("RELEASE op")
+                except Exception as e:
+                    if savepoints:
+                        conn.execute("ROLLBACK TO op")
+                        conn.execute("RELEASE op")
+                    else:
+                        conn.execute("ROLLBACK")
+                        conn.execute("BEGIN IMMEDIATE")
+                    outcomes.append((fut, None, e))
+            conn.execute("COMMIT")
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.commits += 1
+        self.ops += len(outcomes)
+        for fut, value, error in outcomes:
+            if error is None:
+                fut.set_result(value)
+            else:
+                fut.set_exception(error)
+
+    def close(self):
+        """Commit everything already submitted, then stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+
+_writers = {}
+
+
+def get_writer(db_path=None):
+    db_path = db_path or DB_NAME
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.setdefault(db_path, GroupCommitWriter(db_path))
+    return writer
+
+
+def close_writers():
+    with _pools_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_writers)
+
+
+def write(fn, *args):
+    """
+    Run fn(conn, *args) on the group-commit writer and return its result
+    (or raise its exception) once committed.
+
+        rid = write(lambda conn: conn.execute("INSERT ... RETURNING id", row).fetchone()[0])
+    """
+    return get_writer().submit(fn, *args).result()
+
+
+async def write_async(fn, *args):
+    return await asyncio.wrap_future(get_writer().submit(fn, *args))
+
+
 # -------------------------
 # INITIALIZE DATABASE
 # -------------------------
-def init_db():
-    conn = connect()
-    cur = conn.cursor()
+_initialized = set()
+_init_lock = threading.Lock()
+_init_hooks = []
+
+
+def on_initialized(fn):
+    """
+    Call fn(db_path) once for every database this process initializes, right
+    after its schema is current; databases already initialized are passed
+    straight away. Background workers hook their startup in here.
+    """
+    with _init_lock:
+        _init_hooks.append(fn)
+        done = list(_initialized)
+    for db_path in done:
+        fn(db_path)
+
+
+def _run_init_hooks(db_path):
+    for fn in list(_init_hooks):
+        fn(db_path)
+
+
+def _initialize(db_path, force):
+    """Create and migrate the schema unless user_version says it is current. Returns True if DDL ran."""
+    from migrations import SCHEMA_VERSION, migrate, prepare, schema_version
+
+    conn = connect(db_path)
+    try:
+        if not force and schema_version(conn) >= SCHEMA_VERSION:
+            return False
+        prepare(conn)
+        _create_schema(conn.cursor())
+        migrate(conn)
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def ensure_initialized(db_path=None):
+    """
+    Make sure the database has the current schema; cheap after the first
+    call. A database already at the latest migration costs one
+    `PRAGMA user_version` read and no DDL. The first pool opened for a
+    database calls this, so importing a module never touches the database;
+    servers can call it at startup to fail fast. Returns True if DDL ran.
+    """
+    db_path = db_path or DB_NAME
+    if db_path in _initialized:
+        return False
+    with _init_lock:
+        if db_path in _initialized:
+            return False
+        ran = _initialize(db_path, force=False)
+        _initialized.add(db_path)
+    _run_init_hooks(db_path)
+    return ran
+
+
+def init_db(db_path=None):
+    """Run the full schema script and any pending migrations, whatever user_version says."""
+    db_path = db_path or DB_NAME
+    with _init_lock:
+        _initialize(db_path, force=True)
+        first = db_path not in _initialized
+        _initialized.add(db_path)
+    if first:
+        _run_init_hooks(db_path)
+    print("SQLite DB initialized successfully at:", db_path)
+
+
+def _create_schema(cur):
 
     cur.executescript(f"""
     -- USERS
@@ -251,51 +656,35 @@ def init_db():
     );
     """)
 
-    conn.commit()
-    conn.close()
-    print("SQLite DB initialized successfully at:", DB_NAME)
-
 # -------------------------
 # HELPER FUNCTIONS
 # -------------------------
 def insert_user(data):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute(f"""
+    write(lambda conn: conn.execute(f"""
         INSERT INTO {USERS} (email, password_hash, role, full_name, phone)
         VALUES (?, ?, ?, ?, ?)
-    """, (data["email"], data["password_hash"], data["role"], data["full_name"], data.get("phone")))
-    conn.commit()
-    conn.close()
+    """, (data["email"], data["password_hash"], data["role"], data["full_name"], data.get("phone"))))
+
+
+USER_BY_EMAIL_SQL = f"SELECT * FROM {USERS} WHERE email = ?"
 
 
 def get_user_by_email(email):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute(f"SELECT * FROM {USERS} WHERE email = ?", (email,))
-    row = cur.fetchone()
-    conn.close()
+    with get_conn() as conn:
+        row = conn.execute(USER_BY_EMAIL_SQL, (email,)).fetchone()
     return dict(row) if row else None
 
 
 def create_pickup_request(data):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute(f"""
+    write(lambda conn: conn.execute(f"""
         INSERT INTO {PICKUP_REQUESTS} (resident_id, latitude, longitude, address, location_notes)
         VALUES (?, ?, ?, ?, ?)
-    """, (data["resident_id"], data["latitude"], data["longitude"], data["address"], data.get("location_notes")))
-    conn.commit()
-    conn.close()
+    """, (data["resident_id"], data["latitude"], data["longitude"], data["address"], data.get("location_notes"))))
 
 
 def save_classification(request_id, ai_json, categories_json):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute(f"""
+    write(lambda conn: conn.execute(f"""
         INSERT INTO {COLLECTIONS} (request_id, collector_id, ai_classification_data, categories)
         VALUES (?, ?, ?, ?)
     """, (request_id, ai_json.get("collector_id") if isinstance(ai_json, dict) else None,
-          json.dumps(ai_json), json.dumps(categories_json)))
-    conn.commit()
-    conn.close()
+          json.dumps(ai_json), json.dumps(categories_json))))